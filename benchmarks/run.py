@@ -0,0 +1,445 @@
+"""
+Benchmarks offline del servicio, sin tocar portales ni GitHub reales.
+
+Pasa las fixtures de benchmarks/fixtures/ por la extracción de cada scraper
+(con cada backend de parseo instalado), por detectar_cochera, escanear_rasgos
+y generar_html, y corre /crear-ficha de punta a punta contra un servidor
+local que imita a GitHub, a la API de MercadoLibre y a un portal: con un
+slug nuevo en cada vuelta (siempre hay PUT) y republicando el mismo slug
+(sale por "unchanged" sin tocar GitHub).
+Mide además el arranque en frío (import, primera ficha y /ready) en procesos nuevos.
+Cada medición reporta ops/s, latencia (media, p50, p95) y pico de memoria.
+
+    python benchmarks/run.py                        # imprime el JSON
+    python benchmarks/run.py --salida base.json
+    python benchmarks/run.py --comparar base.json   # sale con 1 si algo empeoró más de --tolerancia
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES = Path(__file__).with_name("fixtures")
+RAIZ = Path(__file__).resolve().parent.parent
+
+# Fixture HTML → (URL con la que se extrae, nombre del extractor)
+FIXTURES_HTML = {
+    "remax": ("https://www.remax.com.uy/propiedades/123", "extraer_propiedad_remax"),
+    "century21": ("https://www.century21.com.uy/propiedad/123", "extraer_propiedad_century21"),
+    "generico": ("https://inmo.example/propiedad/123", "extraer_propiedad_generico"),
+    "generico_sin_jsonld": ("https://inmo.example/propiedad/124", "extraer_propiedad_generico"),
+}
+
+TEXTOS_COCHERA = [
+    "apartamento con cochera para 2 autos y parrillero",
+    "casa de 3 dormitorios sin garage, patio al fondo",
+    "local comercial con 2 cocheras y depósito",
+    "oficina luminosa en ciudad vieja, a estrenar",
+]
+
+
+# ========= SERVIDOR FALSO (GITHUB + MERCADOLIBRE + PORTAL) =========
+
+class ServidorFalso(BaseHTTPRequestHandler):
+    """
+    /github/...  → Contents API, trees y Git Data API de GitHub (guarda los SHA en memoria;
+                   como GitHub, rechaza con 422 mover la rama si no es fast-forward)
+    /ml/...      → /items?ids= y /items/{id}/description de MercadoLibre
+    /portal/{n}  → benchmarks/fixtures/{n}.html
+    """
+
+    lock = threading.Lock()
+
+    @classmethod
+    def reiniciar(cls):
+        """Repo vacío: un commit inicial con el tree vacío."""
+        with cls.lock:
+            cls.archivos = {}  # ruta de la Contents API → blob
+            cls.arboles = {cls._sha_arbol({}): {}}  # tree → {ruta: blob}
+            cls.commits = {"0" * 40: (cls._sha_arbol({}), [])}  # commit → (tree, padres)
+            cls.head = "0" * 40
+            cls.actualizaciones_rama = 0
+
+    @staticmethod
+    def _sha_blob(contenido: bytes) -> str:
+        return hashlib.sha1(b"blob %d\0" % len(contenido) + contenido).hexdigest()
+
+    @staticmethod
+    def _sha_arbol(arbol: dict[str, str]) -> str:
+        return hashlib.sha1(json.dumps(sorted(arbol.items())).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def _nuevo_commit(cls, arbol: dict[str, str], padres: list[str]) -> str:
+        tree = cls._sha_arbol(arbol)
+        cls.arboles[tree] = arbol
+        sha = hashlib.sha1(f"{tree}{padres}".encode("utf-8")).hexdigest()
+        cls.commits[sha] = (tree, padres)
+        return sha
+
+    @classmethod
+    def commit_ajeno(cls, ruta: str, contenido: bytes):
+        """Otro proceso mueve la rama (para probar commits que pierden la carrera)."""
+        with cls.lock:
+            arbol = {**cls.arboles[cls.commits[cls.head][0]], ruta: cls._sha_blob(contenido)}
+            cls.head = cls._nuevo_commit(arbol, [cls.head])
+
+    @classmethod
+    def arbol_actual(cls) -> dict[str, str]:
+        with cls.lock:
+            return dict(cls.arboles[cls.commits[cls.head][0]])
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status: int, cuerpo):
+        datos = json.dumps(cuerpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/portal/"):
+            html = (FIXTURES / f"{url.path.rsplit('/', 1)[-1]}.html").read_bytes()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(html)))
+            self.end_headers()
+            self.wfile.write(html)
+        elif url.path.startswith("/ml/items/") and url.path.endswith("/description"):
+            self._json(200, json.loads((FIXTURES / "mercadolibre_descripcion.json").read_text(encoding="utf-8")))
+        elif url.path == "/ml/items":
+            item = json.loads((FIXTURES / "mercadolibre_item.json").read_text(encoding="utf-8"))
+            ids = parse_qs(url.query)["ids"][0].split(",")
+            self._json(200, [{"code": 200, "body": {**item, "id": item_id}} for item_id in ids])
+        elif "/git/trees/" in url.path:
+            self._json(404, {"message": "Not Found"})
+        elif "/git/ref/heads/" in url.path:
+            with self.lock:
+                self._json(200, {"object": {"sha": self.head}})
+        elif "/git/commits/" in url.path:
+            with self.lock:
+                commit = self.commits.get(url.path.rsplit("/", 1)[-1])
+            if commit:
+                self._json(200, {"tree": {"sha": commit[0]}})
+            else:
+                self._json(404, {"message": "Not Found"})
+        elif "/contents/" in url.path:
+            with self.lock:
+                sha = self.archivos.get(url.path)
+            if sha:
+                self._json(200, {"sha": sha})
+            else:
+                self._json(404, {"message": "Not Found"})
+        else:
+            self._json(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        cuerpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            if url.path.endswith("/git/blobs"):
+                self._json(201, {"sha": self._sha_blob(base64.b64decode(cuerpo["content"]))})
+            elif url.path.endswith("/git/trees"):
+                arbol = dict(self.arboles[cuerpo["base_tree"]])
+                for entrada in cuerpo["tree"]:
+                    arbol[entrada["path"]] = entrada.get("sha") or self._sha_blob(entrada["content"].encode("utf-8"))
+                sha = self._sha_arbol(arbol)
+                self.arboles[sha] = arbol
+                self._json(201, {"sha": sha})
+            elif url.path.endswith("/git/commits"):
+                arbol = self.arboles[cuerpo["tree"]]
+                self._json(201, {"sha": self._nuevo_commit(arbol, cuerpo["parents"])})
+            else:
+                self._json(404, {"message": "Not Found"})
+
+    def do_PATCH(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        cls = type(self)
+        with self.lock:
+            _, padres = cls.commits[cuerpo["sha"]]
+            if cls.head not in padres and not cuerpo.get("force"):
+                self._json(422, {"message": "Update is not a fast forward"})
+                return
+            cls.head = cuerpo["sha"]
+            cls.actualizaciones_rama += 1
+        self._json(200, {"object": {"sha": cuerpo["sha"]}})
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        cuerpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        sha = self._sha_blob(base64.b64decode(cuerpo["content"]))  # SHA de blob, como GitHub
+        with self.lock:
+            self.archivos[url.path] = sha
+        self._json(201, {"content": {"sha": sha}})
+
+
+def levantar_servidor() -> tuple[ThreadingHTTPServer, str]:
+    ServidorFalso.reiniciar()
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ServidorFalso)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+def importar_servicio(base: str):
+    """Importa main.py apuntado al servidor falso, sin caches persistentes ni vigentes."""
+    os.environ.update({
+        "GITHUB_TOKEN": "benchmark",
+        "GITHUB_API_URL": f"{base}/github",
+        "MERCADOLIBRE_API_URL": f"{base}/ml",
+        "SCRAPE_CACHE_PATH": "",
+        "SCRAPE_CACHE_TTL": "0",
+        "MANIFIESTO_PATH": "",
+        "JOBS_DB_PATH": "",
+        "IMAGENES_MODO": "off",
+        "LOTE_INTERVALO_POR_HOST": "0",
+        "ARRANQUE_HOSTS": "",
+        # El GitHub falso no tiene límites: sin esto las mediciones largas miden las esperas del token bucket
+        "GITHUB_RAFAGA_ESCRITURAS": "1000000",
+    })
+    sys.path.insert(0, str(RAIZ))
+    import main
+    return main
+
+
+# ========= MEDICIÓN =========
+
+def medir_funcion(nombre: str, fn, iteraciones: int, calentamiento: int = 3, **info) -> dict:
+    for _ in range(calentamiento):
+        fn()
+    duraciones = []
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        fn()
+        duraciones.append(time.perf_counter() - inicio)
+
+    # La memoria se mide aparte: tracemalloc distorsiona los tiempos
+    tracemalloc.start()
+    fn()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return resumir(nombre, duraciones, memoria_pico_kib=round(pico / 1024, 1), **info)
+
+
+def resumir(nombre: str, duraciones: list[float], **info) -> dict:
+    duraciones = sorted(duraciones)
+    media = statistics.fmean(duraciones)
+    return {
+        "nombre": nombre,
+        **{k: v for k, v in info.items() if k != "memoria_pico_kib"},
+        "iteraciones": len(duraciones),
+        "ops_por_segundo": round(1 / media, 2) if media else None,
+        "media_ms": round(media * 1000, 3),
+        "p50_ms": round(duraciones[len(duraciones) // 2] * 1000, 3),
+        "p95_ms": round(duraciones[min(len(duraciones) - 1, int(len(duraciones) * 0.95))] * 1000, 3),
+        "memoria_pico_kib": info.get("memoria_pico_kib", 0),
+    }
+
+
+def benchmarks_extraccion(main, iteraciones: int) -> list[dict]:
+    resultados = []
+    parser_original = main.PARSER_HTML
+    try:
+        for parser, (_, disponible, _) in main.PARSERS_HTML.items():
+            if not disponible:
+                continue
+            main.PARSER_HTML = parser
+            for fixture, (url, extractor) in FIXTURES_HTML.items():
+                html = (FIXTURES / f"{fixture}.html").read_text(encoding="utf-8")
+                fn = getattr(main, extractor)
+                resultados.append(medir_funcion(
+                    f"extraccion/{fixture}/{parser}", lambda: fn(html, url), iteraciones,
+                    etapa="extraccion", bytes_html=len(html.encode("utf-8")),
+                ))
+    finally:
+        main.PARSER_HTML = parser_original
+
+    item = json.loads((FIXTURES / "mercadolibre_item.json").read_text(encoding="utf-8"))
+    resultados.append(medir_funcion(
+        "extraccion/mercadolibre", lambda: main.extraer_propiedad_mercadolibre(item), iteraciones * 10,
+        etapa="extraccion",
+    ))
+    return resultados
+
+
+def benchmarks_reglas(main, iteraciones: int) -> list[dict]:
+    textos = [t.lower() for t in TEXTOS_COCHERA]
+    html = (FIXTURES / "remax.html").read_text(encoding="utf-8")
+    texto_pagina = main.crear_soup(html, FIXTURES_HTML["remax"][0]).get_text(" ", strip=True).lower()
+    return [
+        medir_funcion(
+            "reglas/detectar_cochera", lambda: [main.detectar_cochera(t) for t in textos], iteraciones * 10,
+            etapa="reglas", textos=len(textos),
+        ),
+        medir_funcion(
+            "reglas/escanear_rasgos_pagina", lambda: main.escanear_rasgos(texto_pagina), iteraciones,
+            etapa="reglas", caracteres=len(texto_pagina),
+        ),
+    ]
+
+
+def benchmarks_render(main, iteraciones: int) -> list[dict]:
+    url, extractor = FIXTURES_HTML["remax"]
+    datos = getattr(main, extractor)((FIXTURES / "remax.html").read_text(encoding="utf-8"), url)
+    lote = [main.replace(datos, TITULO=f"{datos.TITULO} {i}") for i in range(50)]
+    return [
+        medir_funcion("render/generar_html", lambda: main.generar_html(datos), iteraciones * 10, etapa="render"),
+        medir_funcion(
+            "render/generar_html_lote_50", lambda: main.generar_html_lote(lote), iteraciones,
+            etapa="render", fichas=len(lote),
+        ),
+    ]
+
+
+def benchmark_crear_ficha(main, base: str, iteraciones: int) -> list[dict]:
+    from fastapi.testclient import TestClient
+
+    casos = {
+        "generico": f"{base}/portal/generico",
+        "mercadolibre": "https://articulo.mercadolibre.com.uy/MLU-654021285-apartamento",
+    }
+    resultados = []
+    with TestClient(main.app) as cliente:
+        for (caso, url), sin_cambios in ((c, s) for c in casos.items() for s in (False, True)):
+            contador = iter(range(10 ** 9))
+            publicadas: set[str] = set()
+            tiempos_etapas: dict[str, list[float]] = {}
+
+            def crear():
+                # Slug nuevo en cada vuelta: siempre hay PUT. Con el mismo slug, desde
+                # el calentamiento en adelante la ficha ya está publicada: "unchanged"
+                slug = f"bench-{caso}-fijo" if sin_cambios else f"bench-{caso}-{next(contador)}"
+                resp = cliente.post("/crear-ficha?tiempos=true", json={"url": url, "slug": slug})
+                resp.raise_for_status()
+                if slug in publicadas and not resp.json()["unchanged"]:
+                    raise RuntimeError(f"{slug} se volvió a subir sin cambios")
+                publicadas.add(slug)
+                for etapa, segundos in resp.json()["tiempos"].items():
+                    tiempos_etapas.setdefault(etapa, []).append(segundos)
+
+            nombre = f"crear_ficha/{caso}/sin_cambios" if sin_cambios else f"crear_ficha/{caso}"
+            resultado = medir_funcion(nombre, crear, iteraciones, etapa="end_to_end")
+            resultado["etapas_media_ms"] = {
+                etapa: round(statistics.fmean(valores) * 1000, 3) for etapa, valores in sorted(tiempos_etapas.items())
+            }
+            resultados.append(resultado)
+    return resultados
+
+
+def medir_arranque_hijo(base: str):
+    """Corre en un intérprete nuevo: import de main, primera ficha y /ready, desde cero."""
+    inicio = time.perf_counter()
+    main = importar_servicio(base)
+    importado = time.perf_counter()
+    from fastapi.testclient import TestClient
+
+    with TestClient(main.app) as cliente:
+        resp = cliente.post("/crear-ficha", json={"url": f"{base}/portal/generico", "slug": f"arranque-{os.getpid()}"})
+        resp.raise_for_status()
+        primera = time.perf_counter()
+        while cliente.get("/ready").status_code != 200:
+            time.sleep(0.005)
+        listo = time.perf_counter()
+    print(json.dumps({"import": importado - inicio, "primera_ficha": primera - inicio, "ready": listo - inicio}))
+
+
+def benchmark_arranque(base: str, iteraciones: int) -> list[dict]:
+    """Arranque en frío: cada medición es un proceso nuevo (no hay módulos ya importados)."""
+    medidas: dict[str, list[float]] = {}
+    for _ in range(max(3, min(iteraciones, 10))):
+        hijo = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--arranque-hijo", base],
+            capture_output=True, text=True, check=True,
+        )
+        for clave, segundos in json.loads(hijo.stdout.strip().splitlines()[-1]).items():
+            medidas.setdefault(clave, []).append(segundos)
+    return [resumir(f"arranque/{clave}", valores, etapa="arranque") for clave, valores in medidas.items()]
+
+
+def comparar(actual: dict, base: dict, tolerancia: float) -> list[dict]:
+    anteriores = {r["nombre"]: r for r in base["resultados"]}
+    regresiones = []
+    for resultado in actual["resultados"]:
+        anterior = anteriores.get(resultado["nombre"])
+        if anterior is None:
+            continue
+        for metrica in ("media_ms", "memoria_pico_kib"):
+            if anterior[metrica] and resultado[metrica] > anterior[metrica] * (1 + tolerancia):
+                regresiones.append({
+                    "nombre": resultado["nombre"],
+                    "metrica": metrica,
+                    "antes": anterior[metrica],
+                    "ahora": resultado[metrica],
+                })
+    return regresiones
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmarks offline de urbanrise-service")
+    parser.add_argument("--iteraciones", type=int, default=30)
+    parser.add_argument(
+        "--solo", choices=["arranque", "extraccion", "reglas", "render", "crear_ficha"], action="append"
+    )
+    parser.add_argument("--salida", type=Path, help="Archivo donde guardar el JSON de resultados")
+    parser.add_argument("--comparar", type=Path, help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento tolerado (0.2 = 20%%)")
+    parser.add_argument("--arranque-hijo", metavar="BASE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.arranque_hijo:
+        medir_arranque_hijo(args.arranque_hijo)
+        return
+
+    servidor, base = levantar_servidor()
+    try:
+        # El arranque se mide en procesos hijos, cada uno importa main desde cero
+        resultados = []
+        if not args.solo or "arranque" in args.solo:
+            resultados.extend(benchmark_arranque(base, args.iteraciones))
+        main = importar_servicio(base)
+        grupos = {
+            "extraccion": lambda: benchmarks_extraccion(main, args.iteraciones),
+            "reglas": lambda: benchmarks_reglas(main, args.iteraciones),
+            "render": lambda: benchmarks_render(main, args.iteraciones),
+            "crear_ficha": lambda: benchmark_crear_ficha(main, base, args.iteraciones),
+        }
+        for nombre, correr in grupos.items():
+            if not args.solo or nombre in args.solo:
+                resultados.extend(correr())
+    finally:
+        servidor.shutdown()
+
+    salida = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parseo_modo": main.PARSEO_MODO,
+        "resultados": resultados,
+    }
+    if args.comparar:
+        salida["regresiones"] = comparar(salida, json.loads(args.comparar.read_text()), args.tolerancia)
+
+    texto = json.dumps(salida, ensure_ascii=False, indent=2)
+    if args.salida:
+        args.salida.write_text(texto + "\n", encoding="utf-8")
+    print(texto)
+    if salida.get("regresiones"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,15 +1,66 @@
 import os
+import asyncio
 import base64
+import codecs
+import contextvars
+import hashlib
+import io
+import html as html_lib
+import importlib
+import importlib.util
 import json
+import logging
+import multiprocessing
+import random
 import re
+import sqlite3
+import string
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures import wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field, fields, replace
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from urllib.parse import urljoin, urlparse
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
 
+import httpx
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-import slugify
+
+# bs4, lxml, selectolax, Pillow y slugify no se importan al cargar el módulo: se
+# cargan en el primer uso o en el precalentamiento de arranque (ver ARRANQUE)
+_MODULOS_DIFERIDOS: dict[str, object] = {}
+
+
+def importar_diferido(nombre: str):
+    """Importa `nombre` la primera vez que se pide y lo memoriza; None si no está instalado."""
+    if nombre not in _MODULOS_DIFERIDOS:
+        try:
+            _MODULOS_DIFERIDOS[nombre] = importlib.import_module(nombre)
+        except ImportError:
+            _MODULOS_DIFERIDOS[nombre] = None
+    return _MODULOS_DIFERIDOS[nombre]
+
+
+def modulo_instalado(nombre: str) -> bool:
+    """Si `nombre` se puede importar, sin importarlo (salvo sus paquetes padre)."""
+    try:
+        return importlib.util.find_spec(nombre) is not None
+    except ImportError:
+        return False
 
 
 # ========= CONFIGURACIÓN =========
@@ -20,7 +71,14 @@ if not GITHUB_TOKEN:
 
 GITHUB_USER = "gros2-hash"
 REPO_NAME = "urbanrise-fichas"
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_BRANCH = os.getenv("GITHUB_BRANCH", "main")
+GITHUB_TIMEOUT = 30
+FICHA_TEMPLATE_PATH = Path(os.getenv("FICHA_TEMPLATE_PATH", Path(__file__).with_name("ficha_template.html")))
 LOGO_URL = "https://static.tokkobroker.com/tfw_images/14240_URBANRISE/logo_urban_naranja.jpg"
+# Con FICHAS_OPTIMIZAR=1 la plantilla se minifica al cargarla y su <style> pasa a una hoja
+# compartida versionada por contenido (fichas/estilos-<hash>.css), publicada una sola vez
+FICHAS_OPTIMIZAR = os.getenv("FICHAS_OPTIMIZAR", "1") == "1"
 
 HEADERS = {
     "User-Agent": (
@@ -30,7 +88,138 @@ HEADERS = {
     )
 }
 
-app = FastAPI(title="UrbanRise Fichas Service")
+# Cliente HTTP compartido: pool por host, timeouts y reintentos
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))  # conexiones keep-alive por host
+HTTP_TIMEOUT_CONEXION = float(os.getenv("HTTP_TIMEOUT_CONEXION", "5"))
+HTTP_TIMEOUT_LECTURA = float(os.getenv("HTTP_TIMEOUT_LECTURA", "20"))
+HTTP_REINTENTOS = int(os.getenv("HTTP_REINTENTOS", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))  # segundos
+HTTP_ESPERA_MAX = float(os.getenv("HTTP_ESPERA_MAX", "30"))  # tope para backoff y Retry-After
+
+# Descarga de páginas: se lee en streaming hasta DESCARGA_MAX_BYTES, se descartan los
+# <script>/<style> (menos los de datos JSON) y, si el portal tiene marcadores en
+# DESCARGA_MARCADORES (ej: {"www.remax.com.uy": ["</main>"]}), se corta al verlos todos
+DESCARGA_MAX_BYTES = int(os.getenv("DESCARGA_MAX_BYTES", str(4 * 1024 * 1024)))
+DESCARGA_CHUNK = int(os.getenv("DESCARGA_CHUNK", "65536"))
+DESCARGA_QUITAR_SCRIPTS = os.getenv("DESCARGA_QUITAR_SCRIPTS", "1") == "1"
+DESCARGA_MARCADORES = json.loads(os.getenv("DESCARGA_MARCADORES", "{}"))
+
+# Backend de parseo HTML: "html.parser" (BeautifulSoup puro), "lxml" o "selectolax".
+# PARSER_HTML_POR_PORTAL permite elegirlo por host, ej: {"www.remax.com.uy": "selectolax"}
+PARSER_HTML = os.getenv("PARSER_HTML", "html.parser")
+PARSER_HTML_POR_PORTAL = json.loads(os.getenv("PARSER_HTML_POR_PORTAL", "{}"))
+
+# Parseo/extracción (CPU-bound): "threads" o "procesos" (escala con los cores)
+PARSEO_MODO = os.getenv("PARSEO_MODO", "threads")
+PARSEO_WORKERS = int(os.getenv("PARSEO_WORKERS", str(os.cpu_count() or 2)))
+
+# MercadoLibre: API (reemplazable por un stub local) y agrupado de ítems en /items?ids=
+MERCADOLIBRE_API_URL = os.getenv("MERCADOLIBRE_API_URL", "https://api.mercadolibre.com").rstrip("/")
+MERCADOLIBRE_MAX_IDS = int(os.getenv("MERCADOLIBRE_MAX_IDS", "20"))  # tope del multiget
+MERCADOLIBRE_VENTANA = float(os.getenv("MERCADOLIBRE_VENTANA", "0.05"))  # segundos juntando ids
+MERCADOLIBRE_WORKERS = int(os.getenv("MERCADOLIBRE_WORKERS", "8"))
+
+# Lotes (/crear-fichas): concurrencia por etapa
+LOTE_MAX_ITEMS = int(os.getenv("LOTE_MAX_ITEMS", "500"))
+LOTE_WORKERS_SCRAPE = int(os.getenv("LOTE_WORKERS_SCRAPE", "16"))
+LOTE_WORKERS_PUBLICACION = int(os.getenv("LOTE_WORKERS_PUBLICACION", "4"))
+
+# Descargas contra cada portal (lotes, /crear-ficha y /refresh): concurrencia que se adapta
+# entre 1 y LOTE_MAX_POR_HOST según latencia y errores, espaciado mínimo entre arranques y
+# circuit breaker (tras PORTAL_FALLOS_CIRCUITO errores seguidos se corta PORTAL_ENFRIAMIENTO s).
+# Por host se pisan en LIMITES_PORTALES (junto a PORTAL_SCRAPERS) o en LIMITES_POR_PORTAL,
+# ej: {"www.remax.com.uy": {"max_concurrentes": 1, "latencia_objetivo": 3}}
+LOTE_MAX_POR_HOST = int(os.getenv("LOTE_MAX_POR_HOST", "2"))
+LOTE_INTERVALO_POR_HOST = float(os.getenv("LOTE_INTERVALO_POR_HOST", "0.5"))  # segundos
+PORTAL_LATENCIA_OBJETIVO = float(os.getenv("PORTAL_LATENCIA_OBJETIVO", "5"))  # más lento: se baja el límite
+PORTAL_FALLOS_CIRCUITO = int(os.getenv("PORTAL_FALLOS_CIRCUITO", "5"))
+PORTAL_ENFRIAMIENTO = float(os.getenv("PORTAL_ENFRIAMIENTO", "30"))  # segundos
+LIMITES_POR_PORTAL = json.loads(os.getenv("LIMITES_POR_PORTAL", "{}"))
+
+# Publicación: "contents" (un commit por ficha) o "commit" (varias fichas por commit)
+PUBLICACION_MODO = os.getenv("PUBLICACION_MODO", "contents")
+PUBLICACION_FLUSH_ITEMS = int(os.getenv("PUBLICACION_FLUSH_ITEMS", "50"))
+PUBLICACION_FLUSH_SEGUNDOS = float(os.getenv("PUBLICACION_FLUSH_SEGUNDOS", "10"))
+PUBLICACION_REINTENTOS_RAMA = int(os.getenv("PUBLICACION_REINTENTOS_RAMA", "5"))  # si otro mueve la rama antes
+
+# Ritmo de la API de GitHub, compartido por todos los workers. Las escrituras (PUT/POST/
+# PATCH/DELETE) salen de un token bucket por debajo del límite secundario de creación de
+# contenido (80/min y 500/hora), que se achica solo cuando GitHub frena; del límite
+# primario se deja sin usar GITHUB_RESERVA_RATE_LIMIT hasta el próximo reset
+GITHUB_ESCRITURAS_POR_HORA = float(os.getenv("GITHUB_ESCRITURAS_POR_HORA", "450"))
+GITHUB_RAFAGA_ESCRITURAS = int(os.getenv("GITHUB_RAFAGA_ESCRITURAS", "50"))
+GITHUB_RESERVA_RATE_LIMIT = int(os.getenv("GITHUB_RESERVA_RATE_LIMIT", "20"))
+GITHUB_ESPERA_MAX = float(os.getenv("GITHUB_ESPERA_MAX", "900"))  # si hay que esperar más, se falla
+
+# Directorio de las bases SQLite por defecto (cache y manifiesto): junto a main.py, no el CWD,
+# así el servicio encuentra las mismas aunque se lance desde otro directorio
+DATOS_DIR = Path(os.getenv("DATOS_DIR", Path(__file__).resolve().parent))
+
+# Cache de scraping: `datos` vigentes por SCRAPE_CACHE_TTL; después se revalida con
+# ETag/Last-Modified. SCRAPE_CACHE_PATH vacío → solo memoria (se pierde al reiniciar)
+SCRAPE_CACHE_TTL = float(os.getenv("SCRAPE_CACHE_TTL", "3600"))  # segundos
+SCRAPE_CACHE_MAX_ITEMS = int(os.getenv("SCRAPE_CACHE_MAX_ITEMS", "1000"))  # en memoria
+SCRAPE_CACHE_MAX_DISCO = int(os.getenv("SCRAPE_CACHE_MAX_DISCO", "20000"))
+SCRAPE_CACHE_PATH = os.getenv("SCRAPE_CACHE_PATH", str(DATOS_DIR / "scrape_cache.sqlite"))
+
+# Manifiesto de fichas publicadas (slug → URL de origen, scraper, hash de `datos`, validadores
+# HTTP y SHA remoto) que recorre /refresh. MANIFIESTO_PATH vacío → solo memoria
+MANIFIESTO_PATH = os.getenv("MANIFIESTO_PATH", str(DATOS_DIR / "manifiesto_fichas.sqlite"))
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", "8"))
+
+# Etapa de imágenes: "off", "validar" (HEAD + dedup) o "miniaturas" (además WebP con
+# srcset, publicadas en fichas/img/; el dedup perceptual y las miniaturas necesitan Pillow)
+IMAGENES_MODO = os.getenv("IMAGENES_MODO", "off")
+IMAGENES_WORKERS = int(os.getenv("IMAGENES_WORKERS", "8"))
+IMAGENES_ANCHOS = sorted(int(a) for a in os.getenv("IMAGENES_ANCHOS", "480,960").split(","))
+IMAGENES_CALIDAD_WEBP = int(os.getenv("IMAGENES_CALIDAD_WEBP", "80"))
+IMAGENES_DISTANCIA_DHASH = int(os.getenv("IMAGENES_DISTANCIA_DHASH", "4"))  # bits distintos tolerados
+
+# Jobs (/jobs): workers del event loop, tope de pendientes y, opcional, SQLite para
+# que los jobs pendientes sobrevivan a un reinicio (JOBS_DB_PATH vacío → solo memoria)
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "4"))
+JOBS_MAX_PENDIENTES = int(os.getenv("JOBS_MAX_PENDIENTES", "200"))
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "")
+JOBS_RETENCION = float(os.getenv("JOBS_RETENCION", "86400"))  # segundos que se guarda un job terminado
+
+# Arranque: con ARRANQUE_PRECALENTAR=1 el servicio acepta requests enseguida y en segundo
+# plano carga la plantilla y el índice de SHAs, importa los backends de parseo, levanta el
+# pool de parseo y abre conexiones a GitHub, MercadoLibre y ARRANQUE_HOSTS; /ready da 200
+# cuando termina. Con 0 solo se carga el índice, antes de aceptar requests
+ARRANQUE_PRECALENTAR = os.getenv("ARRANQUE_PRECALENTAR", "1") == "1"
+ARRANQUE_HOSTS = [h for h in os.getenv("ARRANQUE_HOSTS", "www.remax.com.uy,www.century21.com.uy").split(",") if h]
+ARRANQUE_TIMEOUT = float(os.getenv("ARRANQUE_TIMEOUT", "5"))  # por conexión a precalentar
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    """
+    Arranque y apagado del servicio, en orden. Al arrancar: la cola de jobs
+    (retoma lo que quedó pendiente) y el precalentamiento. Al apagar, al revés
+    de como se usan: primero lo que genera trabajo (precalentamiento y workers
+    de jobs), después los pools y loteadores que ese trabajo usa, las bases
+    SQLite y por último el cliente HTTP async.
+    """
+    await cola_jobs.iniciar()
+    if ARRANQUE_PRECALENTAR:
+        arranque.iniciar()
+    else:
+        await asyncio.to_thread(cargar_indice_sha)
+        arranque.listo = True
+    try:
+        yield
+    finally:
+        await arranque.detener()
+        await cola_jobs.detener()
+        loteador_mercadolibre.cerrar()
+        pool_parseo.cerrar()
+        procesador_imagenes.cerrar()
+        cache_scrape.cerrar()
+        manifiesto_fichas.cerrar()
+        await cliente_http_async.aclose()
+
+
+app = FastAPI(title="UrbanRise Fichas Service", lifespan=ciclo_de_vida)
+logger = logging.getLogger("urbanrise")
 
 
 # ========= MODELO REQUEST =========
@@ -40,20 +229,970 @@ class CrearFichaRequest(BaseModel):
     slug: str | None = None
 
 
+class CrearFichaJobRequest(CrearFichaRequest):
+    webhook: str | None = None  # si viene, se le hace POST con el job terminado
+
+
+class CrearFichasRequest(BaseModel):
+    items: list[CrearFichaRequest]
+    commit_unico: bool | None = None  # None → según PUBLICACION_MODO
+
+
+class RefreshRequest(BaseModel):
+    slugs: list[str] | None = None  # None → todo el manifiesto
+    commit_unico: bool | None = None  # None → según PUBLICACION_MODO
+
+
+# ========= FICHA =========
+
+NO_ESPECIFICADO = sys.intern("No especificado")
+
+
+@dataclass(slots=True)
+class Ficha:
+    """
+    Registro que sale de los scrapers y comparten la cache, el render y la
+    publicación. Los campos se llaman como los `{CAMPO}` del template. Con
+    slots y el NO_ESPECIFICADO compartido, una ficha ocupa una fracción de
+    lo que ocupaba el dict equivalente, y viaja más liviana entre procesos.
+    """
+
+    OPERACION: str = NO_ESPECIFICADO
+    TIPO: str = NO_ESPECIFICADO
+    TITULO: str = NO_ESPECIFICADO
+    UBICACION: str = NO_ESPECIFICADO
+    PRECIO: str = NO_ESPECIFICADO
+    SUPERFICIE: str = NO_ESPECIFICADO
+    DORMITORIOS_AMBIENTES: str = NO_ESPECIFICADO
+    BANIOS: str = NO_ESPECIFICADO
+    COCHERA: str = NO_ESPECIFICADO
+    ESTADO: str = NO_ESPECIFICADO
+    EXPENSAS: str = NO_ESPECIFICADO
+    DESTACADOS: str = NO_ESPECIFICADO
+    ANIO_CONSTRUCCION: str = NO_ESPECIFICADO
+    PISOS: str = NO_ESPECIFICADO
+    ORIENTACION: str = NO_ESPECIFICADO
+    MASCOTAS: str = NO_ESPECIFICADO
+    MOBILIARIO: str = NO_ESPECIFICADO
+    DESCRIPCION: str = NO_ESPECIFICADO
+    IMAGENES: list[str] = field(default_factory=list)
+    MINIATURAS: dict[str, list[tuple[str, int, int]]] = field(default_factory=dict)  # url → [(archivo, ancho, alto)]
+
+    def __post_init__(self):
+        # Todo campo de texto queda como str; los faltantes, como el sentinel compartido
+        for campo in CAMPOS_TEXTO:
+            valor = getattr(self, campo)
+            if valor is None or valor == NO_ESPECIFICADO:
+                setattr(self, campo, NO_ESPECIFICADO)
+            elif not isinstance(valor, str):
+                setattr(self, campo, str(valor))
+        if not isinstance(self.IMAGENES, list):
+            raise TypeError("IMAGENES tiene que ser una lista de URLs")
+
+    def a_dict(self) -> dict:
+        datos = {campo: getattr(self, campo) for campo in CAMPOS}
+        if not self.MINIATURAS:
+            del datos["MINIATURAS"]
+        return datos
+
+    def a_json(self) -> str:
+        """
+        Serialización compacta: los valores en el orden de los campos, sin las
+        claves, precedidos por ESQUEMA_FICHA (cambia si se agrega, renombra o
+        reordena un campo).
+        """
+        valores = [ESQUEMA_FICHA, *(getattr(self, campo) for campo in CAMPOS)]
+        return json.dumps(valores, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def desde_json(cls, texto: str) -> "Ficha":
+        """ValueError si se guardó con otros campos: los valores caerían en el campo equivocado."""
+        valores = json.loads(texto)
+        if isinstance(valores, dict):  # guardada como dict antes de existir Ficha
+            return cls(**valores)
+        if not valores or valores[0] != ESQUEMA_FICHA:
+            raise ValueError("Ficha guardada con otro esquema de campos")
+        return cls(*valores[1:])
+
+
+CAMPOS = tuple(campo.name for campo in fields(Ficha))
+CAMPOS_TEXTO = tuple(campo for campo in CAMPOS if campo not in ("IMAGENES", "MINIATURAS"))
+ESQUEMA_FICHA = hashlib.sha1("|".join(CAMPOS).encode("utf-8")).hexdigest()[:8]
+
+
+# ========= MÉTRICAS =========
+
+class Metricas:
+    """
+    Registro mínimo de métricas en memoria (histogramas, contadores y gauges
+    con etiquetas), expuesto en el formato de texto de Prometheus en /metrics.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    DESCRIPCIONES = {
+        "urbanrise_etapa_segundos": ("histogram", "Duración de cada etapa de una ficha"),
+        "urbanrise_etapa_errores_total": ("counter", "Errores por etapa y tipo de excepción"),
+        "urbanrise_etapa_en_curso": ("gauge", "Etapas corriendo en este momento"),
+        "urbanrise_github_rate_limit_restante": ("gauge", "Último X-RateLimit-Remaining visto de GitHub"),
+        "urbanrise_github_rate_limit_limite": ("gauge", "Último X-RateLimit-Limit visto de GitHub"),
+        "urbanrise_github_rate_limit_reset": ("gauge", "Último X-RateLimit-Reset visto de GitHub (epoch)"),
+        "urbanrise_github_rate_limitado_total": ("counter", "Respuestas 403/429 de GitHub por rate limit"),
+        "urbanrise_github_escrituras_disponibles": ("gauge", "Escrituras a GitHub disponibles ya en el token bucket"),
+        "urbanrise_github_escrituras_por_hora": ("gauge", "Ritmo de escrituras a GitHub vigente (adaptativo)"),
+        "urbanrise_github_pausa_segundos": ("gauge", "Segundos que faltan para volver a llamar a GitHub"),
+        "urbanrise_github_espera_segundos_total": ("counter", "Tiempo esperado por el planificador antes de llamar a GitHub"),
+        "urbanrise_portal_limite": ("gauge", "Descargas simultáneas permitidas contra el portal (AIMD)"),
+        "urbanrise_portal_en_curso": ("gauge", "Descargas en curso contra el portal"),
+        "urbanrise_portal_circuito_abierto": ("gauge", "1 si el circuit breaker del portal está abierto"),
+        "urbanrise_portal_rechazados_total": ("counter", "Pedidos rechazados al instante por circuito abierto"),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas: dict[tuple[str, tuple], list[float]] = {}
+        self._contadores: dict[tuple[str, tuple], float] = {}
+        self._gauges: dict[tuple[str, tuple], float] = {}
+
+    @staticmethod
+    def _clave(nombre: str, etiquetas: dict) -> tuple[str, tuple]:
+        return nombre, tuple(sorted(etiquetas.items()))
+
+    def observar(self, nombre: str, valor: float, **etiquetas):
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            # un conteo por bucket, más la suma y la cantidad total
+            serie = self._histogramas.setdefault(clave, [0.0] * (len(self.BUCKETS) + 2))
+            for i, limite in enumerate(self.BUCKETS):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def sumar(self, nombre: str, valor: float = 1, **etiquetas):
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def fijar(self, nombre: str, valor: float, **etiquetas):
+        with self._lock:
+            self._gauges[self._clave(nombre, etiquetas)] = valor
+
+    def ajustar(self, nombre: str, delta: float, **etiquetas):
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            self._gauges[clave] = self._gauges.get(clave, 0) + delta
+
+    @staticmethod
+    def _etiquetas(etiquetas, extra: tuple = ()) -> str:
+        pares = list(etiquetas) + list(extra)
+        if not pares:
+            return ""
+        texto = ",".join(
+            f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+            for k, v in pares
+        )
+        return "{" + texto + "}"
+
+    def exponer(self, extra: list[tuple[str, str, dict, float]] = ()) -> str:
+        """Texto para Prometheus; `extra` son (nombre, tipo, etiquetas, valor) calculados al momento."""
+        with self._lock:
+            histogramas = {k: list(v) for k, v in self._histogramas.items()}
+            series = [(n, "counter", e, v) for (n, e), v in self._contadores.items()]
+            series += [(n, "gauge", e, v) for (n, e), v in self._gauges.items()]
+        series += [(n, tipo, tuple(sorted(e.items())), v) for n, tipo, e, v in extra]
+
+        lineas = []
+        vistos = set()
+
+        def cabecera(nombre: str, tipo: str):
+            if nombre not in vistos:
+                vistos.add(nombre)
+                ayuda = self.DESCRIPCIONES.get(nombre, (tipo, nombre))[1]
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+
+        for (nombre, etiquetas), serie in sorted(histogramas.items()):
+            cabecera(nombre, "histogram")
+            for limite, cantidad in zip(self.BUCKETS, serie):
+                lineas.append(f"{nombre}_bucket{self._etiquetas(etiquetas, (('le', limite),))} {cantidad:g}")
+            lineas.append(f"{nombre}_bucket{self._etiquetas(etiquetas, (('le', '+Inf'),))} {serie[-1]:g}")
+            lineas.append(f"{nombre}_sum{self._etiquetas(etiquetas)} {serie[-2]:.6f}")
+            lineas.append(f"{nombre}_count{self._etiquetas(etiquetas)} {serie[-1]:g}")
+        for nombre, tipo, etiquetas, valor in sorted(series, key=lambda x: (x[0], x[2])):
+            cabecera(nombre, tipo)
+            lineas.append(f"{nombre}{self._etiquetas(etiquetas)} {valor:g}")
+        return "\n".join(lineas) + "\n"
+
+
+metricas = Metricas()
+
+# Portal de la ficha en curso (etiqueta de las métricas) y, si se pidió, el desglose de tiempos
+_portal_actual: contextvars.ContextVar[str] = contextvars.ContextVar("portal_actual", default="ninguno")
+_tiempos_actuales: contextvars.ContextVar[dict | None] = contextvars.ContextVar("tiempos_actuales", default=None)
+
+
+def nombre_portal(url_anuncio: str) -> str:
+    return elegir_scraper(url_anuncio).__name__.removeprefix("scrapear_propiedad_")
+
+
+@contextmanager
+def etiqueta_portal(url_anuncio: str):
+    token = _portal_actual.set(nombre_portal(url_anuncio))
+    try:
+        yield
+    finally:
+        _portal_actual.reset(token)
+
+
+@contextmanager
+def medir(etapa: str):
+    """
+    Span de una etapa: duración al histograma, errores por tipo y gauge de
+    en curso, etiquetados con el portal actual. Si el request pidió tiempos,
+    también suma la duración a su desglose.
+    """
+    portal = _portal_actual.get()
+    metricas.ajustar("urbanrise_etapa_en_curso", 1, etapa=etapa)
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        metricas.sumar("urbanrise_etapa_errores_total", etapa=etapa, portal=portal, tipo=type(e).__name__)
+        if not hasattr(e, "etapa"):
+            try:
+                e.etapa = etapa  # la más interna: es la que se informa al cliente
+            except AttributeError:
+                pass
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        metricas.ajustar("urbanrise_etapa_en_curso", -1, etapa=etapa)
+        metricas.observar("urbanrise_etapa_segundos", duracion, etapa=etapa, portal=portal)
+        tiempos = _tiempos_actuales.get()
+        if tiempos is not None:
+            tiempos[etapa] = round(tiempos.get(etapa, 0.0) + duracion, 4)
+
+
+# ========= RATE LIMIT DE GITHUB =========
+
+class PlanificadorGitHub:
+    """
+    Ritmo global de las llamadas a la API de GitHub, compartido por todos los
+    workers (sync y async). Antes de cada llamada `reservar` dice cuánto hay
+    que esperar; después `observar` lee la respuesta.
+
+    - Escrituras: token bucket de `escrituras_por_hora` con ráfaga `rafaga`.
+      Si GitHub devuelve el límite secundario, el ritmo se reduce a la mitad
+      y se recupera de a poco con cada escritura aceptada.
+    - Límite primario: se sigue X-RateLimit-Remaining/Reset (descontando las
+      llamadas en vuelo) y, al llegar a `reserva`, se espera al reset.
+    - Frenado (403/429): pausa global hasta Retry-After, el reset o, si GitHub
+      no dice nada, un backoff que arranca en un minuto y se duplica.
+    """
+
+    ESCRITURAS = {"PUT", "POST", "PATCH", "DELETE"}
+
+    def __init__(self, escrituras_por_hora: float, rafaga: int, reserva: int, espera_max: float):
+        self.ritmo_max = escrituras_por_hora
+        self.ritmo_min = escrituras_por_hora / 8
+        self.rafaga = rafaga
+        self.reserva = reserva
+        self.espera_max = espera_max
+        self._lock = threading.Lock()
+        self._ritmo = escrituras_por_hora
+        self._fichas = float(rafaga)
+        self._actualizado = time.monotonic()
+        self._pausa_hasta = 0.0  # monotonic
+        self._frenadas_seguidas = 0
+        self._restante: int | None = None
+        self._reset = 0.0  # epoch, como lo manda GitHub
+
+    def _recargar(self, ahora: float):
+        # _actualizado puede quedar en el futuro: durante una pausa no se acumulan fichas
+        if ahora > self._actualizado:
+            self._fichas = min(self.rafaga, self._fichas + (ahora - self._actualizado) * self._ritmo / 3600)
+            self._actualizado = ahora
+
+    def reservar(self, method: str) -> float:
+        """Segundos a esperar antes de mandar la llamada (ya queda reservado su lugar)."""
+        with self._lock:
+            ahora = time.monotonic()
+            espera = self._pausa_hasta - ahora
+            if self._restante is not None:
+                if self._restante <= self.reserva and self._reset > time.time():
+                    espera = max(espera, self._reset - time.time())
+                self._restante -= 1
+            if method.upper() in self.ESCRITURAS:
+                self._recargar(ahora)
+                self._fichas -= 1
+                if self._fichas < 0:
+                    espera = max(espera, self._actualizado - ahora - self._fichas * 3600 / self._ritmo)
+            espera = max(0.0, espera)
+            if espera > self.espera_max:
+                if method.upper() in self.ESCRITURAS:
+                    self._fichas += 1  # no se va a usar
+                raise RuntimeError(f"Rate limit de GitHub agotado: habría que esperar {espera:.0f}s")
+            metricas.fijar("urbanrise_github_escrituras_disponibles", max(0.0, self._fichas))
+        if espera > 0:
+            metricas.sumar("urbanrise_github_espera_segundos_total", espera)
+        return espera
+
+    def observar(self, method: str, resp) -> bool:
+        """Actualiza el presupuesto con los headers; True si GitHub frenó la llamada (conviene reintentarla)."""
+        restante = resp.headers.get("X-RateLimit-Remaining")
+        reset = resp.headers.get("X-RateLimit-Reset")
+        frenada = resp.status_code == 429 or (resp.status_code == 403 and (
+            restante == "0" or "Retry-After" in resp.headers or "rate limit" in _texto_seguro(resp).lower()
+        ))
+        with self._lock:
+            ahora = time.monotonic()
+            if restante and restante.isdigit():
+                self._restante = int(restante)
+            if reset and reset.isdigit():
+                self._reset = float(reset)
+            if frenada:
+                espera = PoliticaReintentos._retry_after(resp)
+                if espera is None and restante == "0" and self._reset:
+                    espera = self._reset - time.time()
+                if espera is None:
+                    # límite secundario sin indicación: GitHub pide esperar al menos un minuto
+                    espera = 60 * 2 ** min(self._frenadas_seguidas, 4)
+                    self._ritmo = max(self.ritmo_min, self._ritmo / 2)
+                self._frenadas_seguidas += 1
+                self._pausa_hasta = max(self._pausa_hasta, ahora + max(0.0, espera))
+                self._recargar(ahora)
+                self._fichas = min(self._fichas, 0.0)
+                self._actualizado = max(self._actualizado, self._pausa_hasta)
+            elif resp.status_code < 400:
+                self._frenadas_seguidas = 0
+                if method.upper() in self.ESCRITURAS:
+                    self._ritmo = min(self.ritmo_max, self._ritmo + self.ritmo_max / 100)
+            ritmo = self._ritmo
+        metricas.fijar("urbanrise_github_escrituras_por_hora", ritmo)
+        for header, nombre in (
+            ("X-RateLimit-Remaining", "urbanrise_github_rate_limit_restante"),
+            ("X-RateLimit-Limit", "urbanrise_github_rate_limit_limite"),
+            ("X-RateLimit-Reset", "urbanrise_github_rate_limit_reset"),
+        ):
+            valor = resp.headers.get(header)
+            if valor and valor.isdigit():
+                metricas.fijar(nombre, float(valor))
+        if frenada:
+            metricas.sumar("urbanrise_github_rate_limitado_total")
+        return frenada
+
+    def pausa(self) -> float:
+        with self._lock:
+            return max(0.0, self._pausa_hasta - time.monotonic())
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._recargar(time.monotonic())
+            return {
+                "escrituras_por_hora": round(self._ritmo, 1),
+                "escrituras_disponibles": round(max(0.0, self._fichas), 2),
+                "rate_limit_restante": self._restante,
+                "rate_limit_reset": self._reset or None,
+                "pausa_segundos": round(max(0.0, self._pausa_hasta - time.monotonic()), 1),
+                "frenadas_seguidas": self._frenadas_seguidas,
+            }
+
+
+def _texto_seguro(resp) -> str:
+    try:
+        return resp.text
+    except Exception:  # respuesta httpx en streaming sin leer
+        return ""
+
+
+planificador_github = PlanificadorGitHub(
+    GITHUB_ESCRITURAS_POR_HORA, GITHUB_RAFAGA_ESCRITURAS, GITHUB_RESERVA_RATE_LIMIT, GITHUB_ESPERA_MAX
+)
+
+
+def es_api_github(host: str) -> bool:
+    return host == urlparse(GITHUB_API_URL).netloc.lower()
+
+
+# ========= CLIENTE HTTP (POOL + REINTENTOS) =========
+
+class PoliticaReintentos:
+    """Backoff y lectura de `Retry-After` comunes a los clientes sync y async."""
+
+    REINTENTAR_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, reintentos: int, backoff_base: float, espera_max: float):
+        self.reintentos = reintentos
+        self.backoff_base = backoff_base
+        self.espera_max = espera_max
+        self._lock = threading.Lock()
+        self._contadores: dict[str, dict[str, int]] = {}
+
+    def _contar(self, host: str, contador: str):
+        with self._lock:
+            contadores = self._contadores.setdefault(
+                host, {"requests": 0, "reintentos": 0, "errores_red": 0}
+            )
+            contadores[contador] += 1
+
+    def _backoff(self, intento: int) -> float:
+        return random.uniform(0, min(self.espera_max, self.backoff_base * 2 ** intento))
+
+    def _espera(self, resp, intento: int) -> float:
+        espera = self._retry_after(resp)
+        if espera is None:
+            espera = self._backoff(intento)
+        return min(espera, self.espera_max)
+
+    @staticmethod
+    def _retry_after(resp) -> float | None:
+        valor = resp.headers.get("Retry-After")
+        if not valor:
+            return None
+        if valor.strip().isdigit():
+            return float(valor)
+        try:
+            return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class ClienteHTTP(PoliticaReintentos):
+    """
+    Sesiones `requests` keep-alive, una por host, compartidas por todos los
+    scrapers y por el cliente de GitHub: se reusan las conexiones TCP+TLS
+    entre fichas. Reintenta errores de conexión, timeouts, 429 y 5xx con
+    backoff exponencial con jitter, respetando `Retry-After` si viene.
+    """
+
+    def __init__(self, pool_maxsize: int, timeout: tuple[float, float], reintentos: int,
+                 backoff_base: float, espera_max: float):
+        super().__init__(reintentos, backoff_base, espera_max)
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self._sesiones: dict[str, requests.Session] = {}
+
+    def _sesion(self, host: str) -> requests.Session:
+        with self._lock:
+            sesion = self._sesiones.get(host)
+            if sesion is None:
+                sesion = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                sesion.mount("http://", adapter)
+                sesion.mount("https://", adapter)
+                self._sesiones[host] = sesion
+            return sesion
+
+    def request(self, method: str, url: str, *, reintentos: int | None = None, **kwargs) -> requests.Response:
+        host = urlparse(url).netloc.lower()
+        sesion = self._sesion(host)
+        kwargs.setdefault("timeout", self.timeout)
+        reintentos = self.reintentos if reintentos is None else reintentos
+        github = es_api_github(host)
+
+        for intento in range(reintentos + 1):
+            if github:
+                espera = planificador_github.reservar(method)
+                if espera:
+                    time.sleep(espera)
+            self._contar(host, "requests")
+            try:
+                resp = sesion.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._contar(host, "errores_red")
+                if intento == reintentos:
+                    raise
+                espera = min(self._backoff(intento), self.espera_max)
+            else:
+                # Si GitHub frenó, la espera la impone el planificador en la próxima reserva
+                frenada = github and planificador_github.observar(method, resp)
+                if (resp.status_code not in self.REINTENTAR_STATUS and not frenada) or intento == reintentos:
+                    return resp
+                espera = 0.0 if frenada else self._espera(resp, intento)
+                resp.close()
+            self._contar(host, "reintentos")
+            time.sleep(espera)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def stats(self) -> dict:
+        """Por host: requests, reintentos y errores, más conexiones abiertas/ociosas del pool."""
+        with self._lock:
+            sesiones = dict(self._sesiones)
+            stats = {host: dict(c) for host, c in self._contadores.items()}
+        for host, sesion in sesiones.items():
+            stats.setdefault(host, {})
+            poolmanager = sesion.get_adapter("https://").poolmanager
+            conexiones_nuevas = requests_servidos = ociosas = 0
+            for clave in list(poolmanager.pools.keys()):
+                pool = poolmanager.pools.get(clave)
+                if pool is None:
+                    continue
+                conexiones_nuevas += pool.num_connections
+                requests_servidos += pool.num_requests
+                if pool.pool is not None:
+                    # la cola de urllib3 se precarga con None: solo cuentan las conexiones reales
+                    ociosas += sum(1 for conexion in list(pool.pool.queue) if conexion is not None)
+            stats[host].update({
+                "conexiones_nuevas": conexiones_nuevas,
+                "requests_pool": requests_servidos,
+                "conexiones_ociosas": ociosas,
+            })
+        return {"pool_maxsize": self.pool_maxsize, "hosts": stats}
+
+
+cliente_http = ClienteHTTP(
+    pool_maxsize=HTTP_POOL_MAXSIZE,
+    timeout=(HTTP_TIMEOUT_CONEXION, HTTP_TIMEOUT_LECTURA),
+    reintentos=HTTP_REINTENTOS,
+    backoff_base=HTTP_BACKOFF_BASE,
+    espera_max=HTTP_ESPERA_MAX,
+)
+
+
+class ClienteHTTPAsync(PoliticaReintentos):
+    """
+    Equivalente async de `ClienteHTTP` sobre `httpx.AsyncClient`, para el
+    camino de /crear-ficha: las fichas esperando red no ocupan threads.
+    El cliente se crea en el primer uso, dentro del event loop que lo usa.
+    """
+
+    def __init__(self, pool_maxsize: int, timeout: tuple[float, float], reintentos: int,
+                 backoff_base: float, espera_max: float):
+        super().__init__(reintentos, backoff_base, espera_max)
+        self.pool_maxsize = pool_maxsize
+        self.timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        self._cliente: httpx.AsyncClient | None = None
+
+    def _obtener_cliente(self) -> httpx.AsyncClient:
+        if self._cliente is None or self._cliente.is_closed:
+            self._cliente = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=None,
+                    max_keepalive_connections=self.pool_maxsize,
+                ),
+                follow_redirects=True,
+            )
+        return self._cliente
+
+    async def request(self, method: str, url: str, *, reintentos: int | None = None, stream: bool = False,
+                      **kwargs) -> httpx.Response:
+        host = urlparse(url).netloc.lower()
+        cliente = self._obtener_cliente()
+        reintentos = self.reintentos if reintentos is None else reintentos
+        github = es_api_github(host)
+
+        for intento in range(reintentos + 1):
+            if github:
+                espera = planificador_github.reservar(method)
+                if espera:
+                    await asyncio.sleep(espera)
+            self._contar(host, "requests")
+            try:
+                # Con stream=True el cuerpo queda sin leer: lo consume (y cierra) quien llama
+                resp = await cliente.send(cliente.build_request(method, url, **kwargs), stream=stream)
+            except httpx.TransportError:
+                self._contar(host, "errores_red")
+                if intento == reintentos:
+                    raise
+                espera = min(self._backoff(intento), self.espera_max)
+            else:
+                # Si GitHub frenó, la espera la impone el planificador en la próxima reserva
+                frenada = github and planificador_github.observar(method, resp)
+                if (resp.status_code not in self.REINTENTAR_STATUS and not frenada) or intento == reintentos:
+                    return resp
+                espera = 0.0 if frenada else self._espera(resp, intento)
+                await resp.aclose()
+            self._contar(host, "reintentos")
+            await asyncio.sleep(espera)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def aclose(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {host: dict(c) for host, c in self._contadores.items()}
+
+
+cliente_http_async = ClienteHTTPAsync(
+    pool_maxsize=HTTP_POOL_MAXSIZE,
+    timeout=(HTTP_TIMEOUT_CONEXION, HTTP_TIMEOUT_LECTURA),
+    reintentos=HTTP_REINTENTOS,
+    backoff_base=HTTP_BACKOFF_BASE,
+    espera_max=HTTP_ESPERA_MAX,
+)
+
+
+@app.get("/stats/http")
+def stats_http():
+    return {
+        **cliente_http.stats(),
+        "async": cliente_http_async.stats(),
+        "github": planificador_github.stats(),
+        "portales": limitador_hosts.stats(),
+    }
+
+
+# ========= COALESCENCIA (SINGLE-FLIGHT) =========
+
+class VueloUnico:
+    """
+    Coalescencia de llamadas concurrentes con la misma clave: la primera
+    (líder) hace el trabajo y las que llegan mientras tanto esperan y reciben
+    su mismo resultado (o excepción). Sirve igual desde threads y desde el
+    event loop: el resultado viaja en un `concurrent.futures.Future`.
+    Si se pasa `firma`, solo se comparte el resultado de un líder con la
+    misma firma; con otra firma se espera a que termine y se corre de nuevo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo: dict = {}
+        self.coalescidos = 0
+
+    def _unirse(self, clave, firma) -> tuple[Future, bool, object]:
+        with self._lock:
+            vuelo = self._en_vuelo.get(clave)
+            if vuelo is None:
+                vuelo = self._en_vuelo[clave] = (Future(), firma)
+                return vuelo[0], True, firma
+            if vuelo[1] == firma:
+                self.coalescidos += 1
+            return vuelo[0], False, vuelo[1]
+
+    def _aterrizar(self, clave, futuro: Future):
+        with self._lock:
+            if self._en_vuelo.get(clave, (None,))[0] is futuro:
+                del self._en_vuelo[clave]
+
+    def hacer(self, clave, fn, *args, firma=None):
+        while True:
+            futuro, lider, firma_lider = self._unirse(clave, firma)
+            if lider:
+                try:
+                    resultado = fn(*args)
+                except BaseException as e:
+                    futuro.set_exception(e)
+                    raise
+                else:
+                    futuro.set_result(resultado)
+                    return resultado
+                finally:
+                    self._aterrizar(clave, futuro)
+            if firma_lider == firma:
+                return futuro.result()
+            wait_futures([futuro])
+
+    async def hacer_async(self, clave, fn_async, *args, firma=None):
+        while True:
+            futuro, lider, firma_lider = self._unirse(clave, firma)
+            if lider:
+                try:
+                    resultado = await fn_async(*args)
+                except BaseException as e:
+                    futuro.set_exception(e)
+                    raise
+                else:
+                    futuro.set_result(resultado)
+                    return resultado
+                finally:
+                    self._aterrizar(clave, futuro)
+            if firma_lider == firma:
+                return await asyncio.wrap_future(futuro)
+            espera = asyncio.wrap_future(futuro)
+            await asyncio.wait([espera])
+            if not espera.cancelled():
+                espera.exception()  # se da por vista: el error era de la otra versión
+
+
+# Scraping por URL normalizada; publicación por slug (firmada con el SHA del HTML)
+vuelos_scrape = VueloUnico()
+vuelos_publicacion = VueloUnico()
+
+
+# ========= DESCARGA =========
+
+class FiltroHTML:
+    """
+    Recibe el HTML decodificado de a pedazos y va descartando los bloques
+    <script>/<style> (salvo los de datos: type con "json", como JSON-LD),
+    aunque un tag quede partido entre dos chunks. Marca `completo` cuando ya
+    pasaron todos los `marcadores` del portal.
+    """
+
+    _APERTURA = re.compile(r"<(script|style)\b[^>]*>", re.IGNORECASE)
+    _CIERRES = {
+        "script": re.compile(r"</script\s*>", re.IGNORECASE),
+        "style": re.compile(r"</style\s*>", re.IGNORECASE),
+    }
+    _MAX_TAG_PARTIDO = 1024
+
+    def __init__(self, quitar_scripts: bool, marcadores: list[str]):
+        self.quitar_scripts = quitar_scripts
+        self._marcadores = set(marcadores)
+        self._ventana = max((len(m) for m in marcadores), default=1) - 1
+        self._cola = ""
+        self._partes: list[str] = []
+        self._resto = ""
+        self._cierre: re.Pattern | None = None
+        self.completo = False
+
+    def _emitir(self, texto: str):
+        if not texto:
+            return
+        self._partes.append(texto)
+        if self._marcadores:
+            buscado = self._cola + texto
+            self._marcadores = {m for m in self._marcadores if m not in buscado}
+            self._cola = buscado[-self._ventana:] if self._ventana else ""
+            self.completo = not self._marcadores
+
+    def alimentar(self, texto: str):
+        if not self.quitar_scripts:
+            self._emitir(texto)
+            return
+        texto = self._resto + texto
+        self._resto = ""
+        pos = 0
+        while True:
+            if self._cierre is not None:
+                m = self._cierre.search(texto, pos)
+                if m is None:
+                    # Se guarda desde el último "<", por si el cierre (con todos los espacios
+                    # que acepta el patrón) quedó partido entre chunks; lo anterior se descarta
+                    corte = texto.rfind("<", pos)
+                    if corte != -1 and ">" not in texto[corte:] and len(texto) - corte < self._MAX_TAG_PARTIDO:
+                        self._resto = texto[corte:]
+                    return
+                pos = m.end()
+                self._cierre = None
+                continue
+            m = self._APERTURA.search(texto, pos)
+            if m is None:
+                corte = texto.rfind("<", pos)
+                if corte != -1 and ">" not in texto[corte:] and len(texto) - corte < self._MAX_TAG_PARTIDO:
+                    self._emitir(texto[pos:corte])
+                    self._resto = texto[corte:]  # puede ser el comienzo de un <script
+                else:
+                    self._emitir(texto[pos:])
+                return
+            if "json" in m.group(0).lower():
+                self._emitir(texto[pos:m.end()])
+            else:
+                self._emitir(texto[pos:m.start()])
+                self._cierre = self._CIERRES[m.group(1).lower()]
+            pos = m.end()
+
+    def resultado(self) -> str:
+        if self._cierre is None:
+            self._partes.append(self._resto)
+        self._resto = ""
+        return "".join(self._partes)
+
+
+def _filtro_para(url_anuncio: str) -> FiltroHTML:
+    return FiltroHTML(DESCARGA_QUITAR_SCRIPTS, DESCARGA_MARCADORES.get(urlparse(url_anuncio).netloc.lower(), []))
+
+
+def _decodificador(charset: str | None):
+    try:
+        return codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def _charset_requests(resp) -> str | None:
+    # requests inventa ISO-8859-1 para text/* sin charset: solo vale si vino en el header
+    return resp.encoding if "charset" in resp.headers.get("Content-Type", "").lower() else None
+
+
+def leer_html(resp, url_anuncio: str) -> str:
+    """Lee en streaming una respuesta de `requests` (pedida con stream=True) y la cierra."""
+    try:
+        resp.raise_for_status()
+        filtro = _filtro_para(url_anuncio)
+        decodificador = _decodificador(_charset_requests(resp))
+        leidos = 0
+        for chunk in resp.iter_content(DESCARGA_CHUNK):
+            leidos += len(chunk)
+            filtro.alimentar(decodificador.decode(chunk))
+            if filtro.completo:
+                break
+            if leidos >= DESCARGA_MAX_BYTES:
+                logger.warning("Página truncada a %d bytes: %s", leidos, url_anuncio)
+                break
+        else:
+            filtro.alimentar(decodificador.decode(b"", final=True))
+        return filtro.resultado()
+    finally:
+        resp.close()
+
+
+async def leer_html_async(resp: httpx.Response, url_anuncio: str) -> str:
+    """Equivalente de `leer_html` para una respuesta httpx en streaming."""
+    try:
+        resp.raise_for_status()
+        filtro = _filtro_para(url_anuncio)
+        decodificador = _decodificador(resp.charset_encoding)
+        leidos = 0
+        async for chunk in resp.aiter_bytes(DESCARGA_CHUNK):
+            leidos += len(chunk)
+            filtro.alimentar(decodificador.decode(chunk))
+            if filtro.completo:
+                break
+            if leidos >= DESCARGA_MAX_BYTES:
+                logger.warning("Página truncada a %d bytes: %s", leidos, url_anuncio)
+                break
+        else:
+            filtro.alimentar(decodificador.decode(b"", final=True))
+        return filtro.resultado()
+    finally:
+        await resp.aclose()
+
+
+def descargar_html(url_anuncio: str) -> str:
+    return leer_html(cliente_http.get(url_anuncio, headers=HEADERS, stream=True), url_anuncio)
+
+
+# ========= BACKENDS DE PARSEO HTML =========
+
+class NodoLexbor:
+    """
+    Adaptador mínimo de un nodo de selectolax (lexbor) con la parte de la API
+    de BeautifulSoup que usan los scrapers: find/find_all/select/select_one,
+    get_text, get y acceso a atributos. Así los `extraer_propiedad_*` corren
+    igual sobre cualquier backend.
+    """
+
+    __slots__ = ("_nodo",)
+
+    # Igual que BeautifulSoup: su texto no cuenta para get_text()
+    _TAGS_SIN_TEXTO = frozenset({"script", "style", "template"})
+
+    def __init__(self, nodo):
+        self._nodo = nodo
+
+    @property
+    def name(self) -> str:
+        return self._nodo.tag
+
+    @property
+    def title(self):
+        return self.select_one("title")
+
+    def get(self, attr: str, default=None):
+        valor = self._nodo.attributes.get(attr)
+        return default if valor is None else valor
+
+    def __getitem__(self, attr: str):
+        valor = self.get(attr)
+        if valor is None:
+            raise KeyError(attr)
+        return valor
+
+    def _textos(self, incluir_scripts: bool):
+        for nodo in self._nodo.traverse(include_text=True):
+            if nodo.tag != "-text":
+                continue
+            if not incluir_scripts and nodo.parent is not None and nodo.parent.tag in self._TAGS_SIN_TEXTO:
+                continue
+            yield nodo.text_content or ""
+
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        textos = self._textos(incluir_scripts=False)
+        if strip:
+            textos = [t for t in (t.strip() for t in textos) if t]
+        return separator.join(textos)
+
+    def select(self, selector: str) -> list["NodoLexbor"]:
+        return [NodoLexbor(n) for n in self._nodo.css(selector)]
+
+    def select_one(self, selector: str) -> "NodoLexbor | None":
+        nodo = self._nodo.css_first(selector)
+        return NodoLexbor(nodo) if nodo is not None else None
+
+    def find_all(self, name: str | None = None, string=None, **attrs) -> list:
+        if string is not None:
+            # Como en BeautifulSoup, acá sí entran los textos de <script>/<style>
+            return [t for t in self._textos(incluir_scripts=True) if string(t)]
+        selector = (name or "*") + "".join(f'[{k}="{v}"]' for k, v in attrs.items())
+        return self.select(selector)
+
+    def find(self, name: str | None = None, **attrs) -> "NodoLexbor | None":
+        encontrados = self.find_all(name, **attrs)
+        return encontrados[0] if encontrados else None
+
+
+def _soup_html_parser(html: str):
+    return importar_diferido("bs4").BeautifulSoup(html, "html.parser")
+
+
+def _soup_lxml(html: str):
+    return importar_diferido("bs4").BeautifulSoup(html, "lxml")
+
+
+def _soup_selectolax(html: str):
+    return NodoLexbor(importar_diferido("selectolax.lexbor").LexborHTMLParser(html).root)
+
+
+# Backend → (función, instalado, módulos que importa en el primer uso)
+PARSERS_HTML = {
+    "html.parser": (_soup_html_parser, True, ("bs4",)),
+    "lxml": (_soup_lxml, modulo_instalado("lxml"), ("bs4", "lxml")),
+    "selectolax": (_soup_selectolax, modulo_instalado("selectolax.lexbor"), ("selectolax.lexbor",)),
+}
+
+
+def crear_soup(html: str, url_anuncio: str):
+    """
+    Parsea con el backend configurado para el portal (PARSER_HTML_POR_PORTAL
+    o PARSER_HTML). Si ese backend no está instalado se usa html.parser.
+    """
+    nombre = PARSER_HTML_POR_PORTAL.get(urlparse(url_anuncio).netloc.lower(), PARSER_HTML)
+    parser, disponible, _ = PARSERS_HTML.get(nombre, (None, False, ()))
+    if not disponible:
+        parser = _soup_html_parser
+    return parser(html)
+
+
 # ========= SCRAPER REMAX =========
 
-def scrapear_propiedad_remax(url_anuncio: str) -> dict:
+def scrapear_propiedad_remax(url_anuncio: str) -> Ficha:
     """
     Scraper base para REMAX.
     Se puede afinar con selectores concretos mirando el HTML real del portal.
     """
-    resp = requests.get(url_anuncio, headers=HEADERS, timeout=20)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    return extraer_propiedad_remax(descargar_html(url_anuncio), url_anuncio)
+
+
+def extraer_propiedad_remax(html: str, url_anuncio: str) -> Ficha:
+    soup = crear_soup(html, url_anuncio)
 
     # ----- TEXTO GLOBAL -----
     texto_global = soup.get_text(separator=" ", strip=True)
     texto_lower = texto_global.lower()
+    # operación, tipo, estado, superficie, dormitorios, baños y cochera salen de un solo escaneo
+    rasgos = escanear_rasgos(texto_lower)
 
     # ----- TÍTULO -----
     titulo_el = soup.find("h1")
@@ -72,32 +1211,12 @@ def scrapear_propiedad_remax(url_anuncio: str) -> dict:
             candidatos = sorted(candidatos, key=len)
             precio = candidatos[0]
         else:
-            precio = "No especificado"
+            precio = NO_ESPECIFICADO
 
     # ----- UBICACIÓN -----
     ubic_el = soup.select_one("[class*=location], [class*=ubicacion], [class*=address]")
     ubicacion = ubic_el.get_text(strip=True) if ubic_el else "No especificada"
 
-    # ----- OPERACIÓN -----
-    operacion = "No especificado"
-    if "alquiler" in texto_lower:
-        operacion = "Alquiler"
-    elif "venta" in texto_lower or "se vende" in texto_lower:
-        operacion = "Venta"
-
-    # ----- TIPO -----
-    tipo = "No especificado"
-    if "monoambiente" in texto_lower:
-        tipo = "Apartamento"
-    elif "apartamento" in texto_lower or "apto" in texto_lower:
-        tipo = "Apartamento"
-    elif "casa" in texto_lower:
-        tipo = "Casa"
-    elif "local" in texto_lower:
-        tipo = "Local comercial"
-    elif "oficina" in texto_lower:
-        tipo = "Oficina"
-
     # ----- DESCRIPCIÓN -----
     desc_el = soup.select_one(
         "div[class*=description], div[class*=descripcion], section[class*=description]"
@@ -112,39 +1231,6 @@ def scrapear_propiedad_remax(url_anuncio: str) -> dict:
         else:
             descripcion = "Descripción no disponible en el portal."
 
-    # ----- SUPERFICIE -----
-    superficie = "No especificado"
-    m_sup = re.search(r"(\d{2,4})\s*(m²|m2|m\.2)", texto_lower)
-    if m_sup:
-        superficie = f"{m_sup.group(1)} m² (aprox.)"
-
-    # ----- DORMITORIOS -----
-    dormitorios_amb = "No especificado"
-    m_dorm = re.search(r"(\d+)\s+dormitorio[s]?", texto_lower)
-    if m_dorm:
-        dormitorios_amb = f"{m_dorm.group(1)} dormitorios"
-    elif "monoambiente" in texto_lower:
-        dormitorios_amb = "Monoambiente"
-
-    # ----- BAÑOS -----
-    banios = "No especificado"
-    m_banio = re.search(r"(\d+(?:[.,]\d+)?)\s*bañ[o|os]", texto_lower)
-    if m_banio:
-        cant = m_banio.group(1).replace(",", ".")
-        banios = f"{cant} baños"
-
-    # ----- ESTADO -----
-    estado = "No especificado"
-    if "a estrenar" in texto_lower:
-        estado = "A estrenar"
-    elif "reciclado" in texto_lower:
-        estado = "Reciclado"
-    elif "buen estado" in texto_lower:
-        estado = "Buen estado"
-
-    # ----- COCHERA -----
-    cochera = detectar_cochera(texto_lower)
-
     # ----- IMÁGENES -----
     imagenes: list[str] = []
 
@@ -183,37 +1269,31 @@ def scrapear_propiedad_remax(url_anuncio: str) -> dict:
 
     imagenes = imagenes[:12]
 
-    datos = {
-        "OPERACION": operacion,
-        "TIPO": tipo,
-        "TITULO": titulo,
-        "UBICACION": ubicacion,
-        "PRECIO": precio,
-        "SUPERFICIE": superficie,
-        "DORMITORIOS_AMBIENTES": dormitorios_amb,
-        "BANIOS": banios,
-        "COCHERA": cochera,
-        "ESTADO": estado,
-        "EXPENSAS": "No especificado",
-        "DESTACADOS": "No especificado",
-        "ANIO_CONSTRUCCION": "No especificado",
-        "PISOS": "No especificado",
-        "ORIENTACION": "No especificado",
-        "MASCOTAS": "No especificado",
-        "MOBILIARIO": "No especificado",
-        "DESCRIPCION": descripcion,
-        "IMAGENES": imagenes,
-    }
+    return Ficha(
+        OPERACION=rasgo_operacion(rasgos),
+        TIPO=rasgo_tipo(rasgos),
+        TITULO=titulo,
+        UBICACION=ubicacion,
+        PRECIO=precio,
+        SUPERFICIE=rasgo_superficie(rasgos),
+        DORMITORIOS_AMBIENTES=rasgo_dormitorios(rasgos),
+        BANIOS=rasgo_banios(rasgos),
+        COCHERA=rasgo_cochera(rasgos),
+        ESTADO=rasgo_estado(rasgos),
+        DESCRIPCION=descripcion,
+        IMAGENES=imagenes,
+    )
 
-    return datos
+
+def scrapear_propiedad_century21(url_anuncio: str) -> Ficha:
+    return extraer_propiedad_century21(descargar_html(url_anuncio), url_anuncio)
 
 
-def scrapear_propiedad_century21(url_anuncio: str) -> dict:
-    resp = requests.get(url_anuncio, headers=HEADERS, timeout=20)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+def extraer_propiedad_century21(html: str, url_anuncio: str) -> Ficha:
+    soup = crear_soup(html, url_anuncio)
 
     texto_lower = soup.get_text(" ", strip=True).lower()
+    palabras = escanear_rasgos(texto_lower)["palabras"]
 
     # ---------------------------
     # TÍTULO
@@ -226,7 +1306,7 @@ def scrapear_propiedad_century21(url_anuncio: str) -> dict:
     # ---------------------------
     # PRECIO
     # ---------------------------
-    precio = "No especificado"
+    precio = NO_ESPECIFICADO
     price_el = soup.select_one(".property-price, .price, h2")
     if price_el:
         precio = price_el.get_text(" ", strip=True)
@@ -263,191 +1343,549 @@ def scrapear_propiedad_century21(url_anuncio: str) -> dict:
     desc_lower = desc_text.lower()
 
     # ---------------------------
-    # EXTRACCIÓN POR REGEX DESDE LA DESCRIPCIÓN
+    # EXTRACCIÓN DESDE LA DESCRIPCIÓN
     # ---------------------------
-    def buscar(regex, default="No especificado"):
-        m = re.search(regex, desc_lower)
-        return m.group(1).strip() if m else default
+    rasgos_desc = escanear_rasgos(desc_lower)
 
-    dormitorios = buscar(r"(\d+)\s*dormitorio")
-    banios = buscar(r"(\d+)\s*bañ")
-    cochera = buscar(r"(?:cochera|garage|garaje)[^\d]*(\d+)")
-    superficie = buscar(r"(\d+[.,]?\d*)\s*m²")
+    dormitorios = _primer_numero(rasgos_desc, "dormitorios") or NO_ESPECIFICADO
+    banios = _primer_numero(rasgos_desc, "banios") or NO_ESPECIFICADO
+    m_cochera = _RE_COCHERA_CANTIDAD.search(desc_lower)
+    cochera = m_cochera.group(1) if m_cochera else NO_ESPECIFICADO
+    superficie = rasgo_superficie_m2(rasgos_desc)
 
     if cochera.isdigit():
         cochera = "1 cochera" if cochera == "1" else f"{cochera} cocheras"
 
-    return {
-        "OPERACION": "Alquiler" if "alquiler" in texto_lower else "Venta",
-        "TIPO": "Casa" if "casa" in texto_lower else "Apartamento",
-        "TITULO": titulo,
-        "UBICACION": ubicacion,
-        "PRECIO": precio,
-        "SUPERFICIE": superficie,
-        "DORMITORIOS_AMBIENTES": dormitorios,
-        "BANIOS": banios,
-        "COCHERA": cochera,
-        "ESTADO": "No especificado",
-        "EXPENSAS": "No especificado",
-        "DESTACADOS": "No especificado",
-        "ANIO_CONSTRUCCION": "No especificado",
-        "PISOS": "No especificado",
-        "ORIENTACION": "No especificado",
-        "MASCOTAS": "No especificado",
-        "MOBILIARIO": "No especificado",
-        "DESCRIPCION": desc_text,
-        "IMAGENES": imagenes,
-    }
+    return Ficha(
+        OPERACION="Alquiler" if "alquiler" in palabras else "Venta",
+        TIPO="Casa" if "casa" in palabras else "Apartamento",
+        TITULO=titulo,
+        UBICACION=ubicacion,
+        PRECIO=precio,
+        SUPERFICIE=superficie,
+        DORMITORIOS_AMBIENTES=dormitorios,
+        BANIOS=banios,
+        COCHERA=cochera,
+        DESCRIPCION=desc_text,
+        IMAGENES=imagenes,
+    )
 
-    return datos
 
+# ========= RASGOS DEL TEXTO (ESCANEO ÚNICO) =========
 
-# ========= FUNCIÓN AUXILIAR: DETECTAR COCHERA =========
+COCHERA_NEGATIVOS = (
+    "sin cochera",
+    "no tiene cochera",
+    "no posee cochera",
+    "sin garage",
+    "sin garaje",
+    "no tiene garage",
+    "no tiene garaje",
+    "sin estacionamiento",
+    "no tiene estacionamiento",
+    "sin lugar de garage",
+)
+COCHERA_PALABRAS = ("cochera", "garage", "garaje", "lugar de garage", "estacionamiento")
 
-def detectar_cochera(texto_lower: str) -> str:
-    cochera = "No especificado"
-
-    patrones_negativos = [
-        "sin cochera",
-        "no tiene cochera",
-        "no posee cochera",
-        "sin garage",
-        "sin garaje",
-        "no tiene garage",
-        "no tiene garaje",
-        "sin estacionamiento",
-        "no tiene estacionamiento",
-        "sin lugar de garage",
-    ]
-    if any(pat in texto_lower for pat in patrones_negativos):
-        return "No"
+PALABRAS_CLAVE = frozenset(COCHERA_NEGATIVOS + COCHERA_PALABRAS + (
+    "alquiler", "venta", "se vende",
+    "monoambiente", "apartamento", "apto", "casa", "local", "oficina",
+    "a estrenar", "reciclado", "buen estado",
+))
 
-    # número + palabra: "2 cocheras", "1 cochera", "3 garages"
-    m_coch_num = re.search(
-        r"(\d+)\s+(cochera[s]?|garage[s]?|garaje[s]?|estacionamiento[s]?)", texto_lower
-    )
-    # "cochera para 2 autos"
-    m_coch_para = re.search(
-        r"(cochera|garage|garaje)[^\.]{0,40}?para\s+(\d+)\s+(auto[s]?|vehículo[s]?|coche[s]?)",
-        texto_lower,
-    )
+# Todas las reglas "número + unidad" en una sola alternación: "75 m2", "2 dormitorios",
+# "1,5 baños", "2 cocheras"... La unidad va en lookahead para no consumirla: así los
+# dígitos dentro de "m2" se siguen viendo igual que con las búsquedas por separado.
+# Un "." o "," pegado antes de la unidad ("120.m²") no forma parte del número: va
+# en su propio grupo, como lo dejaba el [.,]?\d* de la regex de Century21.
+_RE_NUMERO_UNIDAD = re.compile(
+    r"(\d+(?:[.,]\d+)?)([.,]?)(\s*)(?=(m²|m2|m\.2|dormitorio|bañ[o|os]|bañ|cochera|garage|garaje|estacionamiento))"
+)
+_RE_DIGITOS_FINALES = re.compile(r"(\d+)$")
+# Century21: "cochera: 2", "garage para 2 autos"
+_RE_COCHERA_CANTIDAD = re.compile(r"(?:cochera|garage|garaje)[^\d]*(\d+)")
+# "cochera para 2 autos": solo se evalúa si hace falta
+_RE_COCHERA_PARA = re.compile(
+    r"(cochera|garage|garaje)[^\.]{0,40}?para\s+(\d+)\s+(auto[s]?|vehículo[s]?|coche[s]?)"
+)
 
-    if m_coch_num:
-        cantidad = int(m_coch_num.group(1))
-        if cantidad == 1:
-            cochera = "1 cochera"
-        else:
-            cochera = f"{cantidad} cocheras"
-    elif m_coch_para:
-        cantidad = int(m_coch_para.group(2))
-        if cantidad == 1:
-            cochera = "1 cochera"
-        else:
-            cochera = f"{cantidad} cocheras"
-    else:
-        if any(palabra in texto_lower
-               for palabra in ["cochera", "garage", "garaje", "lugar de garage", "estacionamiento"]):
-            cochera = "Sí (cantidad no especificada)"
+if ahocorasick is not None:
+    _AUTOMATA_PALABRAS = ahocorasick.Automaton()
+    for _palabra in PALABRAS_CLAVE:
+        _AUTOMATA_PALABRAS.add_word(_palabra, _palabra)
+    _AUTOMATA_PALABRAS.make_automaton()
+else:
+    _AUTOMATA_PALABRAS = None
 
-    return cochera
 
+def _clase_unidad(unidad: str) -> str:
+    if unidad.startswith("m"):
+        return "superficie"
+    if unidad.startswith("dormitorio"):
+        return "dormitorios"
+    if unidad.startswith("bañ"):
+        return "banios"
+    return "cochera"
+
+
+# Cada regla numérica solo usa su primer match válido: cuando todas tienen el suyo
+# se corta el escaneo
+_REGLAS_NUMERICAS = frozenset({
+    "superficie", "superficie_m²", "dormitorios", "dormitorios_espacio",
+    "banios", "banios_completo", "cochera_espacio",
+})
 
-# ========= SCRAPER GENÉRICO =========
 
-def scrapear_propiedad_generico(url_anuncio: str) -> dict:
+def _reglas_cubiertas(clase: str, numero: str, con_espacio: bool, unidad: str) -> set[str]:
+    if clase == "separada":
+        return {"superficie_m²"} if unidad == "m²" else set()
+    if clase == "superficie":
+        reglas = {"superficie_m²"} if unidad == "m²" else set()
+        if len(_RE_DIGITOS_FINALES.search(numero).group(1)) >= 2:
+            reglas.add("superficie")
+        return reglas
+    if clase == "banios":
+        return {"banios"} if unidad == "bañ" else {"banios", "banios_completo"}
+    return {clase, f"{clase}_espacio"} if con_espacio else {clase}
+
+
+def escanear_rasgos(texto_lower: str) -> dict:
     """
-    Scraper genérico mejorado para capturar características de portales
-    que usan listas con iconos (ej: dormitorios, baños, garaje, orientación,
-    superficie, pisos, mascotas, ascensor, etc).
+    Recorre el texto una vez y devuelve lo que encontró: `palabras` (las de
+    PALABRAS_CLAVE presentes, como substring) y `numeros` (cada "número +
+    unidad" en orden, como (clase, número, con_espacio, unidad), hasta tener
+    el primero que le sirve a cada regla). La precedencia entre reglas la
+    aplican las funciones `rasgo_*`.
     """
-    resp = requests.get(url_anuncio, headers=HEADERS, timeout=20)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    if _AUTOMATA_PALABRAS is not None:
+        palabras = {palabra for _, palabra in _AUTOMATA_PALABRAS.iter(texto_lower)}
+    else:
+        palabras = {palabra for palabra in PALABRAS_CLAVE if palabra in texto_lower}
 
-    texto_global = soup.get_text(separator=" ", strip=True)
-    texto_lower = texto_global.lower()
+    numeros = []
+    pendientes = set(_REGLAS_NUMERICAS)
+    for m in _RE_NUMERO_UNIDAD.finditer(texto_lower):
+        numero, separador, espacio, unidad = m.groups()
+        if separador:
+            # "120.m²": solo lo toma la superficie de Century21, que lo devuelve con
+            # el separador y con un único [.,] ("1.200.m²" → "200.")
+            match = ("separada", _RE_DIGITOS_FINALES.search(numero).group(1) + separador,
+                     bool(espacio), unidad)
+        else:
+            match = (_clase_unidad(unidad), numero, bool(espacio), unidad)
+        numeros.append(match)
+        pendientes -= _reglas_cubiertas(*match)
+        if not pendientes:
+            break
 
-    # =============================
-    # 1. TÍTULO
-    # =============================
-    titulo = "Propiedad UrbanRise"
-    og_title = soup.find("meta", property="og:title")
-    if og_title and og_title.get("content"):
-        titulo = og_title["content"].strip()
-    else:
-        h1 = soup.find("h1")
-        if h1:
-            titulo = h1.get_text(strip=True)
-        elif soup.title:
-            titulo = soup.title.get_text(strip=True)
+    return {"palabras": palabras, "numeros": numeros, "texto": texto_lower}
 
-    # =============================
-    # 2. PRECIO
-    # =============================
-    precio = "No especificado"
-    precios = soup.find_all(string=lambda t: t and any(m in t for m in ["USD", "UYU", "$", "U$S"]))
-    if precios:
-        precios = sorted([p.strip() for p in precios], key=len)
-        precio = precios[0]
+
+def _primer_numero(rasgos: dict, clase: str, espacio_obligatorio: bool = False,
+                   solo_entero: bool = True) -> str | None:
+    for clase_num, numero, con_espacio, _ in rasgos["numeros"]:
+        if clase_num != clase or (espacio_obligatorio and not con_espacio):
+            continue
+        if not solo_entero:
+            return numero
+        # "2.5 dormitorios" → "5", igual que un \d+ pegado a la unidad
+        return _RE_DIGITOS_FINALES.search(numero).group(1)
+    return None
+
+
+def rasgo_operacion(rasgos: dict) -> str:
+    palabras = rasgos["palabras"]
+    if "alquiler" in palabras:
+        return "Alquiler"
+    if "venta" in palabras or "se vende" in palabras:
+        return "Venta"
+    return NO_ESPECIFICADO
+
+
+def rasgo_tipo(rasgos: dict) -> str:
+    palabras = rasgos["palabras"]
+    if "monoambiente" in palabras or "apartamento" in palabras or "apto" in palabras:
+        return "Apartamento"
+    if "casa" in palabras:
+        return "Casa"
+    if "local" in palabras:
+        return "Local comercial"
+    if "oficina" in palabras:
+        return "Oficina"
+    return NO_ESPECIFICADO
+
+
+def rasgo_estado(rasgos: dict) -> str:
+    palabras = rasgos["palabras"]
+    if "a estrenar" in palabras:
+        return "A estrenar"
+    if "reciclado" in palabras:
+        return "Reciclado"
+    if "buen estado" in palabras:
+        return "Buen estado"
+    return NO_ESPECIFICADO
+
+
+def rasgo_superficie(rasgos: dict) -> str:
+    for clase, numero, _, _ in rasgos["numeros"]:
+        if clase != "superficie":
+            continue
+        # Equivale a (\d{2,4})\s*m2: los últimos 2 a 4 dígitos antes de la unidad
+        digitos = _RE_DIGITOS_FINALES.search(numero).group(1)[-4:]
+        if len(digitos) >= 2:
+            return f"{digitos} m² (aprox.)"
+    return NO_ESPECIFICADO
+
+
+def rasgo_superficie_m2(rasgos: dict) -> str:
+    # Century21: el número tal cual antes de "m²", separador incluido ("120.m²" → "120.")
+    return next(
+        (numero for _, numero, _, unidad in rasgos["numeros"] if unidad == "m²"),
+        NO_ESPECIFICADO,
+    )
+
+
+def rasgo_dormitorios(rasgos: dict) -> str:
+    cantidad = _primer_numero(rasgos, "dormitorios", espacio_obligatorio=True)
+    if cantidad:
+        return f"{cantidad} dormitorios"
+    if "monoambiente" in rasgos["palabras"]:
+        return "Monoambiente"
+    return NO_ESPECIFICADO
+
+
+def rasgo_banios(rasgos: dict) -> str:
+    for clase, numero, _, unidad in rasgos["numeros"]:
+        # "bañ" a secas solo lo acepta Century21
+        if clase == "banios" and unidad != "bañ":
+            return f"{numero.replace(',', '.')} baños"
+    return NO_ESPECIFICADO
+
+
+def _formatear_cocheras(cantidad: int) -> str:
+    return "1 cochera" if cantidad == 1 else f"{cantidad} cocheras"
+
+
+def rasgo_cochera(rasgos: dict) -> str:
+    palabras = rasgos["palabras"]
+    if any(pat in palabras for pat in COCHERA_NEGATIVOS):
+        return "No"
+
+    # número + palabra: "2 cocheras", "1 cochera", "3 garages"
+    cantidad = _primer_numero(rasgos, "cochera", espacio_obligatorio=True)
+    if cantidad:
+        return _formatear_cocheras(int(cantidad))
+
+    if not any(palabra in palabras for palabra in COCHERA_PALABRAS):
+        return NO_ESPECIFICADO
+
+    # "cochera para 2 autos"
+    m_coch_para = _RE_COCHERA_PARA.search(rasgos["texto"])
+    if m_coch_para:
+        return _formatear_cocheras(int(m_coch_para.group(2)))
+    return "Sí (cantidad no especificada)"
+
+
+def detectar_cochera(texto_lower: str) -> str:
+    return rasgo_cochera(escanear_rasgos(texto_lower))
+
+
+# ========= DATOS ESTRUCTURADOS (JSON-LD / ESTADO EMBEBIDO) =========
+
+_RE_SCRIPT_JSON = re.compile(
+    r"<script\b([^>]*\btype\s*=\s*[\"']?application/(?:ld\+)?json[^>]*)>(.*?)</script\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+
+TIPOS_SCHEMA = {
+    "house": "Casa",
+    "singlefamilyresidence": "Casa",
+    "apartment": "Apartamento",
+    "apartmentcomplex": "Apartamento",
+    "residence": NO_ESPECIFICADO,
+}
+OPERACIONES_SCHEMA = {"leaseout": "Alquiler", "sell": "Venta"}
+_RE_CANTIDAD = re.compile(r"^\d+(?:[.,]\d+)?$")
+
+# Claves habituales en el estado de hidratación (__NEXT_DATA__ y similares)
+CLAVES_ESTADO = {
+    "DORMITORIOS": ("bedrooms", "numberofbedrooms", "dormitorios"),
+    "BANIOS": ("bathrooms", "numberofbathroomstotal", "banos", "baños"),
+    "SUPERFICIE": ("totalarea", "surface", "superficie", "area"),
+    "COCHERA": ("garages", "parkingspaces", "cocheras"),
+}
+
+
+def _nodos_json(valor):
+    """Recorre en profundidad un JSON y devuelve todos sus objetos."""
+    pila = [valor]
+    while pila:
+        actual = pila.pop()
+        if isinstance(actual, dict):
+            yield actual
+            pila.extend(actual.values())
+        elif isinstance(actual, list):
+            pila.extend(reversed(actual))
+
+
+def _tipos_schema(nodo: dict) -> set[str]:
+    tipos = nodo.get("@type", [])
+    if isinstance(tipos, str):
+        tipos = [tipos]
+    return {str(t).lower() for t in tipos}
+
+
+def _texto_json(valor) -> str | None:
+    if isinstance(valor, dict):
+        valor = valor.get("value", valor.get("name"))
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f"{valor:g}"
+    if isinstance(valor, str) and valor.strip():
+        return valor.strip()
+    return None
+
+
+def _urls_imagen(valor) -> list[str]:
+    if isinstance(valor, str):
+        return [valor]
+    if isinstance(valor, dict):
+        url = valor.get("contentUrl") or valor.get("url")
+        return [url] if isinstance(url, str) else []
+    if isinstance(valor, list):
+        return [url for v in valor for url in _urls_imagen(v)]
+    return []
+
+
+def _direccion(valor) -> str | None:
+    if isinstance(valor, str):
+        return valor.strip() or None
+    if isinstance(valor, dict):
+        partes = [valor.get(k) for k in ("streetAddress", "addressLocality", "addressRegion")]
+        partes = [p.strip() for p in partes if isinstance(p, str) and p.strip()]
+        return ", ".join(partes) or None
+    return None
+
+
+def _poner(datos: dict, campo: str, valor):
+    """El primer valor no vacío encontrado para un campo es el que queda."""
+    if valor and campo not in datos:
+        datos[campo] = valor
+
+
+def _datos_schema(nodo: dict, url_anuncio: str, datos: dict):
+    """Completa `datos` con un objeto schema.org (RealEstateListing, Offer, Residence...)."""
+    tipos = _tipos_schema(nodo)
+    _poner(datos, "TITULO", _texto_json(nodo.get("name")))
+    _poner(datos, "DESCRIPCION", _texto_json(nodo.get("description")))
+    imagenes = [urljoin(url_anuncio, u) for u in _urls_imagen(nodo.get("image"))]
+    if imagenes:
+        _poner(datos, "IMAGENES", list(dict.fromkeys(imagenes))[:12])
+    _poner(datos, "UBICACION", _direccion(nodo.get("address")))
+
+    for tipo in tipos:
+        if TIPOS_SCHEMA.get(tipo, NO_ESPECIFICADO) != NO_ESPECIFICADO:
+            _poner(datos, "TIPO", TIPOS_SCHEMA[tipo])
+
+    ofertas = nodo.get("offers")
+    if isinstance(ofertas, list):
+        ofertas = ofertas[0] if ofertas else None
+    if "offer" in tipos:
+        ofertas = nodo
+    if isinstance(ofertas, dict):
+        precio = _texto_json(ofertas.get("price"))
+        if precio:
+            moneda = _texto_json(ofertas.get("priceCurrency"))
+            _poner(datos, "PRECIO", f"{moneda} {precio}" if moneda else precio)
+        funcion = str(ofertas.get("businessFunction", "")).rsplit("/", 1)[-1].rsplit("#", 1)[-1].lower()
+        if funcion in OPERACIONES_SCHEMA:
+            _poner(datos, "OPERACION", OPERACIONES_SCHEMA[funcion])
+
+    # numberOfRooms cuenta todos los ambientes, no los dormitorios
+    dormitorios = _texto_json(nodo.get("numberOfBedrooms"))
+    ambientes = _texto_json(nodo.get("numberOfRooms"))
+    partes = ([f"{dormitorios} dormitorios"] if dormitorios else []) + ([f"{ambientes} ambientes"] if ambientes else [])
+    if partes:
+        _poner(datos, "DORMITORIOS_AMBIENTES", " / ".join(partes))
+    banios = _texto_json(nodo.get("numberOfBathroomsTotal") or nodo.get("numberOfFullBathrooms"))
+    if banios:
+        _poner(datos, "BANIOS", f"{banios} baños")
+    superficie = _texto_json(nodo.get("floorSize"))
+    if superficie:
+        _poner(datos, "SUPERFICIE", f"{superficie} m²")
+    anio = _texto_json(nodo.get("yearBuilt"))
+    if anio:
+        _poner(datos, "ANIO_CONSTRUCCION", anio)
+
+
+def _datos_estado(raiz, datos: dict):
+    """Completa cantidades desde un blob de hidratación con claves conocidas (CLAVES_ESTADO)."""
+    for nodo in _nodos_json(raiz):
+        claves = {str(k).lower(): v for k, v in nodo.items()}
+        for campo, nombres in CLAVES_ESTADO.items():
+            valor = next((_texto_json(claves[n]) for n in nombres if n in claves), None)
+            if not valor or not _RE_CANTIDAD.match(valor):
+                continue  # solo cantidades: "area" o "surface" también aparecen como texto
+            if campo == "DORMITORIOS":
+                _poner(datos, "DORMITORIOS_AMBIENTES", f"{valor} dormitorios")
+            elif campo == "BANIOS":
+                _poner(datos, "BANIOS", f"{valor} baños")
+            elif campo == "SUPERFICIE":
+                _poner(datos, "SUPERFICIE", f"{valor} m²")
+            elif valor.isdigit():
+                _poner(datos, "COCHERA", "1 cochera" if valor == "1" else f"{valor} cocheras")
+
+
+def extraer_datos_estructurados(html: str, url_anuncio: str) -> dict:
+    """
+    Campos de `datos` que el portal ya publica estructurados: JSON-LD
+    (schema.org) primero y, para lo que falte, el JSON de hidratación
+    (<script type="application/json">, ej. __NEXT_DATA__). Se busca con una
+    regex sobre el HTML crudo, sin armar el DOM. Solo devuelve lo encontrado.
+    """
+    datos: dict = {}
+    estados = []
+    for atributos, contenido in _RE_SCRIPT_JSON.findall(html):
+        try:
+            payload = json.loads(contenido.strip())
+        except ValueError:
+            continue
+        if "ld+json" not in atributos.lower():
+            estados.append(payload)
+            continue
+        for nodo in _nodos_json(payload):
+            if _tipos_schema(nodo) & {
+                "realestatelisting", "offer", "product", "residence", "house",
+                "singlefamilyresidence", "apartment", "accommodation",
+            }:
+                _datos_schema(nodo, url_anuncio, datos)
+    for estado in estados:
+        _datos_estado(estado, datos)
+    return datos
+
+
+# ========= SCRAPER GENÉRICO =========
+
+def scrapear_propiedad_generico(url_anuncio: str) -> Ficha:
+    """
+    Scraper genérico mejorado para capturar características de portales
+    que usan listas con iconos (ej: dormitorios, baños, garaje, orientación,
+    superficie, pisos, mascotas, ascensor, etc).
+    """
+    return extraer_propiedad_generico(descargar_html(url_anuncio), url_anuncio)
+
+
+def extraer_propiedad_generico(html: str, url_anuncio: str) -> Ficha:
+    # Lo que el portal publica estructurado (JSON-LD / hidratación) no se busca en el DOM
+    estructurados = extraer_datos_estructurados(html, url_anuncio)
+    soup = None
+
+    def dom():
+        """El DOM completo se arma recién cuando algún campo no vino estructurado."""
+        nonlocal soup
+        if soup is None:
+            soup = crear_soup(html, url_anuncio)
+        return soup
+
+    # =============================
+    # 1. TÍTULO
+    # =============================
+    titulo = estructurados.get("TITULO")
+    if titulo is None:
+        titulo = "Propiedad UrbanRise"
+        og_title = dom().find("meta", property="og:title")
+        if og_title and og_title.get("content"):
+            titulo = og_title["content"].strip()
+        else:
+            h1 = dom().find("h1")
+            if h1:
+                titulo = h1.get_text(strip=True)
+            elif dom().title:
+                titulo = dom().title.get_text(strip=True)
+
+    # =============================
+    # 2. PRECIO
+    # =============================
+    precio = estructurados.get("PRECIO")
+    if precio is None:
+        precio = NO_ESPECIFICADO
+        precios = dom().find_all(string=lambda t: t and any(m in t for m in ["USD", "UYU", "$", "U$S"]))
+        if precios:
+            precios = sorted([p.strip() for p in precios], key=len)
+            precio = precios[0]
 
     # =============================
     # 3. UBICACIÓN
     # =============================
-    ubicacion = "No especificada"
-    migas = soup.select(".breadcrumb, nav.breadcrumb, ol.breadcrumb")
-    if migas:
-        ubicacion = " / ".join(migas[0].get_text(" ", strip=True).split())
+    ubicacion = estructurados.get("UBICACION")
+    if ubicacion is None:
+        ubicacion = "No especificada"
+        migas = dom().select(".breadcrumb, nav.breadcrumb, ol.breadcrumb")
+        if migas:
+            ubicacion = " / ".join(migas[0].get_text(" ", strip=True).split())
 
     # =============================
     # 4. OPERACIÓN
     # =============================
-    operacion = "Alquiler" if "alquiler" in texto_lower else "Venta" if "venta" in texto_lower else "No especificado"
+    operacion = estructurados.get("OPERACION")
+    if operacion is None:
+        texto_lower = dom().get_text(separator=" ", strip=True).lower()
+        palabras = escanear_rasgos(texto_lower)["palabras"]
+        operacion = "Alquiler" if "alquiler" in palabras else "Venta" if "venta" in palabras else NO_ESPECIFICADO
 
     # =============================
     # 5. DESCRIPCIÓN
     # =============================
-    desc_el = soup.select_one("div[class*=description], div[class*=descripcion]")
-    if desc_el:
-        descripcion = desc_el.get_text(" ", strip=True)
-    else:
-        parrafos = [p.get_text(" ", strip=True) for p in soup.find_all("p")]
-        largos = [p for p in parrafos if len(p) > 100]
-        descripcion = "\n\n".join(largos[:3]) if largos else "Descripción no disponible."
+    descripcion = estructurados.get("DESCRIPCION")
+    if descripcion is None:
+        desc_el = dom().select_one("div[class*=description], div[class*=descripcion]")
+        if desc_el:
+            descripcion = desc_el.get_text(" ", strip=True)
+        else:
+            parrafos = [p.get_text(" ", strip=True) for p in dom().find_all("p")]
+            largos = [p for p in parrafos if len(p) > 100]
+            descripcion = "\n\n".join(largos[:3]) if largos else "Descripción no disponible."
 
     # ==================================================
     # 6. CAPTURA de características con iconos UL > LI
     # ==================================================
+    campos_lista = (
+        "DORMITORIOS_AMBIENTES", "BANIOS", "COCHERA", "SUPERFICIE", "ORIENTACION",
+        "PISOS", "MASCOTAS", "ANIO_CONSTRUCCION", "DESTACADOS", "MOBILIARIO",
+    )
     caracteristicas = {}
 
-    for li in soup.select("ul li"):
-        texto = li.get_text(" ", strip=True).replace(" :", ":").replace(": ", ":")
-        if ":" not in texto:
-            continue
-        key, value = texto.split(":", 1)
-        key = key.strip().lower()
-        value = value.strip()
+    if not all(campo in estructurados for campo in campos_lista):
+        for li in dom().select("ul li"):
+            texto = li.get_text(" ", strip=True).replace(" :", ":").replace(": ", ":")
+            if ":" not in texto:
+                continue
+            key, value = texto.split(":", 1)
+            key = key.strip().lower()
+            value = value.strip()
 
-        caracteristicas[key] = value
+            caracteristicas[key] = value
 
     # =============================
     # 7. MAPEO AUTOMÁTICO
     # =============================
-    def get_carac(keys: list[str], default="No especificado"):
+    def get_carac(campo: str, keys: list[str], default=NO_ESPECIFICADO):
+        if campo in estructurados:
+            return estructurados[campo]
         for k in keys:
             if k.lower() in caracteristicas:
                 return caracteristicas[k.lower()]
         return default
 
-    dormitorios = get_carac(["dormitorios", "dormitorio"])
-    banios = get_carac(["baños", "baño"])
-    garaje = get_carac(["garaje", "garage", "cochera"])
-    superficie = get_carac(["superficie", "superficie construida", "m2"])
-    orientacion = get_carac(["orientación", "orientacion"])
-    pisos = get_carac(["pisos edificio", "piso"])
-    mascotas = get_carac(["acepta mascotas", "mascotas"])
-    anio = get_carac(["año de construcción", "anio de construccion"])
-    destacados = get_carac(["amenities", "comodidades"])
-    mobiliario = get_carac(["mobiliario", "amoblado"])
+    dormitorios = get_carac("DORMITORIOS_AMBIENTES", ["dormitorios", "dormitorio"])
+    banios = get_carac("BANIOS", ["baños", "baño"])
+    garaje = get_carac("COCHERA", ["garaje", "garage", "cochera"])
+    superficie = get_carac("SUPERFICIE", ["superficie", "superficie construida", "m2"])
+    orientacion = get_carac("ORIENTACION", ["orientación", "orientacion"])
+    pisos = get_carac("PISOS", ["pisos edificio", "piso"])
+    mascotas = get_carac("MASCOTAS", ["acepta mascotas", "mascotas"])
+    anio = get_carac("ANIO_CONSTRUCCION", ["año de construcción", "anio de construccion"])
+    destacados = get_carac("DESTACADOS", ["amenities", "comodidades"])
+    mobiliario = get_carac("MOBILIARIO", ["mobiliario", "amoblado"])
 
     # Si garaje es número → normalizar
     if re.match(r"^\d+$", garaje):
@@ -456,65 +1894,172 @@ def scrapear_propiedad_generico(url_anuncio: str) -> dict:
     # =============================
     # 8. IMÁGENES
     # =============================
-    imagenes = []
-    for img in soup.find_all("img"):
-        src = img.get("data-src") or img.get("src")
-        if not src:
-            continue
-        src_abs = urljoin(url_anuncio, src)
-        if any(x in src_abs.lower() for x in ["icon", "logo", "placeholder"]):
-            continue
-        if src_abs not in imagenes:
-            imagenes.append(src_abs)
-    imagenes = imagenes[:12]
+    imagenes = estructurados.get("IMAGENES")
+    if imagenes is None:
+        imagenes = []
+        for img in dom().find_all("img"):
+            src = img.get("data-src") or img.get("src")
+            if not src:
+                continue
+            src_abs = urljoin(url_anuncio, src)
+            if any(x in src_abs.lower() for x in ["icon", "logo", "placeholder"]):
+                continue
+            if src_abs not in imagenes:
+                imagenes.append(src_abs)
+        imagenes = imagenes[:12]
 
     # =============================
     # RESPUESTA FINAL
     # =============================
-    return {
-        "OPERACION": operacion,
-        "TIPO": "No especificado",
-        "TITULO": titulo,
-        "UBICACION": ubicacion,
-        "PRECIO": precio,
-        "SUPERFICIE": superficie,
-        "DORMITORIOS_AMBIENTES": dormitorios,
-        "BANIOS": banios,
-        "COCHERA": garaje,
-        "ESTADO": "No especificado",
-        "EXPENSAS": "No especificado",
-        "DESTACADOS": destacados,
-        "ANIO_CONSTRUCCION": anio,
-        "PISOS": pisos,
-        "ORIENTACION": orientacion,
-        "MASCOTAS": mascotas,
-        "MOBILIARIO": mobiliario,
-        "DESCRIPCION": descripcion,
-        "IMAGENES": imagenes,
-    }
+    return Ficha(
+        OPERACION=operacion,
+        TIPO=estructurados.get("TIPO", NO_ESPECIFICADO),
+        TITULO=titulo,
+        UBICACION=ubicacion,
+        PRECIO=precio,
+        SUPERFICIE=superficie,
+        DORMITORIOS_AMBIENTES=dormitorios,
+        BANIOS=banios,
+        COCHERA=garaje,
+        DESTACADOS=destacados,
+        ANIO_CONSTRUCCION=anio,
+        PISOS=pisos,
+        ORIENTACION=orientacion,
+        MASCOTAS=mascotas,
+        MOBILIARIO=mobiliario,
+        DESCRIPCION=descripcion,
+        IMAGENES=imagenes,
+    )
 
-    return datos
 
-def scrapear_propiedad_mercadolibre(url_anuncio: str) -> dict:
+def scrapear_propiedad_mercadolibre(url_anuncio: str) -> Ficha:
     """
     Scraper especializado para MercadoLibre Uruguay.
     Obtiene características desde la API oficial:
-    https://api.mercadolibre.com/items/MLUxxxxxxx
+    https://api.mercadolibre.com/items?ids=MLUxxxxxxx (vía `loteador_mercadolibre`)
+    """
+    return extraer_propiedad_mercadolibre(loteador_mercadolibre.pedir(id_item_mercadolibre(url_anuncio)).result())
+
+
+class LoteadorMercadoLibre:
+    """
+    Junta los ids de MercadoLibre pedidos al mismo tiempo y los trae con el
+    multiget `/items?ids=` de a `max_ids`, más las descripciones
+    (`/items/{id}/description`) en paralelo. Cada `pedir` devuelve un Future
+    con el ítem (con `plain_text` de la descripción); un id ya pedido y
+    todavía en curso comparte el mismo Future.
     """
+
+    def __init__(self, api_url: str, max_ids: int, ventana: float, workers: int):
+        self.api_url = api_url
+        self.max_ids = max_ids
+        self.ventana = ventana
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pendientes: dict[str, Future] = {}
+        self._en_curso: dict[str, Future] = {}
+        self._timer: threading.Timer | None = None
+        self._executors: dict[str, ThreadPoolExecutor] = {}
+
+    def _obtener_executor(self, nombre: str) -> ThreadPoolExecutor:
+        # Multigets y descripciones en pools separados: un multiget espera sus descripciones
+        with self._lock:
+            if nombre not in self._executors:
+                self._executors[nombre] = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix=f"mercadolibre-{nombre}"
+                )
+            return self._executors[nombre]
+
+    def pedir(self, item_id: str) -> Future:
+        with self._lock:
+            futuro = self._pendientes.get(item_id) or self._en_curso.get(item_id)
+            if futuro is not None:
+                return futuro
+            futuro = self._pendientes[item_id] = Future()
+            lleno = len(self._pendientes) >= self.max_ids
+            if not lleno and self._timer is None:
+                self._timer = threading.Timer(self.ventana, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if lleno:
+            # El multiget corre en el pool: quien pidió el id número `max_ids` no lo espera
+            self._obtener_executor("multiget").submit(self.flush)
+        return futuro
+
+    def flush(self):
+        with self._lock:
+            lote, self._pendientes = self._pendientes, {}
+            self._en_curso.update(lote)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        ids = list(lote)
+        for i in range(0, len(ids), self.max_ids):
+            self._buscar({item_id: lote[item_id] for item_id in ids[i:i + self.max_ids]})
+
+    def _descripcion(self, item_id: str) -> str | None:
+        try:
+            resp = cliente_http.get(f"{self.api_url}/items/{item_id}/description")
+        except requests.RequestException:
+            return None
+        if resp.status_code != 200:
+            return None
+        return resp.json().get("plain_text")
+
+    def _buscar(self, lote: dict[str, Future]):
+        try:
+            resp = cliente_http.get(f"{self.api_url}/items", params={"ids": ",".join(lote)})
+            if resp.status_code != 200:
+                raise RuntimeError(f"Error API MercadoLibre: {resp.text}")
+            # Una entrada {"code", "body"} por id, en el orden pedido
+            respuestas = dict(zip(lote, resp.json()))
+            encontrados = [item_id for item_id, r in respuestas.items() if r.get("code") == 200]
+            descripciones = dict(zip(encontrados, self._obtener_executor("descripciones").map(self._descripcion, encontrados)))
+
+            for item_id, futuro in lote.items():
+                respuesta = respuestas.get(item_id)
+                if respuesta is None or respuesta.get("code") != 200:
+                    cuerpo = respuesta.get("body") if respuesta else "sin respuesta"
+                    futuro.set_exception(RuntimeError(f"Error API MercadoLibre: {cuerpo}"))
+                    continue
+                item = respuesta["body"]
+                if descripciones.get(item_id):
+                    item = {**item, "plain_text": descripciones[item_id]}
+                futuro.set_result(item)
+        except Exception as e:
+            for futuro in lote.values():
+                if not futuro.done():
+                    futuro.set_exception(e)
+        finally:
+            with self._lock:
+                for item_id in lote:
+                    self._en_curso.pop(item_id, None)
+
+    def cerrar(self):
+        with self._lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+loteador_mercadolibre = LoteadorMercadoLibre(
+    MERCADOLIBRE_API_URL, MERCADOLIBRE_MAX_IDS, MERCADOLIBRE_VENTANA, MERCADOLIBRE_WORKERS
+)
+
+
+_RE_ID_MERCADOLIBRE = re.compile(r"(MLU)-?(\d+)", re.IGNORECASE)
+
+
+def id_item_mercadolibre(url_anuncio: str) -> str:
     # Extraer ID del tipo MLU-654021285 o MLU654021285
-    m = re.search(r"(MLU)-?(\d+)", url_anuncio, re.IGNORECASE)
+    m = _RE_ID_MERCADOLIBRE.search(url_anuncio)
     if not m:
         raise RuntimeError("No se pudo extraer el ID de MercadoLibre desde la URL")
 
-    item_id = f"{m.group(1).upper()}{m.group(2)}"  # MLU654021285
+    return f"{m.group(1).upper()}{m.group(2)}"  # MLU654021285
 
-    api_url = f"https://api.mercadolibre.com/items/{item_id}"
-    api_resp = requests.get(api_url, timeout=20)
-    if api_resp.status_code != 200:
-        raise RuntimeError(f"Error API MercadoLibre: {api_resp.text}")
-
-    data = api_resp.json()
 
+def extraer_propiedad_mercadolibre(data: dict) -> Ficha:
     # -----------------------------
     # TITULO
     # -----------------------------
@@ -523,7 +2068,7 @@ def scrapear_propiedad_mercadolibre(url_anuncio: str) -> dict:
     # -----------------------------
     # PRECIO
     # -----------------------------
-    precio = data.get("price", "No especificado")
+    precio = data.get("price", NO_ESPECIFICADO)
 
     # -----------------------------
     # IMAGENES
@@ -537,31 +2082,25 @@ def scrapear_propiedad_mercadolibre(url_anuncio: str) -> dict:
 
     def get(attr_name):
         attr_name = attr_name.lower()
-        return atributos.get(attr_name, "No especificado")
-
-    datos = {
-        "OPERACION": "Alquiler" if "alquiler" in titulo.lower() else "Venta",
-        "TIPO": get("tipo de propiedad"),
-        "TITULO": titulo,
-        "UBICACION": get("ubicación") or data.get("location", {}).get("address_line", "No especificada"),
-        "PRECIO": f"USD {precio}" if isinstance(precio, (int, float)) else precio,
-        "SUPERFICIE": get("superficie total"),
-        "DORMITORIOS_AMBIENTES": get("dormitorios"),
-        "BANIOS": get("baños"),
-        "COCHERA": get("cocheras"),
-        "ESTADO": "No especificado",
-        "EXPENSAS": "No especificado",
-        "DESTACADOS": "No especificado",
-        "ANIO_CONSTRUCCION": get("año de construcción"),
-        "PISOS": get("cantidad de pisos"),
-        "ORIENTACION": get("orientación"),
-        "MASCOTAS": get("acepta mascotas"),
-        "MOBILIARIO": "No especificado",
-        "DESCRIPCION": data.get("plain_text", "Descripción no disponible."),
-        "IMAGENES": imagenes,
-    }
+        return atributos.get(attr_name, NO_ESPECIFICADO)
 
-    return datos
+    return Ficha(
+        OPERACION="Alquiler" if "alquiler" in titulo.lower() else "Venta",
+        TIPO=get("tipo de propiedad"),
+        TITULO=titulo,
+        UBICACION=get("ubicación") or data.get("location", {}).get("address_line", "No especificada"),
+        PRECIO=f"USD {precio}" if isinstance(precio, (int, float)) else precio,
+        SUPERFICIE=get("superficie total"),
+        DORMITORIOS_AMBIENTES=get("dormitorios"),
+        BANIOS=get("baños"),
+        COCHERA=get("cocheras"),
+        ANIO_CONSTRUCCION=get("año de construcción"),
+        PISOS=get("cantidad de pisos"),
+        ORIENTACION=get("orientación"),
+        MASCOTAS=get("acepta mascotas"),
+        DESCRIPCION=data.get("plain_text", "Descripción no disponible."),
+        IMAGENES=imagenes,
+    )
 
 
 
@@ -572,85 +2111,2103 @@ PORTAL_SCRAPERS = {
     "remax.com.uy": scrapear_propiedad_remax,
     "www.century21.com.uy": scrapear_propiedad_century21,
     "century21.com.uy": scrapear_propiedad_century21,
+    "articulo.mercadolibre.com.uy": scrapear_propiedad_mercadolibre,
+    "inmueble.mercadolibre.com.uy": scrapear_propiedad_mercadolibre,
+    "casa.mercadolibre.com.uy": scrapear_propiedad_mercadolibre,
+    "apartamento.mercadolibre.com.uy": scrapear_propiedad_mercadolibre,
+    "www.mercadolibre.com.uy": scrapear_propiedad_mercadolibre,
+    "mercadolibre.com.uy": scrapear_propiedad_mercadolibre,
+}
+
+
+# Límites de descarga propios de cada portal (ver LimitadorPorHost); lo que no se
+# indica sale de la configuración general, y LIMITES_POR_PORTAL los pisa por host
+LIMITES_PORTALES = {
+    "www.remax.com.uy": {"max_concurrentes": 2, "latencia_objetivo": 4.0, "intervalo": 1.0},
+    "remax.com.uy": {"max_concurrentes": 2, "latencia_objetivo": 4.0, "intervalo": 1.0},
+    "www.century21.com.uy": {"max_concurrentes": 4},
+    "century21.com.uy": {"max_concurrentes": 4},
+}
+
+
+# Parte de parseo de cada scraper HTML: recibe el HTML ya descargado
+EXTRACTORES_HTML = {
+    scrapear_propiedad_remax: extraer_propiedad_remax,
+    scrapear_propiedad_century21: extraer_propiedad_century21,
+    scrapear_propiedad_generico: extraer_propiedad_generico,
 }
 
 
 def elegir_scraper(url_anuncio: str):
     dominio = urlparse(url_anuncio).netloc.lower()
-    if dominio in PORTAL_SCRAPERS:
-        return PORTAL_SCRAPERS[dominio]
-    return scrapear_propiedad_generico
+    scraper = PORTAL_SCRAPERS.get(dominio, scrapear_propiedad_generico)
+    if scraper is scrapear_propiedad_mercadolibre and not _RE_ID_MERCADOLIBRE.search(url_anuncio):
+        # Listados, búsquedas...: sin id de item no hay API; se scrapea la página como cualquier otra
+        return scrapear_propiedad_generico
+    return scraper
 
 
 # ========= GENERACIÓN HTML =========
 
-def generar_html(datos: dict) -> str:
-    template_path = Path("ficha_template.html")
-    if not template_path.exists():
-        raise RuntimeError("No se encuentra ficha_template.html en el directorio del servicio.")
+_RE_COMENTARIO_HTML = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_RE_ESPACIO_TRAS_TAG = re.compile(r">\s*\n\s*")
+_RE_ESPACIO_ANTES_TAG = re.compile(r"\s*\n\s*<")
+_RE_ESPACIO_LINEA = re.compile(r"\s*\n\s*")
+_RE_COMENTARIO_CSS = re.compile(r"/\*.*?\*/", re.S)
+_RE_ESPACIO_CSS = re.compile(r"\s*([{}:;,>])\s*")
+_RE_STYLE = re.compile(r"[ \t]*<style[^>]*>(.*?)</style>[ \t]*\n?", re.S | re.I)
 
-    template = template_path.read_text(encoding="utf-8")
 
-    galeria_html = ""
-    for url in datos.get("IMAGENES", []):
-        galeria_html += f'<img src="{url}" alt="Foto de la propiedad">\n'
+def minificar_html(texto: str) -> str:
+    """
+    Saca comentarios y la indentación: los saltos de línea (con sus espacios)
+    pegados a un tag desaparecen y los que quedan entre texto pasan a un
+    espacio. Pensado para la plantilla, no para los valores: la DESCRIPCION
+    se inserta después y conserva sus saltos de línea.
+    """
+    texto = _RE_COMENTARIO_HTML.sub("", texto)
+    texto = _RE_ESPACIO_TRAS_TAG.sub(">", texto)
+    texto = _RE_ESPACIO_ANTES_TAG.sub("<", texto)
+    return _RE_ESPACIO_LINEA.sub(" ", texto).strip()
 
-    html = template.format(
-        LOGO_URL=LOGO_URL,
-        GALERIA_IMAGENES=galeria_html,
-        **datos
-    )
-    return html
 
+def minificar_css(css: str) -> str:
+    css = _RE_COMENTARIO_CSS.sub("", css)
+    css = " ".join(css.split())
+    return _RE_ESPACIO_CSS.sub(r"\1", css).replace(";}", "}")
 
-# ========= SUBIDA A GITHUB =========
 
-def subir_a_github(html: str, slug: str) -> str:
-    api_url = f"https://api.github.com/repos/{GITHUB_USER}/{REPO_NAME}/contents/fichas/{slug}.html"
+class PlantillaFicha:
+    """
+    ficha_template.html cargada una sola vez y partida en tramos fijos y
+    campos (`{CAMPO}` de str.format). Se vuelve a leer solo si cambia el
+    mtime del archivo. Los valores de `datos` se escapan como HTML.
+    Con `optimizar`, al cargarla se minifica y el CSS inline se reemplaza
+    por un <link> a una hoja aparte (ver `hoja_estilos`).
+    """
+
+    def __init__(self, path: Path, optimizar: bool = False):
+        self.path = path
+        self.optimizar = optimizar
+        self._lock = threading.Lock()
+        self._mtime: float | None = None
+        self._tramos: list[tuple[str, str | None, str]] = []
+        self._estilos: tuple[str, bytes] | None = None
+
+    def _cargar(self) -> list[tuple[str, str | None, str]]:
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            raise RuntimeError("No se encuentra ficha_template.html en el directorio del servicio.")
+        with self._lock:
+            if mtime != self._mtime:
+                texto = self.path.read_text(encoding="utf-8")
+                estilos = None
+                if self.optimizar:
+                    texto, estilos = self._separar_estilos(texto)
+                    texto = minificar_html(texto)
+                self._tramos = [
+                    (literal, campo, spec or "")
+                    for literal, campo, spec, _ in string.Formatter().parse(texto)
+                ]
+                self._estilos = estilos
+                self._mtime = mtime
+            return self._tramos
+
+    @staticmethod
+    def _separar_estilos(texto: str) -> tuple[str, tuple[str, bytes] | None]:
+        bloques = _RE_STYLE.findall(texto)
+        if not bloques:
+            return texto, None
+        # En la plantilla las llaves del CSS van dobladas por str.format
+        css = minificar_css("".join(bloques).replace("{{", "{").replace("}}", "}")).encode("utf-8")
+        nombre = f"estilos-{hashlib.sha256(css).hexdigest()[:12]}.css"
+        link = f'<link rel="stylesheet" href="{nombre}">\n'
+        texto = _RE_STYLE.sub("", _RE_STYLE.sub(link, texto, count=1))
+        return texto, (f"fichas/{nombre}", css)
+
+    def hoja_estilos(self) -> tuple[str, bytes] | None:
+        """(ruta en el repo, contenido) de la hoja que enlaza la versión vigente de la plantilla."""
+        self._cargar()
+        with self._lock:
+            return self._estilos
+
+    @staticmethod
+    def _imagen(url: str, tamanios: list | None, principal: bool) -> tuple[str, str]:
+        """Devuelve el <img> de la galería y los atributos para precargarlo."""
+        carga = 'fetchpriority="high"' if principal else 'loading="lazy"'
+        if not tamanios:
+            src = html_lib.escape(url)
+            return (
+                f'<img src="{src}" {carga} decoding="async" alt="Foto de la propiedad">',
+                f'href="{src}"',
+            )
+        # Miniaturas publicadas junto a la ficha (fichas/img/): el navegador elige el ancho
+        nombre, ancho, alto = tamanios[0]
+        srcset = ", ".join(f"img/{nombre} {ancho}w" for nombre, ancho, _ in tamanios)
+        sizes = "(max-width: 600px) 100vw, 50vw"
+        return (
+            f'<img src="img/{nombre}" srcset="{srcset}" sizes="{sizes}" width="{ancho}" height="{alto}" '
+            f'{carga} decoding="async" alt="Foto de la propiedad">',
+            f'href="img/{nombre}" imagesrcset="{srcset}" imagesizes="{sizes}"',
+        )
+
+    def _valores(self, datos: Ficha) -> dict:
+        valores = {campo: html_lib.escape(str(getattr(datos, campo))) for campo in CAMPOS_TEXTO}
+        valores["LOGO_URL"] = html_lib.escape(LOGO_URL)
+        imagenes = [
+            self._imagen(url, datos.MINIATURAS.get(url), i == 0)
+            for i, url in enumerate(datos.IMAGENES)
+        ]
+        valores["GALERIA_IMAGENES"] = "".join(img for img, _ in imagenes)
+        # La primera foto es la que se ve al abrir la ficha: se pide junto con el HTML
+        valores["PRECARGA_IMAGEN"] = f'<link rel="preload" as="image" {imagenes[0][1]}>' if imagenes else ""
+        return valores
+
+    @staticmethod
+    def _unir(tramos, valores: dict) -> str:
+        partes = []
+        for literal, campo, spec in tramos:
+            partes.append(literal)
+            if campo is not None:
+                valor = valores[campo]
+                partes.append(format(valor, spec) if spec else valor)
+        return "".join(partes)
+
+    def renderizar(self, datos: Ficha) -> str:
+        return self._unir(self._cargar(), self._valores(datos))
+
+    def renderizar_lote(self, lista_datos: list[Ficha]) -> list[str]:
+        tramos = self._cargar()  # un solo stat para todo el lote
+        return [self._unir(tramos, self._valores(datos)) for datos in lista_datos]
+
+
+plantilla_ficha = PlantillaFicha(FICHA_TEMPLATE_PATH, FICHAS_OPTIMIZAR)
+
+
+class EstilosFichas:
+    """
+    Publica en fichas/ la hoja de estilos que enlazan las fichas, una vez por
+    versión: cada ficha la referencia por nombre con hash, así que se cachea
+    en el navegador y no viaja en cada commit. Si ya estaba en el repo (ej.
+    tras un reinicio) el tree no cambia y no se genera commit. Los primeros
+    publicadores simultáneos esperan al que la sube (`_publicar_lock`).
+    """
+
+    def __init__(self, plantilla: PlantillaFicha):
+        self.plantilla = plantilla
+        self._lock = threading.Lock()
+        self._publicar_lock = threading.Lock()
+        self._publicadas: set[str] = set()
+
+    def pendientes(self) -> dict[str, bytes]:
+        estilos = self.plantilla.hoja_estilos()
+        if estilos is None:
+            return {}
+        ruta, contenido = estilos
+        with self._lock:
+            return {} if ruta in self._publicadas else {ruta: contenido}
+
+    def marcar_publicadas(self, rutas):
+        with self._lock:
+            self._publicadas.update(rutas)
+
+    def asegurar(self):
+        """Publica la hoja vigente si todavía no se hizo (antes de la primera ficha que la usa)."""
+        if not self.pendientes():
+            return
+        with self._publicar_lock:
+            pendientes = self.pendientes()  # otro hilo pudo haberla subido mientras se esperaba
+            if pendientes:
+                publicador_git.commitear_binarios(pendientes)
+                self.marcar_publicadas(pendientes)
+
+
+estilos_fichas = EstilosFichas(plantilla_ficha)
+
 
-    message = f"Crear/actualizar ficha {slug}"
-    content = base64.b64encode(html.encode("utf-8")).decode("utf-8")
+def generar_html(datos: Ficha) -> str:
+    return plantilla_ficha.renderizar(datos)
 
-    headers = {
+
+def generar_html_lote(lista_datos: list[Ficha]) -> list[str]:
+    return plantilla_ficha.renderizar_lote(lista_datos)
+
+
+# ========= SUBIDA A GITHUB =========
+
+def github_headers() -> dict:
+    return {
         "Authorization": f"Bearer {GITHUB_TOKEN}",
         "Accept": "application/vnd.github+json",
     }
 
-    resp_get = requests.get(api_url, headers=headers)
-    data = {"message": message, "content": content}
 
+def url_contents_ficha(slug: str) -> str:
+    return f"{GITHUB_API_URL}/repos/{GITHUB_USER}/{REPO_NAME}/contents/fichas/{slug}.html"
+
+
+def url_publica_ficha(slug: str) -> str:
+    return f"https://{GITHUB_USER}.github.io/{REPO_NAME}/fichas/{slug}.html"
+
+
+def sha_blob_git(contenido: bytes) -> str:
+    """SHA que git (y GitHub) asigna a un blob con este contenido."""
+    return hashlib.sha1(b"blob %d\0" % len(contenido) + contenido).hexdigest()
+
+
+class IndiceSHA:
+    """
+    Índice en memoria slug → SHA del blob publicado en fichas/.
+    Se llena con un solo listado del tree al arrancar y se mantiene al día
+    con cada subida, así `subir_a_github` no necesita un GET previo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shas: dict[str, str] = {}
+        self.cargado = False
+
+    def cargar(self) -> int:
+        api_url = f"{GITHUB_API_URL}/repos/{GITHUB_USER}/{REPO_NAME}/git/trees/{GITHUB_BRANCH}:fichas"
+        resp = cliente_http.get(api_url, headers=github_headers(), timeout=GITHUB_TIMEOUT)
+        if resp.status_code == 404:
+            shas = {}  # todavía no existe la carpeta fichas/
+        elif resp.status_code != 200:
+            raise RuntimeError(f"Error listando fichas en GitHub: {resp.status_code} {resp.text}")
+        else:
+            shas = {
+                entrada["path"][: -len(".html")]: entrada["sha"]
+                for entrada in resp.json().get("tree", [])
+                if entrada.get("type") == "blob" and entrada["path"].endswith(".html")
+            }
+        with self._lock:
+            self._shas = shas
+            self.cargado = True
+        return len(shas)
+
+    def obtener(self, slug: str) -> str | None:
+        with self._lock:
+            return self._shas.get(slug)
+
+    def actualizar(self, slug: str, sha: str):
+        with self._lock:
+            self._shas[slug] = sha
+
+
+indice_sha = IndiceSHA()
+
+
+def _buscar_sha_remoto(api_url: str, headers: dict) -> str | None:
+    with medir("github_get"):
+        resp_get = cliente_http.get(api_url, headers=headers, timeout=GITHUB_TIMEOUT)
+    if resp_get.status_code == 200:
+        return resp_get.json().get("sha")
+    return None
+
+
+def _cuerpo_put_ficha(html: str, slug: str, sha: str | None) -> str:
+    data = {
+        "message": f"Crear/actualizar ficha {slug}",
+        "content": base64.b64encode(html.encode("utf-8")).decode("utf-8"),
+    }
+    if sha:
+        data["sha"] = sha
+    return json.dumps(data)
+
+
+def subir_a_github(html: str, slug: str) -> str:
+    api_url = url_contents_ficha(slug)
+    headers = github_headers()
+
+    if indice_sha.cargado:
+        sha = indice_sha.obtener(slug)
+    else:
+        sha = _buscar_sha_remoto(api_url, headers)
+
+    def put(sha: str | None):
+        with medir("github_put"):
+            return cliente_http.put(
+                api_url, headers=headers, data=_cuerpo_put_ficha(html, slug, sha), timeout=GITHUB_TIMEOUT
+            )
+
+    resp_put = put(sha)
+    if resp_put.status_code in (409, 422):
+        # El índice estaba desactualizado (otro proceso tocó el archivo): se consulta y reintenta
+        resp_put = put(_buscar_sha_remoto(api_url, headers))
+
+    if resp_put.status_code not in (200, 201):
+        raise RuntimeError(f"Error subiendo a GitHub: {resp_put.status_code} {resp_put.text}")
+
+    sha_nuevo = resp_put.json().get("content", {}).get("sha")
+    if sha_nuevo:
+        indice_sha.actualizar(slug, sha_nuevo)
+
+    return url_publica_ficha(slug)
+
+
+def ficha_sin_cambios(html: str, slug: str) -> bool:
+    """
+    True si fichas/{slug}.html ya tiene exactamente este contenido en GitHub.
+    Compara el SHA de blob calculado localmente contra el índice (o, si el
+    índice no se pudo cargar, contra una consulta puntual).
+    """
+    sha_local = sha_blob_git(html.encode("utf-8"))
+    if indice_sha.cargado:
+        return indice_sha.obtener(slug) == sha_local
+    return _buscar_sha_remoto(url_contents_ficha(slug), github_headers()) == sha_local
+
+
+def publicar_ficha(html: str, slug: str) -> dict:
+    """
+    Sube la ficha salvo que no haya cambiado: ahorra el commit y el rebuild de Pages.
+    Publicaciones simultáneas del mismo slug y contenido comparten una sola subida;
+    con otro contenido esperan a la anterior (así el SHA del índice ya está al día).
+    """
+    return vuelos_publicacion.hacer(slug, _publicar_ficha, html, slug, firma=sha_blob_git(html.encode("utf-8")))
+
+
+def _publicar_ficha(html: str, slug: str) -> dict:
+    if ficha_sin_cambios(html, slug):
+        return {"url_ficha": url_publica_ficha(slug), "unchanged": True}
+    estilos_fichas.asegurar()
+    return {"url_ficha": subir_a_github(html, slug), "unchanged": False}
+
+
+# ----- Versión async (camino de /crear-ficha) -----
+
+async def _buscar_sha_remoto_async(api_url: str, headers: dict) -> str | None:
+    with medir("github_get"):
+        resp_get = await cliente_http_async.get(api_url, headers=headers, timeout=GITHUB_TIMEOUT)
     if resp_get.status_code == 200:
-        sha = resp_get.json().get("sha")
-        if sha:
-            data["sha"] = sha
+        return resp_get.json().get("sha")
+    return None
+
+
+async def subir_a_github_async(html: str, slug: str) -> str:
+    api_url = url_contents_ficha(slug)
+    headers = github_headers()
+
+    if indice_sha.cargado:
+        sha = indice_sha.obtener(slug)
+    else:
+        sha = await _buscar_sha_remoto_async(api_url, headers)
+
+    async def put(sha: str | None):
+        with medir("github_put"):
+            return await cliente_http_async.put(
+                api_url, headers=headers, content=_cuerpo_put_ficha(html, slug, sha), timeout=GITHUB_TIMEOUT
+            )
+
+    resp_put = await put(sha)
+    if resp_put.status_code in (409, 422):
+        resp_put = await put(await _buscar_sha_remoto_async(api_url, headers))
 
-    resp_put = requests.put(api_url, headers=headers, data=json.dumps(data))
     if resp_put.status_code not in (200, 201):
         raise RuntimeError(f"Error subiendo a GitHub: {resp_put.status_code} {resp_put.text}")
 
-    url_publica = f"https://{GITHUB_USER}.github.io/{REPO_NAME}/fichas/{slug}.html"
-    return url_publica
+    sha_nuevo = resp_put.json().get("content", {}).get("sha")
+    if sha_nuevo:
+        indice_sha.actualizar(slug, sha_nuevo)
 
+    return url_publica_ficha(slug)
 
-# ========= ENDPOINT =========
 
-@app.post("/crear-ficha")
-def crear_ficha(payload: CrearFichaRequest):
+async def ficha_sin_cambios_async(html: str, slug: str) -> bool:
+    sha_local = sha_blob_git(html.encode("utf-8"))
+    if indice_sha.cargado:
+        return indice_sha.obtener(slug) == sha_local
+    return await _buscar_sha_remoto_async(url_contents_ficha(slug), github_headers()) == sha_local
+
+
+async def publicar_ficha_async(html: str, slug: str) -> dict:
+    return await vuelos_publicacion.hacer_async(
+        slug, _publicar_ficha_async, html, slug, firma=sha_blob_git(html.encode("utf-8"))
+    )
+
+
+async def _publicar_ficha_async(html: str, slug: str) -> dict:
+    if await ficha_sin_cambios_async(html, slug):
+        return {"url_ficha": url_publica_ficha(slug), "unchanged": True}
+    if estilos_fichas.pendientes():
+        await asyncio.to_thread(estilos_fichas.asegurar)
+    return {"url_ficha": await subir_a_github_async(html, slug), "unchanged": False}
+
+
+def cargar_indice_sha():
     try:
-        scraper = elegir_scraper(payload.url)
-        datos = scraper(payload.url)
+        cantidad = indice_sha.cargar()
+        logger.info("Índice de SHAs cargado: %d fichas", cantidad)
+    except Exception:
+        # Sin índice se sigue funcionando: subir_a_github consulta el SHA en cada subida
+        logger.exception("No se pudo cargar el índice de SHAs de fichas/")
 
-        slug = payload.slug or slugify.slugify(datos["TITULO"]) or "propiedad-urbanrise"
-        html = generar_html(datos)
-        url_ficha = subir_a_github(html, slug)
-        return {
-            "ok": True,
-            "slug": slug,
-            "url_ficha": url_ficha,
-            "imagenes": datos.get("IMAGENES", []),
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+# ========= PUBLICACIÓN AGRUPADA (GIT DATA API) =========
+
+class PublicadorGit:
+    """
+    Junta fichas renderizadas (y los binarios que usan, ej. miniaturas) y las
+    publica todas en un solo commit (tree + commit + actualización de la rama)
+    en lugar de un PUT por ficha. Se vacía al llegar a `flush_items` fichas, a
+    los `flush_segundos` de entrar la primera pendiente, o a mano con `flush()`.
+    Los commits salen de a uno (`_flush_lock`): dos en paralelo se pisarían la rama.
+    """
+
+    def __init__(self, flush_items: int, flush_segundos: float, reintentos_rama: int = 5):
+        self.flush_items = flush_items
+        self.flush_segundos = flush_segundos
+        self.reintentos_rama = reintentos_rama
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pendientes: dict[str, tuple[str, list[Future]]] = {}
+        self._binarios: dict[str, bytes] = {}
+        self._timer: threading.Timer | None = None
+
+    def encolar(self, html: str, slug: str, binarios: dict[str, bytes] | None = None) -> Future:
+        """
+        Devuelve un Future que se resuelve con la URL pública cuando el commit entra.
+        Los `binarios` de la ficha (ruta en el repo → bytes) van en el mismo commit.
+        """
+        futuro: Future = Future()
+        with self._lock:
+            _, futuros = self._pendientes.get(slug, (None, []))
+            futuros.append(futuro)
+            self._pendientes[slug] = (html, futuros)  # si se repite el slug, gana el último HTML
+            self._binarios.update(binarios or {})
+            lleno = len(self._pendientes) >= self.flush_items
+            if not lleno and self._timer is None and self.flush_segundos > 0:
+                self._timer = threading.Timer(self.flush_segundos, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if lleno:
+            self.flush()
+        return futuro
+
+    def flush(self) -> str | None:
+        with self._flush_lock:
+            with self._lock:
+                lote, self._pendientes = self._pendientes, {}
+                binarios, self._binarios = self._binarios, {}
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not lote:
+                return None
+
+            estilos = estilos_fichas.pendientes()
+            try:
+                with medir("github_commit"):
+                    commit_sha = self._commitear({slug: html for slug, (html, _) in lote.items()}, {**binarios, **estilos})
+            except Exception as e:
+                for _, futuros in lote.values():
+                    for futuro in futuros:
+                        futuro.set_exception(e)
+                return None
+
+            estilos_fichas.marcar_publicadas(estilos)
+            for slug, (html, futuros) in lote.items():
+                indice_sha.actualizar(slug, sha_blob_git(html.encode("utf-8")))
+                for futuro in futuros:
+                    futuro.set_result(url_publica_ficha(slug))
+            return commit_sha
+
+    def commitear_binarios(self, binarios: dict[str, bytes]) -> str:
+        """Commitea ya mismo archivos binarios (ruta en el repo → bytes), ej. miniaturas o la hoja de estilos."""
+        with self._flush_lock:
+            return self._commitear({}, binarios)
+
+    def _commitear(self, archivos: dict[str, str], binarios: dict[str, bytes] | None = None) -> str:
+        base = f"{GITHUB_API_URL}/repos/{GITHUB_USER}/{REPO_NAME}/git"
+        headers = github_headers()
+
+        def verificar(resp, accion: str) -> dict:
+            if resp.status_code not in (200, 201):
+                raise RuntimeError(f"Error {accion} en GitHub: {resp.status_code} {resp.text}")
+            return resp.json()
+
+        entradas = [
+            {"path": f"fichas/{slug}.html", "mode": "100644", "type": "blob", "content": html}
+            for slug, html in archivos.items()
+        ]
+        # Los binarios no pueden ir inline en el tree: van como blobs base64 antes
+        for ruta, contenido in (binarios or {}).items():
+            blob = verificar(
+                cliente_http.post(
+                    f"{base}/blobs",
+                    headers=headers,
+                    data=json.dumps({
+                        "content": base64.b64encode(contenido).decode("ascii"),
+                        "encoding": "base64",
+                    }),
+                    timeout=GITHUB_TIMEOUT,
+                ),
+                "creando un blob",
+            )
+            entradas.append({"path": ruta, "mode": "100644", "type": "blob", "sha": blob["sha"]})
+        if archivos:
+            mensaje = f"Crear/actualizar {len(archivos)} fichas"
+        else:
+            mensaje = f"Subir {len(entradas)} archivos estáticos"
+
+        # Si la rama avanza entre que la leemos y la movemos (422, no es fast-forward) se
+        # vuelve a leer y a armar el tree encima del head nuevo, unas pocas veces
+        for intento in range(self.reintentos_rama + 1):
+            ref = verificar(
+                cliente_http.get(f"{base}/ref/heads/{GITHUB_BRANCH}", headers=headers, timeout=GITHUB_TIMEOUT),
+                "leyendo la rama",
+            )
+            head_sha = ref["object"]["sha"]
+            commit_actual = verificar(
+                cliente_http.get(f"{base}/commits/{head_sha}", headers=headers, timeout=GITHUB_TIMEOUT),
+                "leyendo el commit actual",
+            )
+
+            # El contenido va inline en el tree: GitHub crea los blobs sin un POST por archivo
+            tree = verificar(
+                cliente_http.post(
+                    f"{base}/trees",
+                    headers=headers,
+                    data=json.dumps({
+                        "base_tree": commit_actual["tree"]["sha"],
+                        "tree": entradas,
+                    }),
+                    timeout=GITHUB_TIMEOUT,
+                ),
+                "creando el tree",
+            )
+            if tree["sha"] == commit_actual["tree"]["sha"]:
+                return head_sha  # ya estaba todo publicado: no hace falta un commit vacío
+            nuevo_commit = verificar(
+                cliente_http.post(
+                    f"{base}/commits",
+                    headers=headers,
+                    data=json.dumps({
+                        "message": mensaje,
+                        "tree": tree["sha"],
+                        "parents": [head_sha],
+                    }),
+                    timeout=GITHUB_TIMEOUT,
+                ),
+                "creando el commit",
+            )
+
+            resp_ref = cliente_http.patch(
+                f"{base}/refs/heads/{GITHUB_BRANCH}",
+                headers=headers,
+                data=json.dumps({"sha": nuevo_commit["sha"]}),
+                timeout=GITHUB_TIMEOUT,
+            )
+            if resp_ref.status_code == 422 and intento < self.reintentos_rama:
+                time.sleep(random.uniform(0, 0.05 * 2 ** intento))
+                continue
+            verificar(resp_ref, "actualizando la rama")
+            return nuevo_commit["sha"]
+
+        raise RuntimeError("No se pudo actualizar la rama en GitHub")
+
+
+publicador_git = PublicadorGit(PUBLICACION_FLUSH_ITEMS, PUBLICACION_FLUSH_SEGUNDOS, PUBLICACION_REINTENTOS_RAMA)
+
+
+# ========= ETAPA DE PARSEO / EXTRACCIÓN =========
+
+class PoolParseo:
+    """
+    Pool donde corren los `extraer_propiedad_*`: entra el HTML crudo y sale
+    el dict `datos`. En modo "procesos" el parseo no compite por el GIL con
+    el resto del servicio y escala con los cores; los workers se lanzan con
+    spawn (no heredan threads ni sockets del proceso principal).
+    """
+
+    def __init__(self, modo: str, workers: int):
+        if modo not in ("threads", "procesos"):
+            raise RuntimeError(f"PARSEO_MODO inválido: {modo}")
+        self.modo = modo
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _obtener_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.modo == "procesos":
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parseo")
+            return self._executor
+
+    def submit(self, extractor, *args) -> Future:
+        executor = self._obtener_executor()
+        try:
+            return executor.submit(extractor, *args)
+        except BrokenProcessPool:
+            # Murió un worker: se descarta el pool roto y se arma uno nuevo
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            return self._obtener_executor().submit(extractor, *args)
+
+    def cerrar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+pool_parseo = PoolParseo(PARSEO_MODO, PARSEO_WORKERS)
+
+
+# ========= ETAPA DE IMÁGENES =========
+
+def hash_perceptual(imagen) -> int:
+    """dHash de 64 bits: imágenes iguales a distinta resolución dan hashes casi iguales."""
+    gris = imagen.convert("L").resize((9, 8))
+    pixeles = list(gris.getdata())
+    bits = 0
+    for fila in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixeles[fila * 9 + col] > pixeles[fila * 9 + col + 1])
+    return bits
+
+
+class ProcesadorImagenes:
+    """
+    Etapa opcional entre el scraping y el render. Revisa las URLs de
+    IMAGENES en paralelo (pool acotado) y descarta las rotas; saca duplicados
+    (mismo ETag o mismo contenido, o dHash parecido con Pillow) quedándose con
+    la de mayor resolución; y en modo "miniaturas" genera WebP a los anchos
+    configurados, que se publican en fichas/img/ con nombre por hash de
+    contenido. Los resultados por URL quedan memorizados.
+    """
+
+    MODOS = ("off", "validar", "miniaturas")
+
+    def __init__(self, modo: str, workers: int, anchos: list[int], calidad: int, distancia: int,
+                 max_memo: int = 2000):
+        if modo not in self.MODOS:
+            raise RuntimeError(f"IMAGENES_MODO inválido: {modo}")
+        if modo == "miniaturas" and not modulo_instalado("PIL"):
+            logger.warning("IMAGENES_MODO=miniaturas sin Pillow: solo se valida y deduplica por contenido")
+        self.modo = modo
+        self.workers = workers
+        self.anchos = anchos
+        self.calidad = calidad
+        self.distancia = distancia
+        self.max_memo = max_memo
+        self._lock = threading.Lock()
+        self._memo: OrderedDict[str, dict] = OrderedDict()
+        self._sin_publicar: dict[str, bytes] = {}  # ruta en el repo → WebP todavía no commiteado
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _obtener_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="imagenes")
+            return self._executor
+
+    @staticmethod
+    def _no_es_imagen(resp) -> bool:
+        """
+        Solo descarta lo que seguro no es una foto (una página de error, JSON): muchos CDN
+        sirven imágenes como application/octet-stream; esas las termina de decidir Pillow.
+        """
+        tipo = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        return tipo.startswith("text/") or tipo in ("application/json", "application/xhtml+xml", "application/xml")
+
+    def _validar(self, url: str) -> dict | None:
+        resp = cliente_http.request("HEAD", url, headers=HEADERS, reintentos=1, allow_redirects=True)
+        if resp.status_code in (405, 501):
+            return {"url": url, "clave": None}  # el servidor no acepta HEAD: se deja pasar
+        if resp.status_code >= 400:
+            return None
+        if self._no_es_imagen(resp):
+            return None
+        return {"url": url, "clave": resp.headers.get("ETag")}
+
+    def _miniaturas(self, imagen, base: str) -> list[tuple[str, int, int]]:
+        if imagen.mode not in ("RGB", "RGBA"):
+            imagen = imagen.convert("RGBA" if "transparency" in imagen.info else "RGB")
+        miniaturas = []
+        for ancho in self.anchos:
+            if miniaturas and ancho >= imagen.width:
+                break  # no se agranda
+            ancho = min(ancho, imagen.width)
+            alto = max(1, round(imagen.height * ancho / imagen.width))
+            buffer = io.BytesIO()
+            imagen.resize((ancho, alto), importar_diferido("PIL.Image").LANCZOS).save(buffer, "WEBP", quality=self.calidad)
+            nombre = f"{base}-{ancho}.webp"
+            with self._lock:
+                self._sin_publicar[f"fichas/img/{nombre}"] = buffer.getvalue()
+            miniaturas.append((nombre, ancho, alto))
+        return miniaturas
+
+    def _descargar(self, url: str) -> dict | None:
+        resp = cliente_http.get(url, headers=HEADERS, reintentos=1)
+        if resp.status_code >= 400 or not resp.content or self._no_es_imagen(resp):
+            return None
+        contenido = resp.content
+        info = {"url": url, "clave": hashlib.sha256(contenido).hexdigest(), "phash": None, "area": 0, "miniaturas": []}
+        Image = importar_diferido("PIL.Image")
+        if Image is None:
+            return info
+        try:
+            with Image.open(io.BytesIO(contenido)) as imagen:
+                imagen.load()
+                info["phash"] = hash_perceptual(imagen)
+                info["area"] = imagen.width * imagen.height
+                info["miniaturas"] = self._miniaturas(imagen, info["clave"][:16])
+        except (OSError, Image.DecompressionBombError):
+            return None  # no es una imagen que Pillow pueda abrir
+        return info
+
+    def _analizar(self, url: str) -> dict | None:
+        with self._lock:
+            info = self._memo.get(url)
+            if info is not None:
+                self._memo.move_to_end(url)
+                return info
+        try:
+            info = self._validar(url) if self.modo == "validar" else self._descargar(url)
+        except requests.RequestException:
+            return None
+        if info is not None:
+            with self._lock:
+                self._memo[url] = info
+                while len(self._memo) > self.max_memo:
+                    self._memo.popitem(last=False)
+        return info
+
+    def _duplicadas(self, a: dict, b: dict) -> bool:
+        if a["clave"] and a["clave"] == b["clave"]:
+            return True
+        if a.get("phash") is not None and b.get("phash") is not None:
+            return bin(a["phash"] ^ b["phash"]).count("1") <= self.distancia
+        return False
+
+    def _deduplicar(self, infos: list[dict]) -> list[dict]:
+        elegidas: list[dict] = []
+        for info in infos:
+            i = next((i for i, otra in enumerate(elegidas) if self._duplicadas(otra, info)), None)
+            if i is None:
+                elegidas.append(info)
+            elif info.get("area", 0) > elegidas[i].get("area", 0):
+                elegidas[i] = info  # la de mayor resolución, en el lugar de la primera
+        return elegidas
+
+    def procesar(self, datos: Ficha) -> tuple[Ficha, dict[str, bytes]]:
+        """Devuelve los `datos` con IMAGENES filtradas (y MINIATURAS) y los WebP a publicar antes que la ficha."""
+        urls = list(dict.fromkeys(datos.IMAGENES))
+        if self.modo == "off" or not urls:
+            return datos, {}
+
+        infos = [info for info in self._obtener_executor().map(self._analizar, urls) if info is not None]
+        elegidas = self._deduplicar(infos)
+        miniaturas = {info["url"]: info["miniaturas"] for info in elegidas if info.get("miniaturas")}
+        with self._lock:
+            archivos = {
+                f"fichas/img/{nombre}": self._sin_publicar[f"fichas/img/{nombre}"]
+                for tamanios in miniaturas.values()
+                for nombre, *_ in tamanios
+                if f"fichas/img/{nombre}" in self._sin_publicar
+            }
+
+        datos = replace(datos, IMAGENES=[info["url"] for info in elegidas])
+        if miniaturas:
+            datos.MINIATURAS = miniaturas
+        return datos, archivos
+
+    def marcar_publicados(self, rutas):
+        with self._lock:
+            for ruta in rutas:
+                self._sin_publicar.pop(ruta, None)
+
+    def cerrar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+procesador_imagenes = ProcesadorImagenes(
+    IMAGENES_MODO, IMAGENES_WORKERS, IMAGENES_ANCHOS, IMAGENES_CALIDAD_WEBP, IMAGENES_DISTANCIA_DHASH
+)
+
+
+def preparar_imagenes(datos: Ficha) -> Ficha:
+    """Corre la etapa de imágenes y publica las miniaturas nuevas antes que la ficha que las usa."""
+    datos, archivos = procesador_imagenes.procesar(datos)
+    if archivos:
+        publicador_git.commitear_binarios(archivos)
+        procesador_imagenes.marcar_publicados(archivos)
+    return datos
+
+
+# ========= CACHE DE SCRAPING =========
+
+def normalizar_url(url: str) -> str:
+    """Clave de cache: esquema y host en minúscula, sin fragmento, sin utm_* y con la query ordenada."""
+    partes = urlparse(url.strip())
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(partes.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_")
+    ))
+    path = partes.path.rstrip("/") or "/"
+    return urlunparse(((partes.scheme or "https").lower(), partes.netloc.lower(), path, "", query, ""))
+
+
+class CacheScrape:
+    """
+    Cache de scraping por URL normalizada, en dos niveles: un LRU en memoria
+    con `datos` + validadores (ETag/Last-Modified), y una tabla SQLite con lo
+    mismo que sobrevive a los reinicios. Mientras los
+    `datos` están dentro del TTL no se descarga ni se parsea nada; vencidos,
+    se pide la página con GET condicional y un 304 reusa los `datos`.
+    """
+
+    def __init__(self, ttl: float, max_items: int, path: str, max_disco: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_disco = max_disco
+        self._lock = threading.Lock()
+        self._memoria: OrderedDict[str, dict] = OrderedDict()
+        self._contadores = {"aciertos": 0, "revalidados": 0, "fallos": 0}
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        self._db_abierta = False
+
+    def _conexion(self) -> sqlite3.Connection | None:
+        """Abre la base en el primer uso (los workers de parseo nunca la tocan). Llamar con el lock."""
+        if not self._db_abierta:
+            self._db_abierta = True
+            if self.path:
+                try:
+                    self._db = sqlite3.connect(self.path, check_same_thread=False)
+                    self._db.execute(
+                        "CREATE TABLE IF NOT EXISTS scrape ("
+                        " clave TEXT PRIMARY KEY, etag TEXT, last_modified TEXT,"
+                        " datos TEXT NOT NULL, guardado REAL NOT NULL, usado REAL NOT NULL)"
+                    )
+                    self._db.execute("CREATE INDEX IF NOT EXISTS scrape_usado ON scrape (usado)")
+                    self._db.commit()
+                    self._quitar_html(self._db)
+                except sqlite3.Error:
+                    # Sin disco se sigue con la cache en memoria
+                    logger.exception("No se pudo abrir la cache de scraping en %s", self.path)
+                    self._db = None
+        return self._db
+
+    @staticmethod
+    def _quitar_html(db: sqlite3.Connection):
+        """Las bases de versiones anteriores guardaban también el HTML crudo, que nunca se leía."""
+        if "html" not in {fila[1] for fila in db.execute("PRAGMA table_info(scrape)")}:
+            return
+        try:
+            db.execute("ALTER TABLE scrape DROP COLUMN html")
+        except sqlite3.OperationalError:
+            db.execute("UPDATE scrape SET html = NULL")  # SQLite < 3.35 no tiene DROP COLUMN
+            db.commit()
+        db.execute("VACUUM")
+
+    def _en_memoria(self, clave: str, entrada: dict):
+        self._memoria[clave] = entrada
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_items:
+            self._memoria.popitem(last=False)
+
+    def obtener(self, clave: str) -> dict | None:
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                self._memoria.move_to_end(clave)
+                return entrada
+            db = self._conexion()
+            if db is None:
+                return None
+            fila = db.execute(
+                "SELECT etag, last_modified, datos, guardado FROM scrape WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None:
+                return None
+            try:
+                datos = Ficha.desde_json(fila[2])
+            except (ValueError, TypeError):
+                # Guardada por una versión con otros campos: cuenta como fallo y se vuelve a scrapear
+                db.execute("DELETE FROM scrape WHERE clave = ?", (clave,))
+                db.commit()
+                return None
+            db.execute("UPDATE scrape SET usado = ? WHERE clave = ?", (time.time(), clave))
+            db.commit()
+            entrada = {
+                "etag": fila[0],
+                "last_modified": fila[1],
+                "datos": datos,
+                "guardado": fila[3],
+            }
+            self._en_memoria(clave, entrada)
+            return entrada
+
+    def vigente(self, entrada: dict | None) -> bool:
+        return entrada is not None and time.time() - entrada["guardado"] < self.ttl
+
+    def guardar(self, clave: str, datos: Ficha, resp_headers=None):
+        """Guarda `datos` (con los validadores de la respuesta, si vino de una descarga)."""
+        resp_headers = resp_headers or {}
+        ahora = time.time()
+        entrada = {
+            "etag": resp_headers.get("ETag"),
+            "last_modified": resp_headers.get("Last-Modified"),
+            "datos": datos,
+            "guardado": ahora,
+        }
+        with self._lock:
+            self._en_memoria(clave, entrada)
+            db = self._conexion()
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO scrape (clave, etag, last_modified, datos, guardado, usado)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    clave,
+                    entrada["etag"],
+                    entrada["last_modified"],
+                    datos.a_json(),
+                    ahora,
+                    ahora,
+                ),
+            )
+            db.execute(
+                "DELETE FROM scrape WHERE clave IN"
+                " (SELECT clave FROM scrape ORDER BY usado DESC LIMIT -1 OFFSET ?)",
+                (self.max_disco,),
+            )
+            db.commit()
+
+    def revalidada(self, clave: str, entrada: dict, resp_headers) -> Ficha:
+        """La página respondió 304: se reusan los `datos` y se renueva el TTL."""
+        entrada = {
+            **entrada,
+            "etag": resp_headers.get("ETag") or entrada["etag"],
+            "last_modified": resp_headers.get("Last-Modified") or entrada["last_modified"],
+            "guardado": time.time(),
+        }
+        with self._lock:
+            self._contadores["revalidados"] += 1
+            self._en_memoria(clave, entrada)
+            db = self._conexion()
+            if db is not None:
+                db.execute(
+                    "UPDATE scrape SET etag = ?, last_modified = ?, guardado = ?, usado = ? WHERE clave = ?",
+                    (entrada["etag"], entrada["last_modified"], entrada["guardado"], entrada["guardado"], clave),
+                )
+                db.commit()
+        return entrada["datos"]
+
+    def contar(self, contador: str):
+        with self._lock:
+            self._contadores[contador] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            en_disco = None
+            db = self._conexion()
+            if db is not None:
+                en_disco = db.execute("SELECT COUNT(*) FROM scrape").fetchone()[0]
+            return {**self._contadores, "en_memoria": len(self._memoria), "en_disco": en_disco}
+
+    def cerrar(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+cache_scrape = CacheScrape(SCRAPE_CACHE_TTL, SCRAPE_CACHE_MAX_ITEMS, SCRAPE_CACHE_PATH, SCRAPE_CACHE_MAX_DISCO)
+
+
+def headers_condicionales(entrada: dict | None) -> dict:
+    headers = dict(HEADERS)
+    if entrada is not None:
+        if entrada.get("etag"):
+            headers["If-None-Match"] = entrada["etag"]
+        if entrada.get("last_modified"):
+            headers["If-Modified-Since"] = entrada["last_modified"]
+    return headers
+
+
+@app.get("/stats/cache")
+def stats_cache():
+    return cache_scrape.stats()
+
+
+# ========= LÍMITES POR PORTAL (AIMD + CIRCUIT BREAKER) =========
+
+class PortalNoDisponible(RuntimeError):
+    def __init__(self, host: str, reintentar_en: float):
+        super().__init__(f"{host} no está respondiendo bien: se reintenta en {reintentar_en:.0f}s")
+        self.host = host
+        self.reintentar_en = reintentar_en
+
+
+class _Espera:
+    """Un pedido de turno en la cola de un host: un thread (Event) o una corrutina (Future)."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None):
+        self.loop = loop
+        self.error: Exception | None = None
+        self.concedido = False
+        if loop is None:
+            self.evento = threading.Event()
+        else:
+            self.futuro = loop.create_future()
+
+    def avisar(self, error: Exception | None = None):
+        self.error = error
+        self.concedido = error is None
+        if self.loop is None:
+            self.evento.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolver)
+
+    def _resolver(self):
+        if not self.futuro.done():
+            self.futuro.set_result(None)
+
+
+class EstadoHost:
+    def __init__(self, limites: dict):
+        self.max_concurrentes = limites["max_concurrentes"]
+        self.latencia_objetivo = limites["latencia_objetivo"]
+        self.intervalo = limites["intervalo"]
+        self.fallos_circuito = limites["fallos_circuito"]
+        self.enfriamiento = limites["enfriamiento"]
+        self.limite = float(self.max_concurrentes)
+        self.en_curso = 0
+        self.esperando: deque[_Espera] = deque()
+        self.proximo_turno = 0.0
+        self.ultima_baja = 0.0
+        self.fallos_seguidos = 0
+        self.abierto_hasta = 0.0  # monotonic; 0 → circuito cerrado
+        self.sonda_en_curso = False
+        self.rechazados = 0
+
+
+class Turno:
+    """Lo que recibe quien descarga: informa el status para que cuente como éxito o fallo."""
+
+    def __init__(self, host: str, estado: EstadoHost, sonda: bool):
+        self.host = host
+        self.estado = estado
+        self.sonda = sonda
+        self.inicio = time.monotonic()
+        self.resultado: bool | None = True  # None → no cuenta (error que no es del portal)
+
+    def respuesta(self, status_code: int):
+        self.resultado = not (status_code == 429 or status_code >= 500)
+
+
+class LimitadorPorHost:
+    """
+    Turnos de descarga por host. La concurrencia de cada host es AIMD: sube
+    de a poco mientras las respuestas llegan bien y a tiempo, y se parte a la
+    mitad con un 429, un 5xx, un error de red o una respuesta más lenta que
+    `latencia_objetivo`. Tras `fallos_circuito` fallos seguidos el circuito
+    se abre: durante `enfriamiento` los pedidos a ese host fallan enseguida
+    con PortalNoDisponible, y después pasa una sola sonda que lo cierra o lo
+    vuelve a abrir. Cada host tiene su estado: uno enfermo no frena al resto.
+    """
+
+    ERRORES_RED = (requests.ConnectionError, requests.Timeout, httpx.TransportError)
+    ERRORES_STATUS = (requests.HTTPError, httpx.HTTPStatusError)
+
+    def __init__(self, defecto: dict, *por_host: dict[str, dict]):
+        self.defecto = defecto
+        self.por_host = por_host  # en orden: los posteriores pisan a los anteriores
+        self._lock = threading.Lock()
+        self._estados: dict[str, EstadoHost] = {}
+
+    def _estado(self, host: str) -> EstadoHost:
+        """Llamar con el lock."""
+        estado = self._estados.get(host)
+        if estado is None:
+            limites = dict(self.defecto)
+            for configuracion in self.por_host:
+                limites.update(configuracion.get(host, {}))
+            estado = self._estados[host] = EstadoHost(limites)
+        return estado
+
+    def _pedir(self, host: str, espera: _Espera) -> tuple[EstadoHost, bool, bool]:
+        """(estado, entra ya, es la sonda); si no entra, `espera` queda en la cola."""
+        with self._lock:
+            estado = self._estado(host)
+            sonda = False
+            if estado.abierto_hasta:
+                ahora = time.monotonic()
+                if ahora < estado.abierto_hasta or estado.sonda_en_curso:
+                    estado.rechazados += 1
+                    raise PortalNoDisponible(host, max(0.0, estado.abierto_hasta - ahora))
+                estado.sonda_en_curso = sonda = True
+            if estado.en_curso < int(estado.limite) and not estado.esperando:
+                estado.en_curso += 1
+                return estado, True, sonda
+            estado.esperando.append(espera)
+            return estado, False, sonda
+
+    def _espaciado(self, estado: EstadoHost) -> float:
+        with self._lock:
+            ahora = time.monotonic()
+            inicio = max(ahora, estado.proximo_turno)
+            estado.proximo_turno = inicio + estado.intervalo
+        return inicio - ahora
+
+    def _salir(self, turno: Turno):
+        estado = turno.estado
+        rechazar: list[_Espera] = []
+        conceder: list[_Espera] = []
+        with self._lock:
+            ahora = time.monotonic()
+            estado.en_curso -= 1
+            if turno.sonda:
+                estado.sonda_en_curso = False
+            if turno.resultado is not None:
+                if not turno.resultado or ahora - turno.inicio > estado.latencia_objetivo:
+                    # Una sola baja por ventana: los fallos simultáneos son la misma señal
+                    if ahora - estado.ultima_baja > estado.latencia_objetivo:
+                        estado.limite = max(1.0, estado.limite / 2)
+                        estado.ultima_baja = ahora
+                else:
+                    estado.limite = min(estado.max_concurrentes, estado.limite + 1 / estado.limite)
+                if turno.resultado:
+                    estado.fallos_seguidos = 0
+                    if turno.sonda:
+                        estado.abierto_hasta = 0.0
+                else:
+                    estado.fallos_seguidos += 1
+                    if turno.sonda or estado.fallos_seguidos >= estado.fallos_circuito:
+                        estado.abierto_hasta = ahora + estado.enfriamiento
+                        estado.sonda_en_curso = False  # si la sonda estaba en la cola, se rechaza con el resto
+                        rechazar, estado.esperando = list(estado.esperando), deque()
+                        logger.warning("Circuito abierto para %s por %.0fs", turno.host, estado.enfriamiento)
+            while estado.esperando and estado.en_curso < int(estado.limite):
+                estado.en_curso += 1
+                conceder.append(estado.esperando.popleft())
+        for espera in conceder:
+            espera.avisar()
+        for espera in rechazar:
+            espera.avisar(PortalNoDisponible(turno.host, estado.enfriamiento))
+
+    def _cerrar_turno(self, turno: Turno, error: BaseException | None):
+        # Un 429/5xx ya informado con respuesta() sigue contando como fallo aunque
+        # después salte el raise_for_status()
+        if error is not None and turno.resultado is not False:
+            if isinstance(error, self.ERRORES_RED):
+                turno.resultado = False
+            elif isinstance(error, self.ERRORES_STATUS) and error.response is not None:
+                turno.respuesta(error.response.status_code)
+                if turno.resultado:
+                    turno.resultado = None  # un 4xx no es culpa del portal
+            else:
+                turno.resultado = None
+        self._salir(turno)
+
+    @contextmanager
+    def turno(self, url: str):
+        host = urlparse(url).netloc.lower()
+        espera = _Espera()
+        estado, entra, sonda = self._pedir(host, espera)
+        if not entra:
+            espera.evento.wait()
+            if espera.error is not None:
+                raise espera.error
+        turno = Turno(host, estado, sonda)
+        try:
+            demora = self._espaciado(estado)
+            if demora > 0:
+                time.sleep(demora)
+            turno.inicio = time.monotonic()
+            yield turno
+        except BaseException as e:
+            self._cerrar_turno(turno, e)
+            raise
+        self._cerrar_turno(turno, None)
+
+    @asynccontextmanager
+    async def turno_async(self, url: str):
+        host = urlparse(url).netloc.lower()
+        espera = _Espera(asyncio.get_running_loop())
+        estado, entra, sonda = self._pedir(host, espera)
+        if not entra:
+            try:
+                await espera.futuro
+            except asyncio.CancelledError:
+                with self._lock:
+                    if espera in estado.esperando:
+                        estado.esperando.remove(espera)
+                        estado.sonda_en_curso = estado.sonda_en_curso and not sonda
+                        espera = None
+                if espera is not None and espera.concedido:
+                    self._salir(Turno(host, estado, sonda))  # el turno llegó justo: se devuelve
+                raise
+            if espera.error is not None:
+                raise espera.error
+        turno = Turno(host, estado, sonda)
+        try:
+            demora = self._espaciado(estado)
+            if demora > 0:
+                await asyncio.sleep(demora)
+            turno.inicio = time.monotonic()
+            yield turno
+        except BaseException as e:
+            self._cerrar_turno(turno, e)
+            raise
+        self._cerrar_turno(turno, None)
+
+    def stats(self) -> dict:
+        ahora = time.monotonic()
+        with self._lock:
+            return {
+                host: {
+                    "limite": round(estado.limite, 2),
+                    "max_concurrentes": estado.max_concurrentes,
+                    "en_curso": estado.en_curso,
+                    "esperando": len(estado.esperando),
+                    "fallos_seguidos": estado.fallos_seguidos,
+                    "circuito": (
+                        "cerrado" if not estado.abierto_hasta
+                        else "abierto" if ahora < estado.abierto_hasta or estado.sonda_en_curso
+                        else "semiabierto"
+                    ),
+                    "rechazados": estado.rechazados,
+                }
+                for host, estado in self._estados.items()
+            }
+
+
+limitador_hosts = LimitadorPorHost(
+    {
+        "max_concurrentes": LOTE_MAX_POR_HOST,
+        "latencia_objetivo": PORTAL_LATENCIA_OBJETIVO,
+        "intervalo": LOTE_INTERVALO_POR_HOST,
+        "fallos_circuito": PORTAL_FALLOS_CIRCUITO,
+        "enfriamiento": PORTAL_ENFRIAMIENTO,
+    },
+    LIMITES_PORTALES,
+    LIMITES_POR_PORTAL,
+)
+
+
+# ========= SCRAPING ASYNC =========
+
+async def descargar_html_async(url_anuncio: str) -> str:
+    resp = await cliente_http_async.get(url_anuncio, headers=HEADERS, stream=True)
+    return await leer_html_async(resp, url_anuncio)
+
+
+async def scrapear_async(url_anuncio: str) -> Ficha:
+    """
+    Descarga sin bloquear el event loop y manda solo la extracción al pool
+    de parseo. Los scrapers sin extractor conocido corren enteros en un thread.
+    Antes pasa por `cache_scrape`: con `datos` vigentes no hay ni red ni parseo.
+    Pedidos simultáneos de la misma URL comparten un solo scrape.
+    """
+    clave = normalizar_url(url_anuncio)
+    return await vuelos_scrape.hacer_async(clave, _scrapear_async, url_anuncio, clave)
+
+
+async def _scrapear_async(url_anuncio: str, clave: str) -> Ficha:
+    # La cache toca SQLite (y un lock que comparten los hilos de los lotes): fuera del event loop
+    entrada = await asyncio.to_thread(cache_scrape.obtener, clave)
+    if cache_scrape.vigente(entrada):
+        cache_scrape.contar("aciertos")
+        return entrada["datos"]
+    cache_scrape.contar("fallos")
+
+    scraper = elegir_scraper(url_anuncio)
+
+    if scraper is scrapear_propiedad_mercadolibre:
+        with medir("api_mercadolibre"):
+            item = await asyncio.wrap_future(loteador_mercadolibre.pedir(id_item_mercadolibre(url_anuncio)))
+        datos = extraer_propiedad_mercadolibre(item)
+        await asyncio.to_thread(cache_scrape.guardar, clave, datos)
+        return datos
+
+    extractor = EXTRACTORES_HTML.get(scraper)
+    if extractor is None:
+        with medir("scrape"):
+            async with limitador_hosts.turno_async(url_anuncio):
+                datos = await asyncio.to_thread(scraper, url_anuncio)
+        await asyncio.to_thread(cache_scrape.guardar, clave, datos)
+        return datos
+
+    with medir("descarga"):
+        async with limitador_hosts.turno_async(url_anuncio) as turno:
+            resp = await cliente_http_async.get(url_anuncio, headers=headers_condicionales(entrada), stream=True)
+            turno.respuesta(resp.status_code)
+            if resp.status_code == 304 and entrada is not None:
+                await resp.aclose()
+                return await asyncio.to_thread(cache_scrape.revalidada, clave, entrada, resp.headers)
+            html = await leer_html_async(resp, url_anuncio)
+    # Parseo + extracción corren juntos en el pool: se miden como una sola etapa
+    with medir("extraccion"):
+        datos = await asyncio.wrap_future(pool_parseo.submit(extractor, html, url_anuncio))
+    await asyncio.to_thread(cache_scrape.guardar, clave, datos, resp.headers)
+    return datos
+
+
+# ========= ENDPOINT =========
+
+def resolver_slug(slug: str | None, datos: Ficha) -> str:
+    return slug or importar_diferido("slugify").slugify(datos.TITULO) or "propiedad-urbanrise"
+
+
+async def crear_ficha_async(url: str, slug: str | None) -> dict:
+    with etiqueta_portal(url), medir("total"):
+        with medir("total_scrape"):
+            datos = datos_scrape = await scrapear_async(url)
+        if procesador_imagenes.modo != "off":
+            with medir("imagenes"):
+                datos = await asyncio.to_thread(preparar_imagenes, datos)
+
+        slug = resolver_slug(slug, datos)
+        with medir("render"):
+            html = generar_html(datos)
+        with medir("publicacion"):
+            publicacion = await publicar_ficha_async(html, slug)
+        await asyncio.to_thread(manifiesto_fichas.registrar, slug, url, datos_scrape, html)
+    return {
+        "ok": True,
+        "slug": slug,
+        "url_ficha": publicacion["url_ficha"],
+        "unchanged": publicacion["unchanged"],
+        "imagenes": datos.IMAGENES,
+    }
+
+
+@app.post("/crear-ficha")
+async def crear_ficha(payload: CrearFichaRequest, tiempos: bool = False):
+    """Con `?tiempos=true` la respuesta incluye los segundos de cada etapa."""
+    desglose = {} if tiempos else None
+    token = _tiempos_actuales.set(desglose)
+    try:
+        respuesta = await crear_ficha_async(payload.url, payload.slug)
+    except PortalNoDisponible as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={
+                "X-Etapa-Error": getattr(e, "etapa", "descarga"),
+                "Retry-After": str(max(1, round(e.reintentar_en))),
+            },
+        )
+    except Exception as e:
+        etapa = getattr(e, "etapa", "desconocida")
+        raise HTTPException(status_code=500, detail=str(e), headers={"X-Etapa-Error": etapa})
+    finally:
+        _tiempos_actuales.reset(token)
+    if desglose is not None:
+        respuesta["tiempos"] = desglose
+    return respuesta
+
+
+@app.get("/metrics")
+def metrics():
+    extra = []
+    for contador, valor in cache_scrape.stats().items():
+        if contador in ("aciertos", "revalidados", "fallos"):
+            extra.append(("urbanrise_cache_scrape_total", "counter", {"resultado": contador}, valor))
+    for host, contadores in cliente_http.stats()["hosts"].items():
+        for contador in ("requests", "reintentos", "errores_red"):
+            if contador in contadores:
+                extra.append((f"urbanrise_http_{contador}_total", "counter", {"host": host}, contadores[contador]))
+    extra.append(("urbanrise_github_pausa_segundos", "gauge", {}, planificador_github.pausa()))
+    for host, estado in limitador_hosts.stats().items():
+        extra.append(("urbanrise_portal_limite", "gauge", {"host": host}, estado["limite"]))
+        extra.append(("urbanrise_portal_en_curso", "gauge", {"host": host}, estado["en_curso"]))
+        extra.append(("urbanrise_portal_circuito_abierto", "gauge", {"host": host}, int(estado["circuito"] != "cerrado")))
+        extra.append(("urbanrise_portal_rechazados_total", "counter", {"host": host}, estado["rechazados"]))
+    extra.append(("urbanrise_jobs_pendientes", "gauge", {}, cola_jobs.pendientes()))
+    extra.append(("urbanrise_coalescidos_total", "counter", {"tipo": "scrape"}, vuelos_scrape.coalescidos))
+    extra.append(("urbanrise_coalescidos_total", "counter", {"tipo": "publicacion"}, vuelos_publicacion.coalescidos))
+    return PlainTextResponse(metricas.exponer(extra), media_type="text/plain; version=0.0.4")
+
+
+# ========= JOBS: CREACIÓN DE FICHAS EN SEGUNDO PLANO =========
+
+class ColaLlena(RuntimeError):
+    pass
+
+
+class ColaJobs:
+    """
+    Cola de jobs de /crear-ficha atendida por `workers` tareas del event loop:
+    el POST devuelve el id enseguida y el resultado se consulta en
+    GET /jobs/{id} (o llega por webhook). Con más de `max_pendientes` en
+    espera rechaza jobs nuevos, y un job para una URL+slug que ya está en
+    cola o en curso devuelve el mismo id. Con `path` los jobs se guardan en
+    SQLite y los que quedaron sin terminar se retoman al arrancar; todo lo
+    que toca la base corre en un thread, con el lock, fuera del event loop.
+    """
+
+    def __init__(self, workers: int, max_pendientes: int, path: str, retencion: float):
+        self.workers = workers
+        self.max_pendientes = max_pendientes
+        self.path = path
+        self.retencion = retencion
+        self._jobs: dict[str, dict] = {}
+        self._en_vuelo: dict[tuple[str, str | None], str] = {}
+        self._cola: asyncio.Queue | None = None
+        self._tareas: list[asyncio.Task] = []
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+    def _abrir(self) -> list[dict]:
+        """Abre la base y devuelve los jobs que quedaron pendientes o a medias antes del reinicio."""
+        with self._lock:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, job TEXT NOT NULL, estado TEXT NOT NULL, actualizado REAL NOT NULL)"
+            )
+            self._db.commit()
+            filas = self._db.execute("SELECT job FROM jobs WHERE estado IN ('pendiente', 'en_curso')").fetchall()
+        return [json.loads(texto) for (texto,) in filas]
+
+    def _cerrar(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    async def iniciar(self):
+        self._cola = asyncio.Queue()
+        if self.path:
+            for job in await asyncio.to_thread(self._abrir):
+                job["estado"] = "pendiente"
+                self._registrar(job)
+                self._cola.put_nowait(job["job_id"])
+        self._tareas = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        await asyncio.to_thread(self._cerrar)
+
+    def _escribir(self, fila: tuple):
+        with self._lock:
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)", fila)
+                self._db.commit()
+
+    async def _guardar(self, job: dict):
+        job["actualizado"] = time.time()
+        if self._db is not None:
+            # Se serializa acá: el thread escribe una foto del job, no el dict que sigue cambiando
+            fila = (job["job_id"], json.dumps(job, ensure_ascii=False), job["estado"], job["actualizado"])
+            await asyncio.to_thread(self._escribir, fila)
+
+    def _registrar(self, job: dict):
+        self._jobs[job["job_id"]] = job
+        self._en_vuelo[(normalizar_url(job["url"]), job["slug"])] = job["job_id"]
+
+    def _borrar_viejos(self, limite: float):
+        with self._lock:
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM jobs WHERE estado IN ('ok', 'error') AND actualizado < ?", (limite,)
+                )
+                self._db.commit()
+
+    async def _purgar(self):
+        limite = time.time() - self.retencion
+        for job_id in [
+            j["job_id"] for j in self._jobs.values()
+            if j["estado"] in ("ok", "error") and j["actualizado"] < limite
+        ]:
+            del self._jobs[job_id]
+        if self._db is not None:
+            await asyncio.to_thread(self._borrar_viejos, limite)
+
+    async def encolar(self, url: str, slug: str | None, webhook: str | None) -> tuple[dict, bool]:
+        """Devuelve (job, nuevo). Si ya hay uno en vuelo para la misma URL+slug, devuelve ese."""
+        if self._cola is None:
+            raise RuntimeError("La cola de jobs no está iniciada")
+        job_id = self._en_vuelo.get((normalizar_url(url), slug))
+        if job_id is not None:
+            return self._jobs[job_id], False
+        if self._cola.qsize() >= self.max_pendientes:
+            raise ColaLlena(f"Hay {self.max_pendientes} jobs esperando")
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "estado": "pendiente",
+            "url": url,
+            "slug": slug,
+            "webhook": webhook,
+            "creado": time.time(),
+            "resultado": None,
+            "error": None,
+        }
+        # Registrado antes del primer await: un pedido igual que llegue mientras se
+        # guarda ya lo encuentra en vuelo
+        self._registrar(job)
+        await self._purgar()
+        await self._guardar(job)
+        self._cola.put_nowait(job["job_id"])
+        return job, True
+
+    def _leer(self, job_id: str) -> dict | None:
+        with self._lock:
+            if self._db is None:
+                return None
+            fila = self._db.execute("SELECT job FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(fila[0]) if fila is not None else None
+
+    async def obtener(self, job_id: str) -> dict | None:
+        job = self._jobs.get(job_id)
+        if job is None and self._db is not None:
+            job = await asyncio.to_thread(self._leer, job_id)
+        return job
+
+    def pendientes(self) -> int:
+        return self._cola.qsize() if self._cola is not None else 0
+
+    async def _worker(self):
+        while True:
+            job = self._jobs.get(await self._cola.get())
+            try:
+                if job is not None:
+                    await self._correr(job)
+            except Exception:
+                logger.exception("Error inesperado corriendo el job %s", job["job_id"])
+            finally:
+                self._cola.task_done()
+
+    async def _correr(self, job: dict):
+        job["estado"] = "en_curso"
+        await self._guardar(job)
+        try:
+            job["resultado"] = await crear_ficha_async(job["url"], job["slug"])
+            job["estado"] = "ok"
+        except Exception as e:
+            job["error"] = str(e)
+            job["estado"] = "error"
+        self._en_vuelo.pop((normalizar_url(job["url"]), job["slug"]), None)
+        await self._guardar(job)
+
+        if job["webhook"]:
+            try:
+                resp = await cliente_http_async.request(
+                    "POST", job["webhook"], json=self.vista(job), timeout=GITHUB_TIMEOUT
+                )
+                if resp.status_code >= 400:
+                    logger.warning("Webhook del job %s respondió %s", job["job_id"], resp.status_code)
+            except httpx.HTTPError:
+                logger.exception("No se pudo avisar al webhook del job %s", job["job_id"])
+
+    @staticmethod
+    def vista(job: dict) -> dict:
+        return {clave: valor for clave, valor in job.items() if clave != "webhook"}
+
+
+cola_jobs = ColaJobs(JOBS_WORKERS, JOBS_MAX_PENDIENTES, JOBS_DB_PATH, JOBS_RETENCION)
+
+
+@app.post("/jobs", status_code=202)
+async def crear_job(payload: CrearFichaJobRequest):
+    try:
+        job, nuevo = await cola_jobs.encolar(payload.url, payload.slug, payload.webhook)
+    except ColaLlena as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(e), "pendientes": cola_jobs.pendientes()},
+            headers={"Retry-After": "30"},
+        )
+    return {"job_id": job["job_id"], "estado": job["estado"], "nuevo": nuevo}
+
+
+@app.get("/jobs/{job_id}")
+async def estado_job(job_id: str):
+    job = await cola_jobs.obtener(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return ColaJobs.vista(job)
+
+
+# ========= LOTES: PIPELINE SCRAPE → PUBLICACIÓN =========
+
+def _etapa_scrape(url: str) -> Ficha:
+    clave = normalizar_url(url)
+    with etiqueta_portal(url), medir("total_scrape"):
+        return vuelos_scrape.hacer(clave, _scrapear_lote, url, clave)
+
+
+def _scrapear_lote(url: str, clave: str, revalidar: bool = False, validadores: dict | None = None) -> Ficha | None:
+    """
+    Con `revalidar` no se usa el TTL: siempre se consulta la página (con GET
+    condicional). Si no hay nada en la cache, se condiciona con `validadores`
+    (etag/last_modified) y un 304 devuelve None: la página no cambió.
+    """
+    entrada = cache_scrape.obtener(clave)
+    if not revalidar and cache_scrape.vigente(entrada):
+        cache_scrape.contar("aciertos")
+        return entrada["datos"]
+    cache_scrape.contar("fallos")
+
+    scraper = elegir_scraper(url)
+    if scraper is scrapear_propiedad_mercadolibre:
+        # Va a la API agrupado por el loteador, no contra el portal: sin turno de host
+        with medir("api_mercadolibre"):
+            datos = scraper(url)
+        cache_scrape.guardar(clave, datos)
+        return datos
+    extractor = EXTRACTORES_HTML.get(scraper)
+    with limitador_hosts.turno(url) as turno:
+        if extractor is None:
+            with medir("scrape"):
+                datos = scraper(url)
+            cache_scrape.guardar(clave, datos)
+            return datos
+        with medir("descarga"):
+            resp = cliente_http.get(url, headers=headers_condicionales(entrada or validadores), stream=True)
+            turno.respuesta(resp.status_code)
+            if resp.status_code == 304 and entrada is not None:
+                resp.close()
+                return cache_scrape.revalidada(clave, entrada, resp.headers)
+            if resp.status_code == 304 and validadores is not None:
+                resp.close()
+                return None
+            html = leer_html(resp, url)
+    # El turno del host se libera apenas termina la descarga; la extracción va al pool
+    with medir("extraccion"):
+        datos = pool_parseo.submit(extractor, html, url).result()
+    cache_scrape.guardar(clave, datos, resp.headers)
+    return datos
+
+
+def _etapa_publicacion(item: CrearFichaRequest, datos: Ficha, commit_unico: bool) -> tuple[dict, Future | None]:
+    with etiqueta_portal(item.url):
+        return _publicar_item_lote(item, datos, commit_unico)
+
+
+def _publicar_item_lote(item: CrearFichaRequest, datos: Ficha, commit_unico: bool) -> tuple[dict, Future | None]:
+    datos_scrape = datos
+    with medir("imagenes"):
+        if commit_unico:
+            # Las miniaturas viajan en el commit del lote, junto con la ficha que las usa
+            datos, miniaturas = procesador_imagenes.procesar(datos)
+        else:
+            datos, miniaturas = preparar_imagenes(datos), {}
+    slug = resolver_slug(item.slug, datos)
+    with medir("render"):
+        html = generar_html(datos)
+    futuro = None
+    if not commit_unico:
+        publicacion = publicar_ficha(html, slug)
+    elif ficha_sin_cambios(html, slug):
+        # La ficha ya publicada referencia estas mismas miniaturas: ya están en el repo
+        procesador_imagenes.marcar_publicados(miniaturas)
+        publicacion = {"url_ficha": url_publica_ficha(slug), "unchanged": True}
+    else:
+        futuro = publicador_git.encolar(html, slug, miniaturas)
+        futuro.add_done_callback(
+            lambda f: f.exception() is None and procesador_imagenes.marcar_publicados(miniaturas)
+        )
+        publicacion = {"url_ficha": url_publica_ficha(slug), "unchanged": False}
+    if futuro is None:
+        manifiesto_fichas.registrar(slug, item.url, datos_scrape, html)
+    else:
+        # En el manifiesto solo entra cuando el commit se confirma
+        futuro.add_done_callback(
+            lambda f: f.exception() is None and manifiesto_fichas.registrar(slug, item.url, datos_scrape, html)
+        )
+    resultado = {
+        "url": item.url,
+        "ok": True,
+        "slug": slug,
+        "url_ficha": publicacion["url_ficha"],
+        "unchanged": publicacion["unchanged"],
+        "imagenes": datos.IMAGENES,
+    }
+    return resultado, futuro
+
+
+def precargar_mercadolibre(urls: list[str]):
+    """Pide de entrada todos los ids de MercadoLibre del lote (sin cache vigente) para que el multiget vaya lleno."""
+    for url in urls:
+        if elegir_scraper(url) is not scrapear_propiedad_mercadolibre:
+            continue
+        clave = normalizar_url(url)
+        if cache_scrape.vigente(cache_scrape.obtener(clave)):
+            continue
+        try:
+            futuro = loteador_mercadolibre.pedir(id_item_mercadolibre(url))
+        except RuntimeError:
+            continue  # URL sin id: el error sale en la etapa de scrape
+        # Al resolverse queda en la cache, así la etapa de scrape no lo vuelve a pedir
+        futuro.add_done_callback(lambda f, clave=clave: _guardar_precarga_mercadolibre(clave, f))
+
+
+def _guardar_precarga_mercadolibre(clave: str, futuro: Future):
+    if futuro.exception() is None:
+        cache_scrape.guardar(clave, extraer_propiedad_mercadolibre(futuro.result()))
+
+
+def procesar_lote(items: list[CrearFichaRequest], commit_unico: bool = False) -> list[dict]:
+    """
+    Corre el scraping y la publicación como dos etapas con su propio pool:
+    cada ficha pasa a publicarse apenas termina su scrape, así un portal
+    lento no frena al resto. Con `commit_unico` las fichas se agrupan en
+    commits vía `publicador_git`. Devuelve un resultado por item, en el mismo orden.
+    """
+    resultados: list[dict | None] = [None] * len(items)
+    commits_pendientes: dict[int, Future] = {}
+    precargar_mercadolibre([item.url for item in items])
+
+    with ThreadPoolExecutor(max_workers=LOTE_WORKERS_SCRAPE) as pool_scrape, \
+            ThreadPoolExecutor(max_workers=LOTE_WORKERS_PUBLICACION) as pool_publicacion:
+        futuros_scrape = {
+            pool_scrape.submit(_etapa_scrape, item.url): i for i, item in enumerate(items)
+        }
+        futuros_publicacion = {}
+
+        for fut in as_completed(futuros_scrape):
+            i = futuros_scrape[fut]
+            try:
+                datos = fut.result()
+            except Exception as e:
+                resultados[i] = {"url": items[i].url, "ok": False, "etapa": "scrape", "error": str(e)}
+                continue
+            fut_pub = pool_publicacion.submit(_etapa_publicacion, items[i], datos, commit_unico)
+            futuros_publicacion[fut_pub] = i
+
+        for fut in as_completed(futuros_publicacion):
+            i = futuros_publicacion[fut]
+            try:
+                resultados[i], futuro_commit = fut.result()
+            except Exception as e:
+                resultados[i] = {"url": items[i].url, "ok": False, "etapa": "publicacion", "error": str(e)}
+                continue
+            if futuro_commit is not None:
+                commits_pendientes[i] = futuro_commit
+
+    if commits_pendientes:
+        publicador_git.flush()
+        for i, futuro_commit in commits_pendientes.items():
+            try:
+                futuro_commit.result()
+            except Exception as e:
+                resultados[i] = {"url": items[i].url, "ok": False, "etapa": "publicacion", "error": str(e)}
+
+    return resultados
+
+
+@app.post("/crear-fichas")
+def crear_fichas(payload: CrearFichasRequest):
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="El lote no tiene items")
+    if len(payload.items) > LOTE_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El lote supera el máximo de {LOTE_MAX_ITEMS} items",
+        )
+
+    commit_unico = payload.commit_unico
+    if commit_unico is None:
+        commit_unico = PUBLICACION_MODO == "commit"
+
+    resultados = procesar_lote(payload.items, commit_unico)
+    return {
+        "ok": all(r["ok"] for r in resultados),
+        "total": len(resultados),
+        "exitosos": sum(1 for r in resultados if r["ok"]),
+        "resultados": resultados,
+    }
+
+
+# ========= MANIFIESTO Y REFRESH INCREMENTAL =========
+
+def hash_datos(datos: Ficha) -> str:
+    return hashlib.sha256(json.dumps(datos.a_dict(), sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ManifiestoFichas:
+    """
+    Registro de cada ficha publicada: de qué URL salió, con qué scraper, el
+    hash de los `datos` extraídos, los validadores HTTP de la página y el SHA
+    del HTML subido. Es lo que permite refrescar el catálogo sin que nadie
+    vuelva a mandar las URLs. Una tabla SQLite (en memoria si no hay path).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+    def _conexion(self) -> sqlite3.Connection:
+        """Abre la base en el primer uso. Llamar con el lock."""
+        if self._db is None:
+            try:
+                self._db = sqlite3.connect(self.path or ":memory:", check_same_thread=False)
+            except sqlite3.Error:
+                logger.exception("No se pudo abrir el manifiesto en %s: se usa uno en memoria", self.path)
+                self._db = sqlite3.connect(":memory:", check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS fichas ("
+                " slug TEXT PRIMARY KEY, url TEXT NOT NULL, scraper TEXT NOT NULL, hash_datos TEXT NOT NULL,"
+                " etag TEXT, last_modified TEXT, sha TEXT, publicado REAL NOT NULL, revisado REAL NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    @staticmethod
+    def _validadores(url: str) -> tuple[str | None, str | None]:
+        entrada = cache_scrape.obtener(normalizar_url(url)) or {}
+        return entrada.get("etag"), entrada.get("last_modified")
+
+    def registrar(self, slug: str, url: str, datos: Ficha, html: str):
+        """Ficha recién publicada (o confirmada sin cambios) con estos `datos` scrapeados."""
+        etag, last_modified = self._validadores(url)
+        ahora = time.time()
+        fila = (
+            slug, url, nombre_portal(url), hash_datos(datos), etag, last_modified,
+            sha_blob_git(html.encode("utf-8")), ahora, ahora,
+        )
+        with self._lock:
+            db = self._conexion()
+            db.execute("INSERT OR REPLACE INTO fichas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", fila)
+            db.commit()
+
+    def revisada(self, slug: str, url: str):
+        """Se revisó la página y los `datos` siguen iguales: solo se renuevan los validadores."""
+        etag, last_modified = self._validadores(url)
+        with self._lock:
+            db = self._conexion()
+            db.execute(
+                "UPDATE fichas SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified),"
+                " revisado = ? WHERE slug = ?",
+                (etag, last_modified, time.time(), slug),
+            )
+            db.commit()
+
+    def listar(self, slugs: list[str] | None = None) -> list[dict]:
+        columnas = ("slug", "url", "scraper", "hash_datos", "etag", "last_modified", "sha", "publicado", "revisado")
+        consulta = f"SELECT {', '.join(columnas)} FROM fichas"
+        parametros: tuple = ()
+        if slugs is not None:
+            consulta += f" WHERE slug IN ({', '.join('?' * len(slugs))})"
+            parametros = tuple(slugs)
+        with self._lock:
+            filas = self._conexion().execute(consulta + " ORDER BY revisado", parametros).fetchall()
+        return [dict(zip(columnas, fila)) for fila in filas]
+
+    def cerrar(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+manifiesto_fichas = ManifiestoFichas(MANIFIESTO_PATH)
+
+
+def _refrescar_ficha(entrada: dict, commit_unico: bool) -> tuple[dict, Future | None]:
+    """Revalida la página de origen y republica solo si cambiaron los `datos` extraídos."""
+    url, slug = entrada["url"], entrada["slug"]
+    validadores = {"etag": entrada["etag"], "last_modified": entrada["last_modified"]}
+    with etiqueta_portal(url), medir("refresh"):
+        with medir("total_scrape"):
+            datos = _scrapear_lote(url, normalizar_url(url), revalidar=True, validadores=validadores)
+        if datos is None or hash_datos(datos) == entrada["hash_datos"]:
+            manifiesto_fichas.revisada(slug, url)
+            return {"url": url, "ok": True, "slug": slug, "estado": "sin_cambios"}, None
+        resultado, futuro = _publicar_item_lote(CrearFichaRequest(url=url, slug=slug), datos, commit_unico)
+    return {**resultado, "estado": "sin_cambios" if resultado["unchanged"] else "actualizada"}, futuro
+
+
+def refrescar_fichas(slugs: list[str] | None = None, commit_unico: bool = False) -> list[dict]:
+    """
+    Recorre el manifiesto (las menos revisadas primero) con REFRESH_WORKERS en
+    paralelo; el turno por host de `limitador_hosts` sigue valiendo.
+    """
+    entradas = manifiesto_fichas.listar(slugs)
+    resultados: list[dict | None] = [None] * len(entradas)
+    commits_pendientes: dict[int, Future] = {}
+
+    with ThreadPoolExecutor(max_workers=REFRESH_WORKERS) as pool:
+        futuros = {pool.submit(_refrescar_ficha, entrada, commit_unico): i for i, entrada in enumerate(entradas)}
+        for fut in as_completed(futuros):
+            i = futuros[fut]
+            try:
+                resultados[i], futuro_commit = fut.result()
+            except Exception as e:
+                resultados[i] = {
+                    "url": entradas[i]["url"], "ok": False, "slug": entradas[i]["slug"],
+                    "etapa": getattr(e, "etapa", "refresh"), "error": str(e),
+                }
+                continue
+            if futuro_commit is not None:
+                commits_pendientes[i] = futuro_commit
+
+    if commits_pendientes:
+        publicador_git.flush()
+        for i, futuro_commit in commits_pendientes.items():
+            try:
+                futuro_commit.result()
+            except Exception as e:
+                resultados[i] = {
+                    "url": entradas[i]["url"], "ok": False, "slug": entradas[i]["slug"],
+                    "etapa": "publicacion", "error": str(e),
+                }
+
+    return resultados
+
+
+@app.post("/refresh")
+def refresh(payload: RefreshRequest | None = None):
+    payload = payload or RefreshRequest()
+    commit_unico = payload.commit_unico
+    if commit_unico is None:
+        commit_unico = PUBLICACION_MODO == "commit"
+
+    resultados = refrescar_fichas(payload.slugs, commit_unico)
+    return {
+        "ok": all(r["ok"] for r in resultados),
+        "total": len(resultados),
+        "actualizadas": sum(1 for r in resultados if r.get("estado") == "actualizada"),
+        "sin_cambios": sum(1 for r in resultados if r.get("estado") == "sin_cambios"),
+        "errores": sum(1 for r in resultados if not r["ok"]),
+        "resultados": resultados,
+    }
+
+
+# ========= ARRANQUE: PRECALENTAMIENTO Y READINESS =========
+
+def _precargar_parsers() -> list[str]:
+    """Importa los backends de parseo configurados (también corre en los workers del pool)."""
+    nombres = {PARSER_HTML, *PARSER_HTML_POR_PORTAL.values()}
+    cargados = []
+    for nombre in sorted(nombres):
+        _, instalado, modulos = PARSERS_HTML.get(nombre, (None, False, ()))
+        if instalado:
+            for modulo in modulos:
+                importar_diferido(modulo)
+            cargados.append(nombre)
+    return cargados
+
+
+class Arranque:
+    """
+    Precalentamiento en segundo plano: cada paso paga ahora el costo de primer
+    uso (I/O de la plantilla, índice de SHAs, imports, spawn de workers, TCP+TLS)
+    que si no pagaría la primera ficha. Un paso que falla se registra y no
+    bloquea a los demás: el servicio funciona igual, solo más lento al principio.
+    """
+
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.listo = False
+        self.pasos: dict[str, float | str] = {}  # paso → segundos, o el error
+        self._tarea: asyncio.Task | None = None
+
+    def _paso(self, nombre: str, funcion, *args):
+        inicio = time.perf_counter()
+        try:
+            funcion(*args)
+        except Exception as e:
+            logger.warning("Precalentamiento '%s' falló: %s", nombre, e)
+            self.pasos[nombre] = f"error: {type(e).__name__}: {e}"
+        else:
+            self.pasos[nombre] = round(time.perf_counter() - inicio, 3)
+
+    @staticmethod
+    def _urls_conexiones() -> list[str]:
+        urls = [f"https://{host}/" for host in ARRANQUE_HOSTS]
+        urls.append(f"{MERCADOLIBRE_API_URL}/sites/MLU")
+        return urls
+
+    @staticmethod
+    def _calentar_pool_parseo():
+        futuros = [pool_parseo.submit(_precargar_parsers) for _ in range(pool_parseo.workers)]
+        for futuro in futuros:
+            futuro.result()
+
+    def _calentar_conexiones(self):
+        # /rate_limit no descuenta del límite primario y de paso deja el presupuesto al día
+        destinos = [("GET", f"{GITHUB_API_URL}/rate_limit", github_headers())]
+        destinos += [("HEAD", url, HEADERS) for url in self._urls_conexiones()]
+        for method, url, headers in destinos:
+            try:
+                cliente_http.request(method, url, headers=headers, reintentos=0, timeout=ARRANQUE_TIMEOUT).close()
+            except requests.RequestException as e:
+                logger.info("No se pudo precalentar %s: %s", url, e)
+
+    async def _calentar_conexiones_async(self):
+        inicio = time.perf_counter()
+
+        async def abrir(method: str, url: str, headers: dict):
+            try:
+                resp = await cliente_http_async.request(
+                    method, url, headers=headers, reintentos=0, timeout=ARRANQUE_TIMEOUT
+                )
+                await resp.aclose()
+            except httpx.HTTPError as e:
+                logger.info("No se pudo precalentar %s: %s", url, e)
+
+        await asyncio.gather(
+            abrir("GET", f"{GITHUB_API_URL}/rate_limit", github_headers()),
+            *(abrir("HEAD", url, HEADERS) for url in self._urls_conexiones()),
+        )
+        self.pasos["conexiones_async"] = round(time.perf_counter() - inicio, 3)
+
+    async def precalentar(self):
+        pasos = [
+            ("plantilla", plantilla_ficha._cargar),
+            ("indice_sha", indice_sha.cargar),
+            ("parsers", _precargar_parsers),
+            ("modulos", lambda: importar_diferido("slugify")),
+            ("pool_parseo", self._calentar_pool_parseo),
+            ("conexiones", self._calentar_conexiones),
+        ]
+        try:
+            await asyncio.gather(
+                *(asyncio.to_thread(self._paso, nombre, funcion) for nombre, funcion in pasos),
+                self._calentar_conexiones_async(),
+            )
+        finally:
+            self.listo = True
+            logger.info("Precalentamiento terminado en %.2fs: %s", time.monotonic() - self.inicio, self.pasos)
+
+    def iniciar(self):
+        self._tarea = asyncio.get_running_loop().create_task(self.precalentar())
+
+    async def detener(self):
+        # Los pasos que ya corren en threads terminan solos; lo que falta no se lanza
+        if self._tarea is not None and not self._tarea.done():
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+        self._tarea = None
+
+    def estado(self) -> dict:
+        return {
+            "listo": self.listo,
+            "segundos_desde_inicio": round(time.monotonic() - self.inicio, 3),
+            "indice_sha": indice_sha.cargado,
+            "pasos": dict(self.pasos),
+        }
+
+
+arranque = Arranque()
+
+
+@app.get("/ready")
+def ready():
+    estado = arranque.estado()
+    return JSONResponse(status_code=200 if estado["listo"] else 503, content=estado)
 
 
 # ========= RUN LOCAL (opcional) =========
@@ -0,0 +1,33 @@
+"""
+Los tests corren main.py contra el servidor falso de benchmarks/run.py (GitHub,
+MercadoLibre y un portal que sirve las fixtures), sin red ni caches persistentes.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+import run  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def base():
+    servidor, base = run.levantar_servidor()
+    yield base
+    servidor.shutdown()
+
+
+@pytest.fixture(scope="session")
+def main(base):
+    return run.importar_servicio(base)
+
+
+@pytest.fixture
+def github(main, monkeypatch):
+    """Repo vacío en el GitHub falso, y el servicio sin nada marcado como publicado."""
+    run.ServidorFalso.reiniciar()
+    monkeypatch.setattr(main, "indice_sha", main.IndiceSHA())
+    monkeypatch.setattr(main, "estilos_fichas", main.EstilosFichas(main.plantilla_ficha))
+    return run.ServidorFalso
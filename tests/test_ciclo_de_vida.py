@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+
+
+def test_lifespan_arranca_y_apaga_en_orden(main, monkeypatch):
+    orden = []
+    for nombre in ("loteador_mercadolibre", "pool_parseo", "procesador_imagenes", "cache_scrape", "manifiesto_fichas"):
+        objeto = getattr(main, nombre)
+        monkeypatch.setattr(objeto, "cerrar", lambda cerrar=objeto.cerrar, nombre=nombre: (orden.append(nombre), cerrar()))
+    aclose = main.cliente_http_async.aclose
+
+    async def aclose_registrado():
+        orden.append("cliente_http_async")
+        await aclose()
+
+    monkeypatch.setattr(main.cliente_http_async, "aclose", aclose_registrado)
+
+    with TestClient(main.app) as cliente:
+        assert main.cola_jobs._tareas
+        assert cliente.get("/jobs/no-existe").status_code == 404
+        assert orden == []
+
+    assert main.cola_jobs._tareas == []
+    assert main.arranque._tarea is None
+    assert orden == [
+        "loteador_mercadolibre", "pool_parseo", "procesador_imagenes",
+        "cache_scrape", "manifiesto_fichas", "cliente_http_async",
+    ]
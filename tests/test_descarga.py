@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+HTML = (
+    "<html><head><title>Casa</title>"
+    '<script type="application/ld+json">{"name": "Casa"}</script>'
+    "<style>\nbody { color: red }\n</style\n>"
+    "</head><body><h1>Casa en venta</h1>"
+    "<script>var a = '<b>';</script   >"
+    "<p>Precio USD 100.000</p>"
+    "<SCRIPT src=x.js></Script\t>"
+    "<p>Fin</p></body></html>"
+)
+
+
+def _filtrar(main, partes: list[str]) -> str:
+    filtro = main.FiltroHTML(True, [])
+    for parte in partes:
+        filtro.alimentar(parte)
+    return filtro.resultado()
+
+
+@pytest.fixture
+def esperado(main):
+    resultado = _filtrar(main, [HTML])
+    assert "var a" not in resultado and "color: red" not in resultado and "x.js" not in resultado
+    assert '{"name": "Casa"}' in resultado and "<p>Fin</p>" in resultado
+    return resultado
+
+
+def test_filtro_igual_con_cualquier_corte_en_dos(main, esperado):
+    for i in range(len(HTML) + 1):
+        assert _filtrar(main, [HTML[:i], HTML[i:]]) == esperado, i
+
+
+def test_filtro_igual_con_cortes_al_azar(main, esperado):
+    azar = random.Random(15)
+    for _ in range(500):
+        cortes = sorted(azar.sample(range(1, len(HTML)), azar.randint(2, 12)))
+        partes = [HTML[a:b] for a, b in zip([0, *cortes], [*cortes, len(HTML)])]
+        assert _filtrar(main, partes) == esperado, cortes
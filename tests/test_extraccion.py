@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+import run
+
+
+def _pagina(nodo: dict) -> str:
+    nodo = {"@context": "https://schema.org", "@type": "Apartment", "name": "Apartamento", **nodo}
+    return f'<html><head><script type="application/ld+json">{json.dumps(nodo)}</script></head></html>'
+
+
+@pytest.mark.parametrize("nodo, esperado", [
+    ({"numberOfBedrooms": 2}, "2 dormitorios"),
+    ({"numberOfRooms": 5}, "5 ambientes"),
+    ({"numberOfBedrooms": 2, "numberOfRooms": 5}, "2 dormitorios / 5 ambientes"),
+])
+def test_number_of_rooms_son_ambientes_no_dormitorios(main, nodo, esperado):
+    datos = main.extraer_datos_estructurados(_pagina(nodo), "https://inmo.example/ficha")
+    assert datos["DORMITORIOS_AMBIENTES"] == esperado
+
+
+@pytest.mark.parametrize("url, scraper", [
+    ("https://articulo.mercadolibre.com.uy/MLU-654021285-apartamento", "scrapear_propiedad_mercadolibre"),
+    ("https://apartamento.mercadolibre.com.uy/MLU654021285", "scrapear_propiedad_mercadolibre"),
+    ("https://inmueble.mercadolibre.com.uy/apartamentos/venta/pocitos", "scrapear_propiedad_generico"),
+    ("https://www.mercadolibre.com.uy/ofertas", "scrapear_propiedad_generico"),
+    ("https://www.remax.com.uy/es-uy/propiedades/123", "scrapear_propiedad_remax"),
+])
+def test_mercadolibre_sin_id_de_item_va_al_scraper_generico(main, url, scraper):
+    assert main.elegir_scraper(url) is getattr(main, scraper)
+
+
+def test_listado_de_mercadolibre_se_scrapea_como_pagina(main, monkeypatch):
+    # Sin red: la "página" del listado es una fixture; lo que importa es que no falle por no tener id
+    url = "https://inmueble.mercadolibre.com.uy/apartamentos/venta/pocitos"
+    monkeypatch.setattr(main, "descargar_html", lambda _: (run.FIXTURES / "generico.html").read_text(encoding="utf-8"))
+    datos = main.elegir_scraper(url)(url)
+    assert datos.TITULO != main.NO_ESPECIFICADO
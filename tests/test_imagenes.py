@@ -0,0 +1,18 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.mark.parametrize("tipo, descartada", [
+    ("image/jpeg", False),
+    ("image/webp", False),
+    ("application/octet-stream", False),
+    ("binary/octet-stream", False),
+    ("", False),
+    ("text/html; charset=utf-8", True),
+    ("text/plain", True),
+    ("application/json", True),
+])
+def test_solo_se_descarta_lo_que_seguro_no_es_una_imagen(main, tipo, descartada):
+    resp = SimpleNamespace(headers={"Content-Type": tipo} if tipo else {})
+    assert main.ProcesadorImagenes._no_es_imagen(resp) is descartada
@@ -0,0 +1,32 @@
+import asyncio
+
+
+def test_jobs_persisten_en_sqlite_y_se_retoman(main, tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+
+    async def primera_vida():
+        cola = main.ColaJobs(0, 10, path, retencion=3600)
+        await cola.iniciar()
+        job, nuevo = await cola.encolar("https://portal.example/ficha/1", "ficha-1", None)
+        repetido, otra_vez = await cola.encolar("https://portal.example/ficha/1", "ficha-1", None)
+        assert nuevo and not otra_vez and repetido is job
+        terminado, _ = await cola.encolar("https://portal.example/ficha/2", None, None)
+        terminado["estado"] = "ok"
+        await cola._guardar(terminado)
+        await cola.detener()
+        return job["job_id"], terminado["job_id"]
+
+    async def segunda_vida(pendiente, terminado):
+        cola = main.ColaJobs(0, 10, path, retencion=3600)
+        await cola.iniciar()
+        try:
+            assert cola.pendientes() == 1
+            assert (await cola.obtener(pendiente))["estado"] == "pendiente"
+            # el terminado no se retoma: se lee de la base
+            assert terminado not in cola._jobs
+            assert (await cola.obtener(terminado))["estado"] == "ok"
+            assert await cola.obtener("no-existe") is None
+        finally:
+            await cola.detener()
+
+    asyncio.run(segunda_vida(*asyncio.run(primera_vida())))
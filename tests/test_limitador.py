@@ -0,0 +1,127 @@
+import httpx
+import pytest
+import requests
+
+URL = "https://portal.example/ficha/1"
+HOST = "portal.example"
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(main, monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(main.time, "monotonic", reloj)
+    return reloj
+
+
+@pytest.fixture
+def limitador(main, reloj):
+    return main.LimitadorPorHost({
+        "max_concurrentes": 8,
+        "latencia_objetivo": 5.0,
+        "intervalo": 0.0,
+        "fallos_circuito": 3,
+        "enfriamiento": 30.0,
+    })
+
+
+def _error_requests(status):
+    resp = requests.Response()
+    resp.status_code = status
+    return requests.HTTPError(f"{status}", response=resp)
+
+
+def _error_httpx(status):
+    pedido = httpx.Request("GET", URL)
+    return httpx.HTTPStatusError(f"{status}", request=pedido, response=httpx.Response(status, request=pedido))
+
+
+def _pedido(limitador, reloj, status=200, error=None, demora=0.0):
+    """Un turno como el de descargar_html: informa el status y después raise_for_status()."""
+    try:
+        with limitador.turno(URL) as turno:
+            turno.respuesta(status)
+            reloj.ahora += demora
+            if error is not None:
+                raise error
+    except type(error) if error is not None else ():
+        pass
+    reloj.ahora += 10  # fuera de la ventana de una baja por vez
+
+
+def _estado(limitador):
+    return limitador.stats()[HOST]
+
+
+@pytest.mark.parametrize("status, error", [
+    (503, _error_requests(503)),
+    (429, _error_httpx(429)),
+    (200, _error_requests(500)),  # un scraper que no informa el status: cuenta el del error
+    (200, _error_httpx(502)),
+    (200, requests.ConnectionError("caído")),
+])
+def test_429_5xx_y_errores_de_red_parten_el_limite(main, limitador, reloj, status, error):
+    _pedido(limitador, reloj, status, error)
+    assert _estado(limitador)["limite"] == 4
+    assert _estado(limitador)["fallos_seguidos"] == 1
+
+
+@pytest.mark.parametrize("error", [_error_requests(404), _error_httpx(410), ValueError("parser")])
+def test_errores_que_no_son_del_portal_no_cuentan(main, limitador, reloj, error):
+    _pedido(limitador, reloj, 404 if not isinstance(error, ValueError) else 200, error)
+    assert _estado(limitador)["limite"] == 8
+    assert _estado(limitador)["fallos_seguidos"] == 0
+
+
+def test_aimd_baja_a_la_mitad_y_sube_de_a_poco(main, limitador, reloj):
+    _pedido(limitador, reloj, 503, _error_requests(503))
+    _pedido(limitador, reloj, 503, _error_requests(503))
+    assert _estado(limitador)["limite"] == 2
+    _pedido(limitador, reloj)
+    assert _estado(limitador)["limite"] == 2.5
+    assert _estado(limitador)["fallos_seguidos"] == 0
+    # una respuesta más lenta que la latencia objetivo también es señal de baja
+    _pedido(limitador, reloj, demora=6.0)
+    assert _estado(limitador)["limite"] == 1.25
+    for _ in range(50):
+        _pedido(limitador, reloj)
+    assert _estado(limitador)["limite"] == 8
+
+
+def test_circuito_abierto_semiabierto_cerrado(main, limitador, reloj):
+    for _ in range(3):
+        _pedido(limitador, reloj, 503, _error_httpx(503))
+    assert _estado(limitador)["circuito"] == "abierto"
+    with pytest.raises(main.PortalNoDisponible):
+        with limitador.turno(URL):
+            pass
+
+    reloj.ahora += 30
+    assert _estado(limitador)["circuito"] == "semiabierto"
+    with limitador.turno(URL) as sonda:
+        # mientras la sonda está en curso no pasa nadie más
+        with pytest.raises(main.PortalNoDisponible):
+            with limitador.turno(URL):
+                pass
+        sonda.respuesta(200)
+    assert _estado(limitador)["circuito"] == "cerrado"
+    assert _estado(limitador)["rechazados"] == 2
+    _pedido(limitador, reloj)
+
+
+def test_sonda_fallida_vuelve_a_abrir_el_circuito(main, limitador, reloj):
+    for _ in range(3):
+        _pedido(limitador, reloj, 500, _error_requests(500))
+    reloj.ahora += 30
+    _pedido(limitador, reloj, 500, _error_requests(500))
+    assert _estado(limitador)["circuito"] == "abierto"
+    with pytest.raises(main.PortalNoDisponible):
+        with limitador.turno(URL):
+            pass
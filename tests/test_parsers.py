@@ -0,0 +1,25 @@
+"""Los backends de parseo son intercambiables: cada extractor da la misma Ficha con cualquiera."""
+
+import pytest
+
+import run
+
+
+def _extraer(main, fixture: str):
+    url, extractor = run.FIXTURES_HTML[fixture]
+    html = (run.FIXTURES / f"{fixture}.html").read_text(encoding="utf-8")
+    return getattr(main, extractor)(html, url)
+
+
+@pytest.mark.parametrize("fixture", sorted(run.FIXTURES_HTML))
+@pytest.mark.parametrize("parser", ["lxml", "selectolax"])
+def test_misma_ficha_con_cada_backend(main, monkeypatch, parser, fixture):
+    assert set(main.PARSERS_HTML) == {"html.parser", "lxml", "selectolax"}  # si se agrega uno, va acá
+    if not main.PARSERS_HTML[parser][1]:
+        pytest.skip(f"{parser} no está instalado")
+    monkeypatch.setattr(main, "PARSER_HTML_POR_PORTAL", {})
+    monkeypatch.setattr(main, "PARSER_HTML", "html.parser")
+    referencia = _extraer(main, fixture)
+
+    monkeypatch.setattr(main, "PARSER_HTML", parser)
+    assert _extraer(main, fixture) == referencia
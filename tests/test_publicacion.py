@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def _con_carrera(main, github, monkeypatch, veces: int):
+    """Antes de cada uno de los primeros `veces` PATCH de la rama, otro proceso la mueve."""
+    patch = main.cliente_http.patch
+    pendientes = iter(range(veces))
+
+    def patch_con_carrera(*args, **kwargs):
+        n = next(pendientes, None)
+        if n is not None:
+            github.commit_ajeno(f"otros/{n}.txt", b"ajeno")
+        return patch(*args, **kwargs)
+
+    monkeypatch.setattr(main.cliente_http, "patch", patch_con_carrera)
+
+
+def test_lote_commit_unico_mueve_la_rama_una_sola_vez(main, base, github):
+    items = [main.CrearFichaRequest(url=f"{base}/portal/generico?n={i}", slug=f"lote-{i}") for i in range(8)]
+
+    resultados = main.procesar_lote(items, commit_unico=True)
+
+    assert [r["ok"] for r in resultados] == [True] * 8
+    assert github.actualizaciones_rama == 1
+    assert {f"fichas/lote-{i}.html" for i in range(8)} <= set(github.arbol_actual())
+
+
+def test_commit_se_rearma_si_la_rama_avanzo(main, github, monkeypatch):
+    _con_carrera(main, github, monkeypatch, veces=3)
+
+    futuro = main.publicador_git.encolar("<p>carrera</p>", "carrera")
+    main.publicador_git.flush()
+
+    assert futuro.result() == main.url_publica_ficha("carrera")
+    assert github.actualizaciones_rama == 1
+    arbol = github.arbol_actual()
+    assert "fichas/carrera.html" in arbol
+    assert len([ruta for ruta in arbol if ruta.startswith("otros/")]) == 3  # no pisa los commits ajenos
+
+
+def test_commit_falla_si_la_rama_sigue_moviendose(main, github, monkeypatch):
+    _con_carrera(main, github, monkeypatch, veces=main.publicador_git.reintentos_rama + 1)
+
+    futuro = main.publicador_git.encolar("<p>carrera</p>", "carrera")
+    main.publicador_git.flush()
+
+    with pytest.raises(RuntimeError, match="422"):
+        futuro.result()
+    assert github.actualizaciones_rama == 0
+
+
+def test_lote_commit_unico_incluye_las_miniaturas_en_el_mismo_commit(main, base, github, monkeypatch):
+    numeros = iter(range(100))
+
+    def procesar(datos):
+        nombre = f"miniatura{next(numeros)}-480.webp"
+        url = datos.IMAGENES[0]
+        datos = main.replace(datos, IMAGENES=[url], MINIATURAS={url: [(nombre, 480, 320)]})
+        return datos, {f"fichas/img/{nombre}": b"RIFF-webp"}
+
+    monkeypatch.setattr(main.procesador_imagenes, "procesar", procesar)
+    items = [main.CrearFichaRequest(url=f"{base}/portal/generico?n={i}", slug=f"mini-{i}") for i in range(8)]
+
+    resultados = main.procesar_lote(items, commit_unico=True)
+
+    assert [r["ok"] for r in resultados] == [True] * 8
+    assert github.actualizaciones_rama == 1
+    arbol = github.arbol_actual()
+    assert {f"fichas/mini-{i}.html" for i in range(8)} <= set(arbol)
+    assert len([ruta for ruta in arbol if ruta.startswith("fichas/img/")]) == 8
+
+
+def test_hoja_de_estilos_se_publica_una_vez_con_publicadores_simultaneos(main, github):
+    html = main.generar_html(main.Ficha(TITULO="Estilos"))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        publicaciones = list(pool.map(lambda i: main.publicar_ficha(html, f"estilos-{i}"), range(8)))
+
+    assert not any(p["unchanged"] for p in publicaciones)
+    assert github.actualizaciones_rama == 1  # solo la hoja va por la Git Data API
+    ruta, _ = main.plantilla_ficha.hoja_estilos()
+    assert ruta in github.arbol_actual()
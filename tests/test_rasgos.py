@@ -0,0 +1,62 @@
+import random
+import re
+
+import pytest
+
+NO = "No especificado"
+
+
+def _buscar(regex, texto, formato="{}"):
+    m = re.search(regex, texto)
+    return formato.format(m.group(1).strip()) if m else NO
+
+
+# Las regex que usaban los scrapers antes del escaneo único
+def _referencia(texto):
+    banio = re.search(r"(\d+(?:[.,]\d+)?)\s*bañ[o|os]", texto)
+    return {
+        "superficie": _buscar(r"(\d{2,4})\s*(m²|m2|m\.2)", texto, "{} m² (aprox.)"),
+        "dormitorios": _buscar(r"(\d+)\s+dormitorio[s]?", texto, "{} dormitorios"),
+        "banios": f"{banio.group(1).replace(',', '.')} baños" if banio else NO,
+        "c21_superficie": _buscar(r"(\d+[.,]?\d*)\s*m²", texto),
+        "c21_dormitorios": _buscar(r"(\d+)\s*dormitorio", texto),
+        "c21_banios": _buscar(r"(\d+)\s*bañ", texto),
+    }
+
+
+def _escaneo(main, texto):
+    rasgos = main.escanear_rasgos(texto)
+    dormitorios = main.rasgo_dormitorios(rasgos)
+    return {
+        "superficie": main.rasgo_superficie(rasgos),
+        "dormitorios": NO if dormitorios == "Monoambiente" else dormitorios,
+        "banios": main.rasgo_banios(rasgos),
+        "c21_superficie": main.rasgo_superficie_m2(rasgos),
+        "c21_dormitorios": main._primer_numero(rasgos, "dormitorios") or NO,
+        "c21_banios": main._primer_numero(rasgos, "banios") or NO,
+    }
+
+
+@pytest.mark.parametrize("texto", [
+    "apartamento de 120 m² con 2 dormitorios y 1 baño",
+    "120.m²",
+    "120,m²",
+    "120, m²",
+    "1.200.m²",
+    "5,1.200.m² y 80 m²",
+    "2.5.m2 3 dormitorios 2,5,baños 1,5 baños",
+    "1.200 m2, 2.dormitorios, 3dormitorios, 4 dormitorios",
+    "75m.2 y 90 m²; 2 bañ",
+    "12345 m² 1 m² 2,5 m²",
+])
+def test_escaneo_unico_igual_a_las_regex_originales(main, texto):
+    assert _escaneo(main, texto) == _referencia(texto)
+
+
+def test_escaneo_unico_igual_a_las_regex_originales_fuzz(main):
+    piezas = ["1", "12", "120", "1.200", "2,5", ".", ",", " ", "  ", "m²", "m2", "m.2",
+              "dormitorio", "dormitorios", "baño", "baños", "bañ", "cochera", "x"]
+    azar = random.Random(9)
+    for _ in range(3000):
+        texto = "".join(azar.choice(piezas) for _ in range(azar.randint(1, 8)))
+        assert _escaneo(main, texto) == _referencia(texto), texto